@@ -0,0 +1,86 @@
+from pathlib import Path
+import numpy as np
+import json
+
+ROOT_DIR = Path(__file__).parent
+
+ATLAS_VERSION = 1
+ATLAS_TILES_PER_ROW = 16
+ATLAS_SCALE = 2             # 64x64 tiles, the ones which can be injected
+
+
+def get_atlas_paths(level, root_dir=ROOT_DIR, scale=ATLAS_SCALE):
+    """(.bmp path, .json index path) of the atlas of a level."""
+    name = f"{level}_atlas" if scale == ATLAS_SCALE else f"{level}_atlas_x{scale}"
+    return ( root_dir / level / f"{name}.bmp", root_dir / level / f"{name}.json" )
+
+def build_atlas(tiles, tiles_per_row=ATLAS_TILES_PER_ROW):
+    """Put (n, size, size) tiles side by side, tiles_per_row tiles per row, in tile order."""
+    num_tiles, tile_size, _ = tiles.shape
+    num_rows = -(-num_tiles // tiles_per_row)
+
+    grid = np.zeros((num_rows*tiles_per_row, tile_size, tile_size), dtype=tiles.dtype)
+    grid[:num_tiles] = tiles
+    # [row, tile in row, y, x] -> [row, y, tile in row, x]
+    return grid.reshape(num_rows, tiles_per_row, tile_size, tile_size).swapaxes(1, 2).reshape(
+                num_rows*tile_size, tiles_per_row*tile_size)
+
+def split_atlas(atlas, num_tiles, tile_size, tiles_per_row=ATLAS_TILES_PER_ROW):
+    """The (num_tiles, tile_size, tile_size) tiles of an atlas made by build_atlas."""
+    num_rows = atlas.shape[0] // tile_size
+    if atlas.shape != (num_rows*tile_size, tiles_per_row*tile_size) or num_rows*tiles_per_row < num_tiles:
+        raise ValueError(f"atlas of {atlas.shape[1]}x{atlas.shape[0]} pixels can't hold "
+                         f"{num_tiles} tiles of {tile_size}x{tile_size}, {tiles_per_row} per row")
+
+    grid = atlas.reshape(num_rows, tile_size, tiles_per_row, tile_size).swapaxes(1, 2)
+    return grid.reshape(-1, tile_size, tile_size)[:num_tiles]
+
+def get_atlas_index(level, tile_size, palettes, tile_palettes, tiles_per_row=ATLAS_TILES_PER_ROW):
+    return dict(version = ATLAS_VERSION,
+                level = level,
+                tile_size = tile_size,
+                tiles_per_row = tiles_per_row,
+                num_tiles = len(tile_palettes),
+                palettes = [ [list(colour) for colour in palette] for palette in palettes ],
+                tiles = [ dict(index = tile_idx,
+                               x = (tile_idx % tiles_per_row)*tile_size,
+                               y = (tile_idx // tiles_per_row)*tile_size,
+                               palette = palette_idx)
+                          for tile_idx, palette_idx in enumerate(tile_palettes) ])
+
+def write_atlas(level, tiles, palettes, tile_palettes, root_dir=ROOT_DIR, scale=ATLAS_SCALE):
+    """Write the tiles of a level, as 8 bits indices, into one .bmp file and its .json index.
+
+    A .bmp file holds a single palette, so the atlas shows the palette of the first tile;
+    the index gives the palette of every tile and all the palettes."""
+    from PIL import Image
+
+    atlas_path, index_path = get_atlas_paths(level, root_dir, scale)
+
+    atlas_bmp = Image.fromarray(build_atlas(tiles), 'P')
+    atlas_bmp.putpalette([channel for colour in palettes[tile_palettes[0]] for channel in colour])
+    atlas_bmp.save(atlas_path)
+
+    with open(index_path, 'w') as file:
+        json.dump(get_atlas_index(level, tiles.shape[1], palettes, tile_palettes), file)
+
+    return ( atlas_path, index_path )
+
+def read_atlas(level, root_dir=ROOT_DIR, scale=ATLAS_SCALE):
+    """(tiles, index) of the atlas of a level. Raises FileNotFoundError or ValueError."""
+    from PIL import Image
+
+    atlas_path, index_path = get_atlas_paths(level, root_dir, scale)
+
+    with open(index_path, 'r') as file:
+        index = json.load(file)
+    if index.get("version") != ATLAS_VERSION:
+        raise ValueError(f"{index_path} was written by another version")
+
+    with Image.open(atlas_path) as atlas_bmp:
+        if atlas_bmp.mode != 'P':
+            raise ValueError(f"{atlas_path} is not an 8 bits indexed image")
+        atlas = np.asarray(atlas_bmp)
+
+    tiles = split_atlas(atlas, index["num_tiles"], index["tile_size"], index["tiles_per_row"])
+    return ( tiles, index )
@@ -0,0 +1,143 @@
+from pathlib import Path
+from psx_palette_packer import create_8bits_palettes, PACKING_MODES, DEFAULT_PACKING
+from psx_create_tiles import load_level_colours, create_level_tiles
+from psx_sty_reader import open_psx_sty
+from psx_sty_injector import get_level_palettes, read_target_chunks, read_level_tiles, patch_sty_copy, rebuild_sty_file
+from psx_jobs import run_jobs
+from psx_metrics import stage, add_metrics_arguments, run_with_metrics
+import argparse
+import json
+import sys
+import os
+
+PROGRAM_NAME = os.path.basename(sys.argv[0])
+
+LEVELS = ["bil", "ste", "wil"]
+
+
+def read_batch_manifest(manifest_path):
+    """[(sty path, level, output path)] of a .json manifest holding a list of
+    {"sty": ..., "level": ..., "output": ...} jobs. Relative paths start at the manifest folder."""
+    try:
+        with open(manifest_path, 'r') as file:
+            entries = json.load(file)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: can't read batch manifest {manifest_path}: {e}")
+        sys.exit(-1)
+
+    if not isinstance(entries, list):
+        print("ERROR: the batch manifest must be a list of jobs")
+        sys.exit(-1)
+
+    base_dir = Path(manifest_path).parent
+    targets = []
+    for job_idx, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not {"sty", "level", "output"} <= entry.keys():
+            print(f"ERROR: job {job_idx} of the batch manifest needs sty, level and output")
+            sys.exit(-1)
+
+        level = str(entry["level"]).lower()
+        if level not in LEVELS:
+            print(f"ERROR: job {job_idx}: invalid level {entry['level']}. Level can be: bil, ste or wil")
+            sys.exit(-1)
+
+        sty_path = base_dir / entry["sty"]
+        output_path = base_dir / entry["output"]
+        if not sty_path.exists():
+            print(f"ERROR: job {job_idx}: file not found: {sty_path}")
+            sys.exit(-1)
+        if output_path.resolve() == sty_path.resolve():
+            print(f"ERROR: job {job_idx}: output would overwrite {sty_path}")
+            sys.exit(-1)
+
+        targets.append( (sty_path, level, output_path) )
+
+    outputs = [output_path.resolve() for _, _, output_path in targets]
+    if len(set(outputs)) != len(outputs):
+        print("ERROR: several jobs of the batch manifest write the same output")
+        sys.exit(-1)
+
+    return targets
+
+def prepare_level(level, packing=None, tile_source="bmp", jobs=1, psx_dir=None):
+    """(palettes, tile_palettes, tiles) of a level, shared by all the targets of the level.
+    With psx_dir, binaries are read from the original .STY file of the level in that folder."""
+    if tile_source != "binaries":
+        palettes, tile_palettes = get_level_palettes(level, packing, tile_source)
+        tiles = read_level_tiles(level, palettes, tile_palettes, tile_source, jobs)
+        return ( palettes, tile_palettes, tiles )
+
+    with open_psx_sty(level, psx_dir) as psx_sty:
+        all_level_colours = load_level_colours(level, psx_sty=psx_sty)
+
+        print(f"Creating palette for level {level.upper()}")
+        with stage("pack_palettes", level):
+            palettes, tile_palettes, remap_tables = create_8bits_palettes(all_level_colours, packing or DEFAULT_PACKING)
+
+        with stage("decode_tiles", level):
+            tiles = create_level_tiles(level, remap_tables, jobs, psx_sty=psx_sty)
+
+    return ( palettes, tile_palettes, tiles )
+
+def inject_target(sty_path, level, output_path, palettes, tile_palettes, tiles, rebuild=False):
+    print(f"{level.upper()}: {sty_path} -> {output_path}")
+    chunk_infos = read_target_chunks(sty_path)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if rebuild:
+        rebuild_sty_file(sty_path, output_path, palettes, tile_palettes, tiles)
+    else:
+        patch_sty_copy(sty_path, output_path, chunk_infos, palettes, tile_palettes, tiles)
+    print("")
+
+def inject_batch(targets, packing=None, tile_source="bmp", jobs=1, rebuild=False, psx_dir=None):
+    # each level is packed and decoded once, whatever the number of targets using it
+    levels = sorted({level for _, level, _ in targets}, key=LEVELS.index)
+    level_data = { level: prepare_level(level, packing, tile_source, jobs, psx_dir) for level in levels }
+    print("")
+
+    work_units = [ (sty_path, level, output_path, *level_data[level], rebuild) for sty_path, level, output_path in targets ]
+    run_jobs(inject_target, work_units, jobs)
+
+    print(f"All PSX tiles injected into {len(targets)} .sty files")
+
+
+def add_arguments(parser):
+    parser.add_argument("manifest", help=".json list of {\"sty\", \"level\", \"output\"} jobs")
+    parser.add_argument("--packing", choices=PACKING_MODES,
+                        help="packing used to create the tiles, read from the palette plans by default. "
+                             f"With --from-binaries, {DEFAULT_PACKING} by default")
+    tile_sources = parser.add_mutually_exclusive_group()
+    tile_sources.add_argument("--from-binaries", dest="tile_source", action="store_const", const="binaries", default="bmp",
+                              help="decode the tiles from the PSX binary files instead of reading the .bmp tiles")
+    tile_sources.add_argument("--atlas", dest="tile_source", action="store_const", const="atlas",
+                              help="read the tiles from the atlas of each level instead of a .bmp per tile")
+    tile_sources.add_argument("--raw", dest="tile_source", action="store_const", const="raw",
+                              help="copy the tiles from the raw tiles file of each level")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of processes patching targets, 0 uses all cores")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="write each target in one pass, growing PPAL and TILE when needed, "
+                             "instead of copying then patching it")
+    parser.add_argument("--psx-dir",
+                        help="with --from-binaries, read the levels from the original BIL.STY, STE.STY and WIL.STY "
+                             "in this folder instead of the .data files, once located with psx_tool.py locate")
+    add_metrics_arguments(parser)
+
+def run(args):
+    if args.psx_dir is not None and args.tile_source != "binaries":
+        print("ERROR: --psx-dir needs --from-binaries")
+        sys.exit(-1)
+
+    targets = read_batch_manifest(args.manifest)
+    run_with_metrics(args, "psx_batch_injector", inject_batch, targets, args.packing, args.tile_source, args.jobs,
+                     args.rebuild, args.psx_dir)
+
+def main():
+    parser = argparse.ArgumentParser(PROGRAM_NAME)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
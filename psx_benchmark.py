@@ -0,0 +1,173 @@
+from pathlib import Path
+from psx_decoder import read_page_indices, PAGE_SIZE, TILES_PER_PAGE, COLOURS_PER_TILE
+from psx_palette_packer import create_8bits_palettes
+from psx_create_tiles import load_level_colours, write_all_tiles_from_level, NUM_PAGES, TOTAL_NUM_TILES
+from psx_sty_injector import change_palettes_idx, change_physical_palettes, inject_tile_data, read_tile_bmps
+from sty_file import map_sty_file, read_chunk_table, get_chunk_infos, PALETTE_PAGE_SIZE, TILE_GROUP_SIZE
+import contextlib
+import statistics
+import tempfile
+import platform
+import argparse
+import random
+import shutil
+import json
+import time
+import sys
+import os
+
+PROGRAM_NAME = os.path.basename(sys.argv[0])
+
+BENCHMARK_VERSION = 1
+BENCH_LEVEL = "bench"
+COLOUR_POOL_SIZE = 600      # distinct colours of the synthetic level, so tiles share colours like real ones
+MIN_REGRESSION_DELTA = 0.001   # seconds, smaller slowdowns are timer noise
+
+
+#### synthetic inputs
+
+def write_synthetic_level(root_dir, level=BENCH_LEVEL, seed=0):
+    """Write b_tiles and b_palettes files of a level filled with deterministic random data."""
+    rng = random.Random(seed)
+    colour_pool = [rng.getrandbits(16) for _ in range(COLOUR_POOL_SIZE)]
+
+    for folder in ("b_tiles", "b_palettes", "all_tiles"):
+        (root_dir / level / folder).mkdir(parents=True, exist_ok=True)
+
+    for page in range(NUM_PAGES):
+        with open(root_dir / level / "b_tiles" / f"{level}_{page+1}.data", 'wb') as file:
+            file.write(rng.randbytes(PAGE_SIZE))
+
+        # 16 colours of 2 bytes per tile
+        palette_data = bytearray()
+        for _ in range(TILES_PER_PAGE*COLOURS_PER_TILE):
+            palette_data += rng.choice(colour_pool).to_bytes(2, 'little')
+        with open(root_dir / level / "b_palettes" / f"{level}_{page+1}_palettes.data", 'wb') as file:
+            file.write(palette_data)
+
+def write_synthetic_sty(sty_path, num_tiles=TOTAL_NUM_TILES, seed=0):
+    """Write a minimal GBST file with PALX, PPAL and TILE chunks, plus a sprite chunk to skip over."""
+    rng = random.Random(seed)
+    chunks = [ ("PALX", rng.randbytes(2*16384)),
+               ("PPAL", rng.randbytes(PALETTE_PAGE_SIZE)),
+               ("TILE", rng.randbytes(-(-num_tiles // 4)*TILE_GROUP_SIZE)),
+               ("SPRG", rng.randbytes(256*1024)) ]
+
+    with open(sty_path, 'wb') as file:
+        file.write(b"GBST")
+        file.write((700).to_bytes(2, 'little'))
+        for name, data in chunks:
+            file.write(name.encode('ascii'))
+            file.write(len(data).to_bytes(4, 'little'))
+            file.write(data)
+
+
+#### stages
+
+def time_stage(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(None):
+            result = function()
+        timings.append(time.perf_counter() - start)
+    return ( result, dict(min = min(timings), median = statistics.median(timings)) )
+
+def run_benchmarks(work_dir, repeat):
+    write_synthetic_level(work_dir)
+    sty_path = work_dir / "bench.sty"
+    write_synthetic_sty(sty_path)
+
+    level_dir = work_dir / BENCH_LEVEL
+    stages = {}
+
+    all_level_colours, stages["palette_load"] = time_stage(lambda: load_level_colours(BENCH_LEVEL, work_dir), repeat)
+
+    def page_decode():
+        return [read_page_indices(level_dir / "b_tiles" / f"{BENCH_LEVEL}_{page+1}.data") for page in range(NUM_PAGES)]
+    _, stages["page_decode"] = time_stage(page_decode, repeat)
+
+    (palettes, tile_palettes, remap_tables), stages["create_8bits_palettes"] = time_stage(
+        lambda: create_8bits_palettes(all_level_colours, "first_fit"), repeat)
+    _, stages["create_8bits_palettes_grouped"] = time_stage(
+        lambda: create_8bits_palettes(all_level_colours, "grouped"), repeat)
+
+    _, stages["tile_write"] = time_stage(
+        lambda: write_all_tiles_from_level(BENCH_LEVEL, palettes, tile_palettes, remap_tables, root_dir=work_dir), repeat)
+
+    def chunk_scan():
+        with map_sty_file(sty_path) as sty_data:
+            return get_chunk_infos(read_chunk_table(sty_data))
+    chunk_infos, stages["chunk_scan"] = time_stage(chunk_scan, repeat)
+
+    tiles, stages["tile_read"] = time_stage(lambda: read_tile_bmps(BENCH_LEVEL, palettes, tile_palettes, root_dir=work_dir), repeat)
+
+    def injection():
+        output_path = work_dir / "bench_edited.sty"
+        shutil.copyfile(sty_path, output_path)
+        with map_sty_file(output_path, writable=True) as sty_data:
+            change_palettes_idx(sty_data, chunk_infos, tile_palettes)
+            change_physical_palettes(sty_data, chunk_infos, palettes)
+            inject_tile_data(sty_data, chunk_infos, tiles)
+            sty_data.flush()
+    _, stages["injection"] = time_stage(injection, repeat)
+
+    return stages
+
+
+#### reports
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Print each stage against the baseline. Returns the stages which got slower than the tolerance."""
+    regressions = []
+    for stage, timings in results["stages"].items():
+        if stage not in baseline["stages"]:
+            print(f"{stage:32} {timings['min']*1000:9.2f} ms   (not in baseline)")
+            continue
+
+        baseline_min = baseline["stages"][stage]["min"]
+        ratio = timings["min"] / baseline_min
+        slower = ratio > 1 + tolerance and timings["min"] - baseline_min > MIN_REGRESSION_DELTA
+        if slower:
+            regressions.append(stage)
+
+        print(f"{stage:32} {timings['min']*1000:9.2f} ms   baseline {baseline_min*1000:9.2f} ms"
+              f"   x{ratio:.2f}{'   REGRESSION' if slower else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(PROGRAM_NAME)
+    parser.add_argument("--repeat", type=int, default=10, help="runs of each stage, the fastest one is kept")
+    parser.add_argument("--output", help="write the results to this .json file")
+    parser.add_argument("--baseline", help="compare with results saved by a previous --output")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown against the baseline, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        stages = run_benchmarks(Path(work_dir), args.repeat)
+
+    results = dict(version = BENCHMARK_VERSION,
+                   python = platform.python_version(),
+                   platform = platform.platform(),
+                   repeat = args.repeat,
+                   stages = stages)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nSlower than baseline: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+from pathlib import Path
+import hashlib
+import json
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+
+def hash_bytes(data):
+    return hashlib.sha1(data).hexdigest()
+
+def hash_file(path):
+    with open(path, 'rb') as file:
+        return hash_bytes(file.read())
+
+def hash_palette(palette):
+    return hash_bytes(bytes(channel for colour in palette for channel in colour))
+
+def get_tile_fingerprints(packed_tiles, palettes, tile_palettes, remap_tables):
+    """Fingerprint of every output tile: it changes whenever the tile pixels, the palette
+    the tile is written with or the slots of its colours in that palette change."""
+    palette_hashes = [hash_palette(palette) for palette in palettes]
+
+    fingerprints = []
+    for tile_idx, palette_idx in enumerate(tile_palettes):
+        key = "{}:{}:{}".format(hash_bytes(packed_tiles[tile_idx]),
+                                bytes(remap_tables[tile_idx]).hex(),
+                                palette_hashes[palette_idx])
+        fingerprints.append(hash_bytes(key.encode('ascii')))
+    return fingerprints
+
+def load_manifest(manifest_path):
+    """Manifest of the last build, or None if it is missing or was written by another version."""
+    try:
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+def save_manifest(manifest_path, inputs, parameters, tile_palettes, fingerprints):
+    manifest = dict(version = MANIFEST_VERSION,
+                    inputs = inputs,                # file name -> hash
+                    parameters = parameters,        # packing, colour expansion...
+                    tile_palettes = list(tile_palettes),
+                    tiles = fingerprints)
+
+    # write then rename, so an interrupted build never leaves a manifest newer than the tiles
+    tmp_path = Path(str(manifest_path) + ".tmp")
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file, indent=1)
+    tmp_path.replace(manifest_path)
+
+def get_changed_tiles(manifest, parameters, fingerprints, out_paths):
+    """Indices of the tiles which must be written again."""
+    if manifest is None or manifest["parameters"] != parameters or len(manifest["tiles"]) != len(fingerprints):
+        return list(range(len(fingerprints)))
+
+    return [ tile_idx for tile_idx, fingerprint in enumerate(fingerprints)
+             if manifest["tiles"][tile_idx] != fingerprint or not out_paths[tile_idx].exists() ]
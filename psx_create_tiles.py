@@ -1,7 +1,25 @@
-from PIL import Image
+import numpy as np
 from pathlib import Path
+from psx_decoder import read_page_data, read_page_indices, get_packed_tiles, get_tile_indices, upscale, parse_scale
+from psx_palettes import load_rgb_palettes, palettes_to_tuples, DEFAULT_EXPANSION
+from psx_jobs import run_jobs, run_overlapped
+from psx_atlas import write_atlas
+from psx_raw_tiles import write_raw_tiles
+from psx_palette_plan import get_palette_source_hashes, write_palette_plan
+from psx_metrics import stage, run_in_stage, overlapped_stages, add_metrics_arguments, run_with_metrics
+from psx_build_cache import (hash_bytes, hash_file, get_tile_fingerprints, load_manifest, save_manifest, get_changed_tiles,
+                             MANIFEST_NAME)
+from psx_palette_packer import (create_8bits_palettes, print_all_palettes_used, get_packing_stats,
+                                print_packing_stats, PACKING_MODES, DEFAULT_PACKING)
+from psx_tile_index import get_level_tile_keys, get_duplicate_map
+from psx_sty_reader import open_psx_sty
+import contextlib
+import argparse
+import shutil
 import sys
+import os
 
+PROGRAM_NAME = os.path.basename(sys.argv[0])
 ROOT_DIR = Path(__file__).parent
 
 LEVELS = ["bil", "ste", "wil"]
@@ -13,17 +31,10 @@ PAGE_WIDTH = 256
 PAGE_HEIGHT = 256
 NUM_PAGES = 6
 
-COLOURS_PER_TILE = 16
-NUM_COLOURS_PER_PALETTE = 256
-PAD_COLOUR = (0, 0, 0)
-
 TOTAL_NUM_TILES = 384
 TILES_PER_PAGE = 64
 
-def two_nibble_from_byte(byte):
-    upper_nibble = byte // 16
-    lower_nibble = byte % 16
-    return (upper_nibble, lower_nibble)
+TILE_SCALE = 2              # tiles of .sty files are 64x64
 
 def ajust_palette(palette):
     new_palette = []
@@ -33,235 +44,346 @@ def ajust_palette(palette):
         new_palette.append(colour[2])   # b
     return new_palette
 
-def colours_from_binary(b_pal_path):
-    with open(b_pal_path, 'rb') as file:
-        palette = []
-
-        # get palette length
-        file.read()
-        eof = file.tell()
-
-        file.seek(0)
-        offset = 0
-
-        tile_palette = []
-        while (offset < eof):
-            tile_palette.append( int.from_bytes(file.read(2), 'little')  )
-            offset += 2
-            # has tile palette ended? 
-            # store its palette and start read another tile palette
-            if (offset % 32 == 0):
-                palette.append(tile_palette)
-                tile_palette = []
-    return palette
+def load_level_colours(level, root_dir=ROOT_DIR, psx_sty=None):
+    """16 colour palettes of all tiles of a level, as lists of (r,g,b) tuples.
+    With psx_sty, they are read from the original .STY file of the level opened by open_psx_sty."""
+    all_level_colours = []
+    with stage("load_colours", level):
+        for page in range(NUM_PAGES):   #  page + 1
+            if psx_sty is not None:
+                print(f"Getting colours from file: {psx_sty.path}, page {page+1}")
+                all_level_colours += palettes_to_tuples(psx_sty.load_rgb_palettes(page))
+                continue
+
+            binary_pal_path = root_dir / level / "b_palettes" / f"{level}_{page+1}_palettes.data"
+            if binary_pal_path.exists():
 
-def pull_colours(word):
-    # remove leading 1 if it exists
-    if (word >= 32768):
-        word -= 32768
+                print("Getting colours from file: " + str(binary_pal_path))
+                rgb_colours = load_rgb_palettes(binary_pal_path)
+                all_level_colours += palettes_to_tuples(rgb_colours)
+            else:
+                print("Palette binary files not found")
+                sys.exit(-1)
+    return all_level_colours
 
-    r = (word % 32)*255 // 32
+def read_tile_page(level, page, root_dir=ROOT_DIR, psx_sty=None):
+    if psx_sty is not None:
+        return psx_sty.read_page_indices(page)
 
-    word = word >> 5
-    g = (word % 32)*255 // 32
+    b_tile_path = root_dir / level / "b_tiles" / f"{level}_{page+1}.data"
 
-    word = word >> 5
-    b = (word*255) // 32
-    
-    return (r, g, b)
-
-def convert_colours_from_15_bits(binary_colours):
-    colours = []
-    for tile_pal_idx in range(len(binary_colours)): # 0 to 63
-        tile_colours = []
-        for colour in range(len(binary_colours[tile_pal_idx])): # 0 to 15
-            tile_colours.append( pull_colours(binary_colours[tile_pal_idx][colour]) )
-        colours.append(tile_colours)
-    return colours
-
-def verify_slots(palette_chunk, rgb_array):
-    if (len(rgb_array) != 16):
-        print(f"Error: rgb array size is not {COLOURS_PER_TILE}")
+    if not b_tile_path.exists():
+        print("Tile binary file not found.")
+        print("File: " + str(b_tile_path))
         sys.exit(-1)
-    
-    current_num_colors = len(palette_chunk)
 
-    for colour in rgb_array:
-        if (colour not in palette_chunk):
-            current_num_colors += 1
-    
-    if (current_num_colors > NUM_COLOURS_PER_PALETTE):
-        return False
-    return True
-
-def insert_colours(palette_chunk, rgb_array):
-    for colour in rgb_array:
-        if (colour not in palette_chunk):
-            palette_chunk.append(colour)
-    return
-
-def pad_palette(palette_chunk):
-    while (len(palette_chunk) < NUM_COLOURS_PER_PALETTE):
-        palette_chunk.append(PAD_COLOUR)
-
-def create_8bits_palettes(all_level_colours):
-    palettes = []
-    palette_chunk = []
-
-    tiles_per_palette_array = []
-    tiles_per_palette = 0
-
-    for tile_idx in range(TOTAL_NUM_TILES):
-
-        # Verify if the tile palette fits in palette chunk
-        if ( verify_slots(palette_chunk, all_level_colours[tile_idx]) ):
-            # it fits, thus insert tile palette
-            insert_colours(palette_chunk, all_level_colours[tile_idx])
-            tiles_per_palette += 1
-        else:
-            # wrap palette
-            pad_palette(palette_chunk)      # fill in the last slots with pad colours, if they are empty
-            palettes.append(palette_chunk)  # add palette chunk
-
-            # attach number of tiles for this palette
-            tiles_per_palette_array.append(tiles_per_palette)
-
-            tiles_per_palette = 1      # reset num tiles per palette
-            palette_chunk = []         # reset array
-    
-    # finish last palette
-    pad_palette(palette_chunk)
-    palettes.append(palette_chunk)
-
-    return ( palettes, tiles_per_palette_array )
-
-
-def get_tile_from_xy(x,y):
-    great_y = y // TILE_HEIGHT
-    great_x = x // TILE_WIDTH
-    return great_x + PAGE_TILES_HEIGHT*great_y
-
-def get_xy_from_tile(tile_idx):
-    y = (tile_idx // PAGE_TILES_HEIGHT) * TILE_WIDTH
-    x = (tile_idx % PAGE_TILES_HEIGHT) * TILE_HEIGHT
-    return ( x , y )
-
-
-def get_new_palette_idx_from_tile(tile_idx, tiles_per_palette_array):
-    sum = 0
-    for palette_idx in range(len(tiles_per_palette_array)):
-        sum += tiles_per_palette_array[palette_idx]
-        if (sum > tile_idx):
-            return palette_idx
-    # last palette
-    return len(tiles_per_palette_array) - 1
-    
-
-def write_all_tiles_from_level(level, palettes, tiles_per_palette_array):
+    return read_page_indices(b_tile_path)
+
+def remap_page_tiles(page_indices, page, remap_tables, scale=TILE_SCALE):
+    tiles = np.empty((TILES_PER_PAGE, scale*TILE_HEIGHT, scale*TILE_WIDTH), dtype=np.uint8)
+
+    for tile_idx in range(TILES_PER_PAGE):
+        true_tile_idx = tile_idx + page*TILES_PER_PAGE  # 0 to 383
+
+        # 4 bits indices of the tile -> 8 bits indices of its palette
+        tile_indices = remap_tables[true_tile_idx][get_tile_indices(page_indices, tile_idx)]
+        tiles[tile_idx] = upscale(tile_indices, scale)
+
+    return tiles
+
+def create_page_tiles(level, page, remap_tables, root_dir=ROOT_DIR, scale=TILE_SCALE, psx_sty=None):
+    """64x64 tiles of a page (or 32x32 times scale), as 8 bits indices of their palettes."""
+    return remap_page_tiles(read_tile_page(level, page, root_dir, psx_sty), page, remap_tables, scale)
+
+def create_level_tiles(level, remap_tables, jobs=1, root_dir=ROOT_DIR, scale=TILE_SCALE, psx_sty=None):
+    """64x64 tiles of a level, as 8 bits indices of their palettes."""
+    work_units = [ (level, page, remap_tables, root_dir, scale, psx_sty) for page in range(NUM_PAGES) ]
+    return np.concatenate(run_jobs(create_page_tiles, work_units, jobs))
+
+def get_tiles_dir(level, root_dir=ROOT_DIR, scale=TILE_SCALE):
+    # only the 64x64 tiles go to all_tiles, where the injector reads them
+    if scale == TILE_SCALE:
+        return root_dir / level / "all_tiles"
+    return root_dir / level / f"all_tiles_x{scale}"
+
+def get_tile_bmp_path(level, true_tile_idx, root_dir=ROOT_DIR, scale=TILE_SCALE):
+    return get_tiles_dir(level, root_dir, scale) / f"{level}_{true_tile_idx}.bmp"  # level + "_" + str(true_tile_idx) + ".bmp"
+
+def write_tile_bmps(level, tiles, palettes, tile_palettes, first_tile_idx=0, only_tiles=None, root_dir=ROOT_DIR,
+                    scale=TILE_SCALE):
+    from PIL import Image   # only needed here, the injector imports this module too
+
+    for tile_idx, tile_indices in enumerate(tiles):
+        true_tile_idx = first_tile_idx + tile_idx
+
+        if only_tiles is not None and true_tile_idx not in only_tiles:
+            continue
+
+        out_bmp_path = get_tile_bmp_path(level, true_tile_idx, root_dir, scale)
+
+        palette = palettes[tile_palettes[true_tile_idx]]
+
+        tile_bmp = Image.fromarray(tile_indices, 'P')
+        tile_bmp.putpalette(ajust_palette(palette))     # ...(r,g,b)... to ...r,g,b...
+        tile_bmp.save(out_bmp_path)
+
+def write_page_tiles(level, page, palettes, tile_palettes, remap_tables, only_tiles=None, root_dir=ROOT_DIR,
+                     scale=TILE_SCALE, psx_sty=None):
+    with stage("decode_tiles", level):
+        tiles = create_page_tiles(level, page, remap_tables, root_dir, scale, psx_sty)
+    with stage("write_bmps", level):
+        write_tile_bmps(level, tiles, palettes, tile_palettes, page*TILES_PER_PAGE, only_tiles, root_dir, scale)
+
+def get_page_tile_writes(page_indices, level, page, palettes, tile_palettes, remap_tables, only_tiles=None,
+                         root_dir=ROOT_DIR, scale=TILE_SCALE, psx_sty=None):
+    """Decode stage of write_page_tiles when run overlapped: the tile writes of a page already read."""
+    with stage("decode_tiles", level):
+        tiles = remap_page_tiles(page_indices, page, remap_tables, scale)
+    # one write per page, single tiles cost more in thread hand-offs than they save
+    return [ (run_in_stage, ("write_bmps", level, write_tile_bmps,
+                             level, tiles, palettes, tile_palettes, page*TILES_PER_PAGE, only_tiles, root_dir, scale)) ]
+
+def run_page_tile_writes(work_units, jobs=1, overlap=0):
+    """write_page_tiles for every work unit, in a process pool or, with overlap writer threads,
+    reading, decoding and writing at the same time."""
+    if not overlap:
+        run_jobs(write_page_tiles, work_units, jobs)
+        return
+
+    # (level, page, root_dir, psx_sty) is enough to read a page, reading is part of decode_tiles as in write_page_tiles
+    overlapped_units = [ (("decode_tiles", unit[0], read_tile_page, unit[0], unit[1], unit[6], unit[8]), unit)
+                         for unit in work_units ]
+    with overlapped_stages("overlapped_tiles"):
+        run_overlapped(run_in_stage, get_page_tile_writes, overlapped_units, overlap)
+
+def write_all_tiles_from_level(level, palettes, tile_palettes, remap_tables, jobs=1, root_dir=ROOT_DIR,
+                               scale=TILE_SCALE):
+    work_units = [ (level, page, palettes, tile_palettes, remap_tables, None, root_dir, scale) for page in range(NUM_PAGES) ]
+    run_jobs(write_page_tiles, work_units, jobs)
+
+def get_level_inputs(level, root_dir=ROOT_DIR, psx_sty=None):
+    """Hash of every binary file a level is built from, and the 4bpp bytes of all its tiles.
+    With psx_sty, the same data is read from the original .STY file, and hashed under the same file names."""
+    inputs = {}
+    packed_tiles = []
     for page in range(NUM_PAGES):
-        b_tile_path = ROOT_DIR / level / "b_tiles" / f"{level}_{page+1}.data"
-        b_pal_path = ROOT_DIR / level / "b_palettes" / f"{level}_{page+1}_palettes.data"
-
-        if not b_tile_path.exists():
-            print("Tile binary file not found.")
-            print("File: " + str(b_tile_path))
-            sys.exit(-1)
-
-        if not b_pal_path.exists():
-            print("Palette binary file not found.")
-            print("File: " + str(b_pal_path))
-            sys.exit(-1)
-
-        binary_colours = colours_from_binary(b_pal_path)
-        rgb_colours = convert_colours_from_15_bits(binary_colours)
-
-        with open(b_tile_path, 'rb') as file:
-            for tile_idx in range(TILES_PER_PAGE):
-                offset_x , offset_y = get_xy_from_tile(tile_idx)
-
-                tile_rgb_bmp = Image.new('RGB', (2*TILE_WIDTH, 2*TILE_HEIGHT))
-                pixels = tile_rgb_bmp.load()
-
-                # position the first byte to be read in the binary
-                file.seek((TILE_WIDTH//2)*tile_idx + ( PAGE_WIDTH*(TILE_HEIGHT - 1) // 2 )*(tile_idx // PAGE_TILES_HEIGHT))
-
-                for y in range(offset_y, offset_y + TILE_HEIGHT):
-                    for x in range(offset_x, offset_x + TILE_WIDTH, 2):   # 2 pixels per byte
-                        idx1, idx2 = two_nibble_from_byte( int.from_bytes(file.read(1)))
-
-                        page_x , page_y = 2*(x - offset_x), 2*(y - offset_y)
-
-                        colour_1 = rgb_colours[tile_idx][idx2]
-                        colour_2 = rgb_colours[tile_idx][idx1]
-
-                        pixels[page_x, page_y] = colour_1
-                        pixels[page_x +1 , page_y] = colour_1
-                        pixels[page_x, page_y + 1] = colour_1
-                        pixels[page_x + 1, page_y + 1] = colour_1
-
-                        pixels[page_x + 2, page_y] = colour_2
-                        pixels[page_x + 3, page_y] = colour_2
-                        pixels[page_x + 2, page_y + 1] = colour_2
-                        pixels[page_x + 3, page_y + 1] = colour_2
-                    
-                    # skip some bytes to get the row below
-                    file.read( TILE_WIDTH*(PAGE_TILES_HEIGHT - 1) // 2 )  
-                
-                true_tile_idx = tile_idx + page*TILES_PER_PAGE  # 0 to 383
-                
-                out_bmp_path = ROOT_DIR / level / "all_tiles" / f"{level}_{true_tile_idx}.bmp"  # level + "_" + str(true_tile_idx) + ".bmp"
-
-                palette_idx = get_new_palette_idx_from_tile(true_tile_idx, tiles_per_palette_array)
-                palette = palettes[palette_idx]
-
-                # convert ...(r,g,b)... to ...r,g,b...
-                pal = ajust_palette(palette)
-
-                # contraption to convert the RGB to palette
-                p_img = Image.new('P', (16, 16))
-                p_img.putpalette(pal)
-
-                tile_bmp = tile_rgb_bmp.quantize(colors=NUM_COLOURS_PER_PALETTE, palette=p_img, dither=0)
-                tile_bmp.save(out_bmp_path)
+        b_tile_path = root_dir / level / "b_tiles" / f"{level}_{page+1}.data"
+        b_pal_path = root_dir / level / "b_palettes" / f"{level}_{page+1}_palettes.data"
+
+        if psx_sty is not None:
+            with psx_sty.get_page_data(page) as page_data:
+                packed_tiles += get_packed_tiles(page_data)
+                inputs[b_tile_path.name] = hash_bytes(page_data)
+            inputs[b_pal_path.name] = hash_bytes(psx_sty.read_palette_data(page))
+            continue
+
+        for binary_path in (b_tile_path, b_pal_path):
+            if not binary_path.exists():
+                print("Binary file not found.")
+                print("File: " + str(binary_path))
+                sys.exit(-1)
 
-def print_all_palettes_used(level, tiles_per_palette_array):
-    sum = 0
-    for i in range(len(tiles_per_palette_array)):
-        print(f"{level}_{sum}.bmp to {level}_{sum + tiles_per_palette_array[i] - 1}.bmp uses palette {i}")
-        sum += tiles_per_palette_array[i]
-    print(f"{level}_{sum}.bmp to {level}_383.bmp uses palette {i+1}", end="\n\n")
+        page_data = read_page_data(b_tile_path)
+        packed_tiles += get_packed_tiles(page_data)
+
+        inputs[b_tile_path.name] = hash_bytes(page_data)
+        inputs[b_pal_path.name] = hash_file(b_pal_path)
+    return ( inputs, packed_tiles )
+
+def get_build_parameters(packing, scale=TILE_SCALE):
+    # all tiles are written again when one of them changes
+    return dict(packing = packing,
+                colour_expansion = DEFAULT_EXPANSION,
+                tile_size = scale*TILE_WIDTH)
+
+def save_level_manifest(level, inputs, packing, tile_palettes, fingerprints, root_dir=ROOT_DIR, scale=TILE_SCALE):
+    """Save the manifest of the tiles of a level just written, for the next build to skip the unchanged ones.
+    Every tool writing the .bmp tiles saves it, or the next build trusts a manifest older than the tiles."""
+    manifest_path = get_tiles_dir(level, root_dir, scale) / MANIFEST_NAME
+    save_manifest(manifest_path, inputs, get_build_parameters(packing, scale), tile_palettes, fingerprints)
+
+def plan_level_build(level, palettes, tile_palettes, remap_tables, packing, force=False, root_dir=ROOT_DIR,
+                     scale=TILE_SCALE, tile_sources=None, psx_sty=None):
+    """Work units for the pages of a level which have tiles to write again, the (source, destination)
+    .bmp files to copy once they are written, and the arguments of save_level_manifest once they are.
+
+    Identical tiles have the same fingerprint and so the same .bmp file: only the first one is
+    written, the others are copied from it. tile_sources maps fingerprints to the .bmp file
+    written for them, share it between levels to also copy tiles found in previous levels."""
+    inputs, packed_tiles = get_level_inputs(level, root_dir, psx_sty)
+    parameters = get_build_parameters(packing, scale)
+
+    fingerprints = get_tile_fingerprints(packed_tiles, palettes, tile_palettes, remap_tables)
+
+    tiles_dir = get_tiles_dir(level, root_dir, scale)
+    tiles_dir.mkdir(parents=True, exist_ok=True)
+    manifest = None if force else load_manifest(tiles_dir / MANIFEST_NAME)
+
+    out_paths = [get_tile_bmp_path(level, tile_idx, root_dir, scale) for tile_idx in range(TOTAL_NUM_TILES)]
+    changed_tiles = set(get_changed_tiles(manifest, parameters, fingerprints, out_paths))
+
+    if tile_sources is None:
+        tile_sources = {}
+
+    tiles_to_write = set()
+    copies = []
+    for tile_idx, fingerprint in enumerate(fingerprints):
+        if fingerprint not in tile_sources:
+            tile_sources[fingerprint] = out_paths[tile_idx]
+            if tile_idx in changed_tiles:
+                tiles_to_write.add(tile_idx)
+        elif tile_idx in changed_tiles:
+            copies.append( (tile_sources[fingerprint], out_paths[tile_idx]) )
+
+    work_units = []
+    for page in range(NUM_PAGES):
+        page_tiles = { tile_idx for tile_idx in tiles_to_write if tile_idx // TILES_PER_PAGE == page }
+        if page_tiles:
+            work_units.append( (level, page, palettes, tile_palettes, remap_tables, page_tiles, root_dir, scale, psx_sty) )
+
+    print(f"{level.upper()}: {len(changed_tiles)} of {TOTAL_NUM_TILES} tiles changed", end="")
+    print(f", {len(copies)} copied from identical tiles" if copies else "")
+
+    new_manifest = (level, inputs, packing, tile_palettes, fingerprints, root_dir, scale)
+    return ( work_units, copies, new_manifest )
+
+def copy_identical_tiles(copies):
+    for source_path, out_path in copies:
+        shutil.copyfile(source_path, out_path)
+
+def write_level_files(level_palettes, psx_stys, atlas=False, raw=False, jobs=1, scale=TILE_SCALE):
+    """Write the tiles of each level into an atlas and/or a raw tiles file, instead of a .bmp per tile.
+    psx_stys maps levels to their original .STY file opened by open_psx_sty, or None to read the .data files."""
+    print(f"Creating {scale*TILE_WIDTH}x{scale*TILE_HEIGHT} tile files for levels {', '.join(LEVELS).upper()}", end="\n\n")
+    for level_idx, level in enumerate(LEVELS):
+        palettes, tile_palettes, remap_tables = level_palettes[level_idx]
+
+        with stage("decode_tiles", level):
+            tiles = create_level_tiles(level, remap_tables, jobs, scale=scale, psx_sty=psx_stys[level])
+        if atlas:
+            with stage("write_atlas", level):
+                atlas_path, _ = write_atlas(level, tiles, palettes, tile_palettes, scale=scale)
+            print(f"{level.upper()}: {atlas_path}")
+        if raw:
+            with stage("write_raw", level):
+                raw_path = write_raw_tiles(level, tiles, tile_palettes)
+            print(f"{level.upper()}: {raw_path}")
+    print("")
+
+def write_changed_tiles(level_palettes, args, psx_stys):
+    # only the tiles whose pixels or palette changed since the last run are written again
+    work_units = []
+    copies = []
+    new_manifests = []
+    tile_sources = {}
+    for level_idx, level in enumerate(LEVELS):
+        with stage("plan_build", level):
+            level_work_units, level_copies, new_manifest = plan_level_build(level, *level_palettes[level_idx], args.packing,
+                                                                            args.force, scale=args.scale,
+                                                                            tile_sources=tile_sources,
+                                                                            psx_sty=psx_stys[level])
+        work_units += level_work_units
+        copies += level_copies
+        new_manifests.append(new_manifest)
+
+    # every page of every level is written independently
+    print(f"Creating {args.scale*TILE_WIDTH}x{args.scale*TILE_HEIGHT} tiles for levels {', '.join(LEVELS).upper()}", end="\n\n")
+    run_page_tile_writes(work_units, args.jobs, args.overlap)   # write .bmp of tiles on hard disk
+
+    with stage("copy_tiles"):
+        copy_identical_tiles(copies)
+
+    with stage("save_manifests"):
+        for new_manifest in new_manifests:
+            save_level_manifest(*new_manifest)
+
+def create_all_tiles(args):
+    if args.raw and args.scale != TILE_SCALE:
+        print(f"ERROR: raw tiles are only written at scale {TILE_SCALE}, to be injected")
+        sys.exit(-1)
 
+    with contextlib.ExitStack() as stack:
+        # the .STY file of each level is opened once, for all its pages
+        psx_stys = { level: stack.enter_context(open_psx_sty(level, args.psx_dir)) for level in LEVELS }
+        build_all_levels(args, psx_stys)
 
-def main():
+def build_all_levels(args, psx_stys):
+    """Palettes, tiles and palette plans of all levels, read from their .data files, or from
+    their original .STY file when psx_stys maps them to one."""
     all_colours = []
     for level in LEVELS:
-        all_level_colours = []
-        for page in range(6):   #  page + 1
-            binary_pal_path = ROOT_DIR / level / "b_palettes" / f"{level}_{page+1}_palettes.data"
-            if binary_pal_path.exists():
-                
-                print("Getting colours from file: " + str(binary_pal_path))
-                binary_colours = colours_from_binary(binary_pal_path)
-                rgb_colours = convert_colours_from_15_bits(binary_colours)
-                all_level_colours += rgb_colours
-            else:
-                print("Palette binary files not found")
-                sys.exit(-1)
-        
+        all_level_colours = load_level_colours(level, psx_sty=psx_stys[level])
         all_colours.append(all_level_colours)
 
+    level_palettes = []
     for level in LEVELS:
         print(f"Creating palette for level {level.upper()}")
         level_idx = LEVELS.index(level)
-        palettes, tiles_per_palette_array = create_8bits_palettes(all_colours[level_idx])
+        with stage("pack_palettes", level):
+            # with --dedup, repeated tiles are packed once and get the palette of the first one
+            duplicate_of = get_duplicate_map(get_level_tile_keys(level, psx_sty=psx_stys[level])[0]) if args.dedup else None
+            level_palettes.append(create_8bits_palettes(all_colours[level_idx], args.packing, duplicate_of))
+
+    if args.atlas or args.raw:
+        tile_sources = [tile_source for tile_source, asked in (("atlas", args.atlas), ("raw", args.raw)) if asked]
+        write_level_files(level_palettes, psx_stys, args.atlas, args.raw, args.jobs, args.scale)
+    else:
+        tile_sources = ["bmp"]
+        write_changed_tiles(level_palettes, args, psx_stys)
+
+    # the injector uses the same palettes instead of packing them again, only the 64x64 tiles are injected.
+    # Each plan is written once its tiles are, an interrupted run leaves no plan describing tiles not written
+    if args.scale == TILE_SCALE:
+        for level_idx, level in enumerate(LEVELS):
+            with stage("write_palette_plan", level):
+                source_hashes = get_palette_source_hashes(level, psx_sty=psx_stys[level])
+                for tile_source in tile_sources:
+                    write_palette_plan(level, args.packing, *level_palettes[level_idx], source_hashes,
+                                       tile_source=tile_source)
 
-        print(f"Creating {2*TILE_WIDTH}x{2*TILE_HEIGHT} tiles for level {level.upper()}", end="\n\n")
-        write_all_tiles_from_level(level, palettes, tiles_per_palette_array) # write .bmp of tiles on hard disk
+    for level in LEVELS:
+        level_idx = LEVELS.index(level)
+        tile_palettes = level_palettes[level_idx][1]
+
+        print_all_palettes_used(level, tile_palettes) # print which palette the tiles uses
+        print_packing_stats(level, get_packing_stats(all_colours[level_idx], tile_palettes))
+
+def add_arguments(parser):
+    parser.add_argument("--packing", choices=PACKING_MODES, default=DEFAULT_PACKING,
+                        help="how tiles are grouped into 256 colour palettes")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of processes writing tiles, 0 uses all cores")
+    parser.add_argument("--overlap", type=int, default=0, metavar="WRITERS",
+                        help="read, decode and write tiles at the same time, in one process with this many "
+                             "writer threads, instead of --jobs")
+    parser.add_argument("--dedup", action="store_true",
+                        help="pack tiles repeated in a level once, so they share a palette and their .bmp "
+                             "is written once then copied. Changes the palettes, off by default")
+    parser.add_argument("--force", action="store_true",
+                        help="write all tiles, even the ones unchanged since the last run")
+    parser.add_argument("--scale", type=parse_scale, default=TILE_SCALE,
+                        help="tiles are 32x32 times this, only 2 (64x64) can be injected. "
+                             "Other scales are written to <level>/all_tiles_x<scale>")
+    parser.add_argument("--atlas", action="store_true",
+                        help="write one <level>_atlas.bmp per level, 16 tiles wide, with a .json index, "
+                             "instead of a .bmp per tile")
+    parser.add_argument("--raw", action="store_true",
+                        help="write one <level>_tiles.raw per level, the tiles laid out as in the TILE chunk "
+                             "with the palette of each tile, instead of a .bmp per tile")
+    parser.add_argument("--psx-dir",
+                        help="read the levels from the original BIL.STY, STE.STY and WIL.STY in this folder "
+                             "instead of the .data files, once located with psx_tool.py locate")
+    add_metrics_arguments(parser)
+
+def run(args):
+    run_with_metrics(args, "psx_create_tiles", create_all_tiles, args)
 
-        print_all_palettes_used(level, tiles_per_palette_array) # print which palette the tiles uses
+def main():
+    parser = argparse.ArgumentParser(PROGRAM_NAME)
+    add_arguments(parser)
+    run(parser.parse_args())
 
     
 
 if __name__ == "__main__":
     main()
-
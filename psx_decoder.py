@@ -0,0 +1,88 @@
+import numpy as np
+
+TILE_WIDTH = 32
+TILE_HEIGHT = 32
+PAGE_TILES_HEIGHT = 8       #  8 tiles x 8 tiles
+PAGE_WIDTH = 256
+PAGE_HEIGHT = 256
+
+COLOURS_PER_TILE = 16
+TILES_PER_PAGE = 64
+
+PAGE_SIZE = PAGE_WIDTH * PAGE_HEIGHT // 2       # 4bpp, 2 pixels per byte
+
+
+def unpack_nibbles(data):
+    """Unpack a 4bpp buffer into an array of colour indices, low nibble first."""
+    packed = np.frombuffer(data, dtype=np.uint8)
+
+    indices = np.empty(2*packed.size, dtype=np.uint8)
+    indices[0::2] = packed & 0x0F   # left pixel
+    indices[1::2] = packed >> 4     # right pixel
+    return indices
+
+def read_page_data(b_tile_path):
+    """Read a whole <level>_<n>.data page, still 4bpp packed."""
+    with open(b_tile_path, 'rb') as file:
+        data = file.read(PAGE_SIZE)
+
+    if (len(data) != PAGE_SIZE):
+        raise ValueError(f"{b_tile_path} has {len(data)} bytes, expected {PAGE_SIZE}")
+
+    return data
+
+def read_page_indices(b_tile_path):
+    """Read a whole <level>_<n>.data page and return its 256x256 colour indices."""
+    return unpack_nibbles(read_page_data(b_tile_path)).reshape(PAGE_HEIGHT, PAGE_WIDTH)
+
+def get_packed_tiles(data):
+    """4bpp bytes of each of the 64 tiles of a page, without unpacking them."""
+    packed = np.frombuffer(data, dtype=np.uint8).reshape(PAGE_HEIGHT, PAGE_WIDTH // 2)
+
+    packed_tiles = []
+    for tile_idx in range(TILES_PER_PAGE):
+        y = (tile_idx // PAGE_TILES_HEIGHT) * TILE_HEIGHT
+        x = (tile_idx % PAGE_TILES_HEIGHT) * TILE_WIDTH // 2
+        packed_tiles.append(packed[y : y + TILE_HEIGHT, x : x + TILE_WIDTH // 2].tobytes())
+    return packed_tiles
+
+def get_page_tile_map():
+    """Tile index (0 to 63) of every pixel of a page."""
+    tile_y = np.arange(PAGE_HEIGHT) // TILE_HEIGHT
+    tile_x = np.arange(PAGE_WIDTH) // TILE_WIDTH
+    return (tile_x[np.newaxis, :] + PAGE_TILES_HEIGHT*tile_y[:, np.newaxis]).astype(np.intp)
+
+PAGE_TILE_MAP = get_page_tile_map()
+
+def get_tile_indices(page_indices, tile_idx):
+    """32x32 view of the colour indices of a tile inside a page."""
+    y = (tile_idx // PAGE_TILES_HEIGHT) * TILE_HEIGHT
+    x = (tile_idx % PAGE_TILES_HEIGHT) * TILE_WIDTH
+    return page_indices[y : y + TILE_HEIGHT, x : x + TILE_WIDTH]
+
+def apply_page_palettes(page_indices, rgb_colours, scale=1):
+    """Convert the colour indices of a page to RGB, using the 16 colour palette of each tile.
+    The page is scaled up before the colours are looked up, so only indices are repeated."""
+    colours = np.asarray(rgb_colours, dtype=np.uint8).reshape(-1, 3)   # (64*16, 3)
+    return colours[upscale(PAGE_TILE_MAP*COLOURS_PER_TILE + page_indices, scale)]
+
+def upscale(indices, scale):
+    """Repeat every pixel of a 2D array scale x scale times."""
+    if scale == 1:
+        return indices
+
+    height, width = indices.shape
+    # a broadcast view of each pixel repeated, then a single copy into the new shape
+    repeated = np.broadcast_to(indices[:, None, :, None], (height, scale, width, scale))
+    return repeated.reshape(height*scale, width*scale)
+
+def parse_scale(value):
+    """argparse type of the --scale options: upscale takes any integer factor from 1."""
+    import argparse
+    try:
+        scale = int(value)
+    except ValueError:
+        scale = 0
+    if scale < 1:
+        raise argparse.ArgumentTypeError(f"must be an integer from 1, not {value!r}")
+    return scale
@@ -0,0 +1,120 @@
+import psx_metrics
+import contextlib
+import threading
+import queue
+import io
+import os
+import sys
+
+
+def get_num_jobs(jobs):
+    # 0 means one job per core
+    if jobs <= 0:
+        return os.cpu_count() or 1
+    return jobs
+
+def run_captured(function, args, collect_metrics=False):
+    if collect_metrics:
+        psx_metrics.enable()
+
+    log = io.StringIO()
+    exit_code = None
+    with contextlib.redirect_stdout(log):
+        try:
+            result = function(*args)
+        except SystemExit as e:
+            result = None
+            exit_code = e.code
+    return ( result, log.getvalue(), exit_code, psx_metrics.take_records() )
+
+def run_jobs(function, work_units, jobs=1):
+    """Call function(*args) for every args tuple of work_units and return the results in the same order.
+
+    With more than one job, the work units run in a process pool. What each of them prints is
+    buffered and printed in work unit order, so the output is the same for any number of jobs.
+    Metrics recorded by the work units are merged in the same order."""
+    work_units = list(work_units)
+    jobs = min(get_num_jobs(jobs), len(work_units))
+
+    if jobs <= 1:
+        return [function(*args) for args in work_units]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    results = []
+    collect_metrics = [psx_metrics.is_enabled()]*len(work_units)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for result, log, exit_code, records in executor.map(run_captured, [function]*len(work_units), work_units,
+                                                            collect_metrics):
+            sys.stdout.write(log)
+            psx_metrics.add_records(records)
+            if exit_code is not None:
+                executor.shutdown(cancel_futures=True)
+                sys.exit(exit_code)
+            results.append(result)
+    return results
+
+def check_writes(futures):
+    """Raise the error of the first failed write, return the writes still running."""
+    running = []
+    for future in futures:
+        if not future.done():
+            running.append(future)
+        elif future.exception() is not None:
+            raise future.exception()
+    return running
+
+def run_overlapped(read_function, process_function, work_units, writers=2, prefetch=2):
+    """Run work units as three overlapped stages, in a single process.
+
+    work_units are (read args, process args) pairs. A reader thread calls read_function(*read_args),
+    at most prefetch units ahead. process_function(data, *process_args) then runs in this thread,
+    in work unit order, and returns the (function, args) writes of the unit, which run in a pool
+    of writer threads. At most 4 writes per writer wait in the pool, so memory use stays bounded."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    read_queue = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def read_all():
+        for read_args, _ in work_units:
+            try:
+                item = ( read_function(*read_args), None )
+            except BaseException as e:     # errors are reported with sys.exit
+                item = ( None, e )
+
+            while not stop.is_set():
+                try:
+                    read_queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if item[1] is not None or stop.is_set():
+                return
+
+    reader = threading.Thread(target=read_all, daemon=True)
+    reader.start()
+
+    waiting_writes = threading.BoundedSemaphore(4*writers)
+    futures = []
+    try:
+        with ThreadPoolExecutor(max_workers=writers) as executor:
+            try:
+                for _, process_args in work_units:
+                    data, error = read_queue.get()
+                    if error is not None:
+                        raise error
+
+                    for function, args in process_function(data, *process_args):
+                        waiting_writes.acquire()
+                        future = executor.submit(function, *args)
+                        future.add_done_callback(lambda _: waiting_writes.release())
+                        futures.append(future)
+                    futures = check_writes(futures)
+            except BaseException:
+                executor.shutdown(cancel_futures=True)
+                raise
+        check_writes(futures)
+    finally:
+        stop.set()
+        reader.join()
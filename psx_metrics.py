@@ -0,0 +1,163 @@
+from pathlib import Path
+import contextlib
+import tracemalloc
+import cProfile
+import json
+import time
+import os
+
+try:
+    import psutil       # optional, gives I/O counters on every platform
+except ImportError:
+    psutil = None
+
+METRICS_VERSION = 1
+
+_enabled = False
+_concurrent = False     # inside overlapped_stages
+_records = []
+
+
+def enable():
+    global _enabled
+    _enabled = True
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def is_enabled():
+    return _enabled
+
+def take_records():
+    """Return the recorded stages and forget them."""
+    global _records
+    records, _records = _records, []
+    return records
+
+def add_records(records):
+    _records.extend(records)
+
+def read_io_counters():
+    """(bytes read, bytes written, read calls, write calls) of this process so far, or None."""
+    if psutil is not None:
+        counters = psutil.Process().io_counters()
+        return ( counters.read_chars if hasattr(counters, 'read_chars') else counters.read_bytes,
+                 counters.write_chars if hasattr(counters, 'write_chars') else counters.write_bytes,
+                 counters.read_count,
+                 counters.write_count )
+
+    # Linux, counts every read/write syscall, even the ones served by the page cache
+    try:
+        with open("/proc/self/io", 'r') as file:
+            fields = dict(line.split(": ") for line in file.read().splitlines())
+    except OSError:
+        return None
+    return ( int(fields["rchar"]), int(fields["wchar"]), int(fields["syscr"]), int(fields["syscw"]) )
+
+@contextlib.contextmanager
+def stage(name, level=None):
+    """Record wall time, I/O and peak memory of the code inside the with block.
+    Inside overlapped_stages, only the wall time is recorded and the stage is marked concurrent."""
+    if not _enabled:
+        yield
+        return
+    if _concurrent:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            _records.append(dict(stage = name, level = level, pid = os.getpid(),
+                                 wall_time = time.perf_counter() - start, concurrent = True))
+        return
+
+    io_before = read_io_counters()
+    tracemalloc.reset_peak()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall_time = time.perf_counter() - start
+        peak_memory = tracemalloc.get_traced_memory()[1] - memory_before
+        io_after = read_io_counters()
+
+        record = dict(stage = name, level = level, pid = os.getpid(),
+                      wall_time = wall_time, peak_memory = peak_memory)
+        if io_before is not None and io_after is not None:
+            record.update(bytes_read = io_after[0] - io_before[0],
+                          bytes_written = io_after[1] - io_before[1],
+                          read_calls = io_after[2] - io_before[2],
+                          write_calls = io_after[3] - io_before[3])
+        _records.append(record)
+
+@contextlib.contextmanager
+def overlapped_stages(name, level=None):
+    """Record the code inside the with block once as stage name, with its I/O and peak memory.
+    The stages run inside it overlap each other and share the I/O counters and peak memory of the process,
+    so they only record their wall time, and summing them counts the same time more than once."""
+    global _concurrent
+    with stage(name, level):
+        _concurrent = True
+        try:
+            yield
+        finally:
+            _concurrent = False
+
+def run_in_stage(name, level, function, *args):
+    """function(*args) inside stage(name, level), for the reads and writes run_overlapped runs in threads."""
+    with stage(name, level):
+        return function(*args)
+
+def summarize(records, key):
+    """Sum the records sharing the same key (stage or level).
+    Concurrent stages are summed apart in concurrent_wall_time, which can be more than the wall time of the run."""
+    totals = {}
+    for record in records:
+        if record[key] is None:
+            continue
+        total = totals.setdefault(record[key], dict(wall_time = 0.0, peak_memory = 0))
+        if record.get("concurrent"):
+            total["concurrent_wall_time"] = total.get("concurrent_wall_time", 0.0) + record["wall_time"]
+            continue
+        total["wall_time"] += record["wall_time"]
+        total["peak_memory"] = max(total["peak_memory"], record["peak_memory"])
+        for counter in ("bytes_read", "bytes_written", "read_calls", "write_calls"):
+            if counter in record:
+                total[counter] = total.get(counter, 0) + record[counter]
+    return totals
+
+def write_report(metrics_path, tool, wall_time):
+    records = take_records()
+    report = dict(version = METRICS_VERSION,
+                  tool = tool,
+                  wall_time = wall_time,
+                  peak_memory = max((record.get("peak_memory", 0) for record in records), default=0),
+                  stages = records,
+                  by_stage = summarize(records, "stage"),
+                  by_level = summarize(records, "level"))
+
+    with open(metrics_path, 'w') as file:
+        json.dump(report, file, indent=2)
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics-out", metavar="JSON_PATH",
+                        help="write wall time, I/O and peak memory of each stage to this file")
+    parser.add_argument("--profile", metavar="PROF_PATH",
+                        help="run under cProfile and dump the stats to this file")
+
+def run_with_metrics(args, tool, function, *function_args):
+    """Call function, recording metrics and/or profiling it as asked by --metrics-out and --profile."""
+    if args.metrics_out:
+        enable()
+
+    profiler = cProfile.Profile() if args.profile else None
+    start = time.perf_counter()
+    try:
+        if profiler is not None:
+            return profiler.runcall(function, *function_args)
+        return function(*function_args)
+    finally:
+        if profiler is not None:
+            profiler.dump_stats(args.profile)
+        if args.metrics_out:
+            write_report(Path(args.metrics_out), tool, time.perf_counter() - start)
@@ -1,7 +1,15 @@
-import imageio.v3 as iio
-from PIL import Image
 from pathlib import Path
-
+from psx_decoder import read_page_indices, apply_page_palettes, parse_scale
+from psx_palettes import load_rgb_palettes
+from psx_sty_reader import open_psx_sty
+from psx_jobs import run_jobs, run_overlapped
+from psx_metrics import stage, run_in_stage, overlapped_stages, add_metrics_arguments, run_with_metrics
+import contextlib
+import argparse
+import sys
+import os
+
+PROGRAM_NAME = os.path.basename(sys.argv[0])
 ROOT_DIR = Path(__file__).parent
 
 LEVELS = ["bil", "ste", "wil"]
@@ -10,129 +18,109 @@ TILE_HEIGHT = 32
 PAGE_TILES_HEIGHT = 8       #  8 tiles x 8 tiles
 PAGE_WIDTH = 256
 PAGE_HEIGHT = 256
+LARGE_PAGE_SCALE = 2
 
-def two_nibble_from_byte(byte):
-    upper_nibble = byte // 16
-    lower_nibble = byte % 16
-    return (upper_nibble, lower_nibble)
-
-
-def colours_from_binary(b_pal_path):
-    with open(b_pal_path, 'rb') as file:
-        palette = []
-
-        # get palette length
-        file.read()
-        eof = file.tell()
-
-        file.seek(0)
-        offset = 0
-
-        tile_palette = []
-        while (offset < eof):
-            tile_palette.append( int.from_bytes(file.read(2), 'little')  )
-            offset += 2
-            # has tile palette ended? 
-            # store its palette and start read another tile palette
-            if (offset % 32 == 0):
-                #print(len(tile_palette))
-                palette.append(tile_palette)
-                tile_palette = []
-                #print(palette[-1])
-    return palette
-
-def pull_colours(word):
-    # remove leading 1 if it exists
-    if (word >= 32768):
-        word -= 32768
-
-    r = (word % 32)*255 // 32
-
-    word = word >> 5
-    g = (word % 32)*255 // 32
-
-    word = word >> 5
-    b = (word*255) // 32
-    
-    return (r, g, b)
-
-def convert_colours_from_15_bits(binary_colours):
-    colours = []
-    for tile_pal_idx in range(len(binary_colours)): # 0 to 63
-        tile_colours = []
-        for colour in range(len(binary_colours[tile_pal_idx])): # 0 to 15
-            tile_colours.append( pull_colours(binary_colours[tile_pal_idx][colour]) )
-        colours.append(tile_colours)
-    return colours
-
-def get_tile_from_xy(x,y):
-    great_y = y // 32
-    great_x = x // 32
-    return great_x + PAGE_TILES_HEIGHT*great_y
-
-def write_page_bmp(b_tile_path, rgb_colours, out_bmp_path):
-    page_bmp = Image.new('RGB', (PAGE_WIDTH, PAGE_HEIGHT))
-    pixels = page_bmp.load()
-
-    with open(b_tile_path, 'rb') as file:
-        for y in range(PAGE_HEIGHT):
-            for x in range(0,PAGE_WIDTH,2):
-                
-                idx1, idx2 = two_nibble_from_byte( int.from_bytes(file.read(1)))
-
-                tile_idx = get_tile_from_xy(x,y)
-
-                pixels[x,y] = rgb_colours[tile_idx][idx2]
-                pixels[x+1,y] = rgb_colours[tile_idx][idx1]
-    page_bmp.save(out_bmp_path)
-    return
-
-def write_large_page_bmp(b_tile_path, rgb_colours, out_bmp_path):
-    page_bmp = Image.new('RGB', (2*PAGE_WIDTH, 2*PAGE_HEIGHT))
-    pixels = page_bmp.load()
-
-    with open(b_tile_path, 'rb') as file:
-        for y in range(PAGE_HEIGHT):
-            for x in range(0, PAGE_WIDTH, 2):
-                
-                idx1, idx2 = two_nibble_from_byte( int.from_bytes(file.read(1)))
+# PIL is imported by the functions writing .bmp files, so the tools start fast when they don't
 
-                tile_idx = get_tile_from_xy(x,y)
+def write_page_bmp(page_indices, rgb_colours, out_bmp_path):
+    from PIL import Image
 
-                page_x , page_y = 2*x, 2*y
+    page_bmp = Image.fromarray(apply_page_palettes(page_indices, rgb_colours), 'RGB')
+    page_bmp.save(out_bmp_path)
+    return
 
-                pixels[page_x, page_y] = rgb_colours[tile_idx][idx2]
-                pixels[page_x +1 , page_y] = rgb_colours[tile_idx][idx2]
-                pixels[page_x, page_y + 1] = rgb_colours[tile_idx][idx2]
-                pixels[page_x + 1, page_y + 1] = rgb_colours[tile_idx][idx2]
+def write_large_page_bmp(page_indices, rgb_colours, out_bmp_path, scale=LARGE_PAGE_SCALE):
+    from PIL import Image
 
-                pixels[page_x + 2, page_y] = rgb_colours[tile_idx][idx1]
-                pixels[page_x + 3, page_y] = rgb_colours[tile_idx][idx1]
-                pixels[page_x + 2, page_y + 1] = rgb_colours[tile_idx][idx1]
-                pixels[page_x + 3, page_y + 1] = rgb_colours[tile_idx][idx1]
+    page_rgb = apply_page_palettes(page_indices, rgb_colours, scale)
 
-                #pixels[x+1,y] = rgb_colours[tile_idx][idx1]
+    page_bmp = Image.fromarray(page_rgb, 'RGB')
     page_bmp.save(out_bmp_path)
     return
 
-def main():
-    for level in LEVELS:
-        for page in range(6):   #  page + 1
-            binary_tiles_path = ROOT_DIR / level / "b_tiles" / (level + "_" + str(page+1) + ".data")
-            binary_pal_path = ROOT_DIR / level / "b_palettes" / (level + "_" + str(page+1) + "_palettes.data")
-            output_path = ROOT_DIR / level / "converted" / (level + "_page_" + str(page+1) + ".bmp")
-
-            if binary_tiles_path.exists() and binary_pal_path.exists():
-                binary_colours = colours_from_binary(binary_pal_path)
-                rgb_colours = convert_colours_from_15_bits(binary_colours)
+def get_large_page_path(level, page, scale=LARGE_PAGE_SCALE, root_dir=ROOT_DIR):
+    if scale == LARGE_PAGE_SCALE:
+        return root_dir / level / "converted" / "large" / f"{level}_page_{page+1}_large.bmp"
+    return root_dir / level / "converted" / f"x{scale}" / f"{level}_page_{page+1}_x{scale}.bmp"
+
+def read_page(level, page, root_dir=ROOT_DIR, psx_sty=None):
+    """(page indices, palettes) of a page, or None if its files are missing.
+    With psx_sty, the page is read from the original .STY file of the level opened by open_psx_sty."""
+    if psx_sty is not None:
+        return ( psx_sty.read_page_indices(page), psx_sty.load_rgb_palettes(page) )
+
+    binary_tiles_path = root_dir / level / "b_tiles" / (level + "_" + str(page+1) + ".data")
+    binary_pal_path = root_dir / level / "b_palettes" / (level + "_" + str(page+1) + "_palettes.data")
+
+    if binary_tiles_path.exists() and binary_pal_path.exists():
+        return ( read_page_indices(binary_tiles_path), load_rgb_palettes(binary_pal_path) )
+    return None
+
+def get_page_writes(page_data, level, page, root_dir=ROOT_DIR, scale=LARGE_PAGE_SCALE, psx_sty=None):
+    """Writes of convert_page, for a page already read."""
+    if page_data is None:
+        return []
+    page_indices, rgb_colours = page_data
+
+    if psx_sty is not None:
+        print(f"Opening file: {psx_sty.path}, page {page+1}")
+    else:
+        print("Opening file: " + str(root_dir / level / "b_tiles" / (level + "_" + str(page+1) + ".data")))
+    output_path = root_dir / level / "converted" / (level + "_page_" + str(page+1) + ".bmp")
+    writes = [ (run_in_stage, ("write_bmps", level, write_page_bmp, page_indices, rgb_colours, output_path)) ]
+
+    if scale > 1:
+        output_path = get_large_page_path(level, page, scale, root_dir)
+        output_path.parent.mkdir(exist_ok=True)
+        writes.append( (run_in_stage, ("write_bmps", level, write_large_page_bmp, page_indices, rgb_colours, output_path, scale)) )
+    return writes
+
+def convert_page(level, page, root_dir=ROOT_DIR, scale=LARGE_PAGE_SCALE, psx_sty=None):
+    with stage("read_page", level):
+        page_data = read_page(level, page, root_dir, psx_sty)
+
+    for function, args in get_page_writes(page_data, level, page, root_dir, scale, psx_sty):
+        function(*args)     # each write records its write_bmps stage
+
+def convert_all_pages(jobs=1, scale=LARGE_PAGE_SCALE, overlap=0, psx_dir=None):
+    with contextlib.ExitStack() as stack:
+        # the .STY file of each level is opened once, for all its pages
+        psx_stys = { level: stack.enter_context(open_psx_sty(level, psx_dir)) for level in LEVELS }
+
+        # every page of every level is converted independently
+        work_units = [ (level, page, ROOT_DIR, scale, psx_stys[level]) for level in LEVELS for page in range(6) ]   #  page + 1
+
+        if overlap:
+            # pages are read ahead while the .bmp files of previous ones are written
+            overlapped_units = [ (("read_page", level, read_page, level, page, root_dir, psx_sty), (level, page, root_dir, scale, psx_sty))
+                                 for level, page, root_dir, scale, psx_sty in work_units ]
+            with overlapped_stages("overlapped_pages"):
+                run_overlapped(run_in_stage, get_page_writes, overlapped_units, overlap)
+        else:
+            run_jobs(convert_page, work_units, jobs)
+
+def add_arguments(parser):
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of processes converting pages, 0 uses all cores")
+    parser.add_argument("--overlap", type=int, default=0, metavar="WRITERS",
+                        help="read pages and write .bmp files at the same time, in one process with this many "
+                             "writer threads, instead of --jobs")
+    parser.add_argument("--scale", type=parse_scale, default=LARGE_PAGE_SCALE,
+                        help="scale of the large pages, written to converted/large for 2 and converted/x<scale> otherwise")
+    parser.add_argument("--psx-dir",
+                        help="read the levels from the original BIL.STY, STE.STY and WIL.STY in this folder "
+                             "instead of the .data files, once located with psx_tool.py locate")
+    add_metrics_arguments(parser)
+
+def run(args):
+    run_with_metrics(args, "psx_page_tile_extractor", convert_all_pages, args.jobs, args.scale, args.overlap,
+                     args.psx_dir)
 
-                print("Opening file: " + str(binary_tiles_path))
-                write_page_bmp(binary_tiles_path, rgb_colours, output_path)
-
-                output_path = ROOT_DIR / level / "converted" / "large" / (level + "_page_" + str(page+1) + "_large.bmp")
-                write_large_page_bmp(binary_tiles_path, rgb_colours, output_path)
+def main():
+    parser = argparse.ArgumentParser(PROGRAM_NAME)
+    add_arguments(parser)
+    run(parser.parse_args())
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,175 @@
+import numpy as np
+
+COLOURS_PER_TILE = 16
+NUM_COLOURS_PER_PALETTE = 256
+PAD_COLOUR = (0, 0, 0)
+
+# first_fit: tiles are packed in order, each palette holds a contiguous range of tiles
+# grouped:   tiles with overlapping colours are packed together, to use fewer palettes
+PACKING_MODES = ("first_fit", "grouped")
+DEFAULT_PACKING = "first_fit"
+
+
+def new_palette_chunk():
+    # (colours, colour -> slot)
+    return ([], {})
+
+def count_new_colours(palette_chunk, rgb_array):
+    # a colour repeated in the tile is counted each time, as the original packer did:
+    # first_fit wraps palettes at the same tiles and its output stays the same
+    colour_slots = palette_chunk[1]
+    return sum(1 for colour in rgb_array if colour not in colour_slots)
+
+def verify_slots(palette_chunk, rgb_array):
+    if (len(rgb_array) != COLOURS_PER_TILE):
+        raise ValueError(f"rgb array size is not {COLOURS_PER_TILE}")
+
+    current_num_colors = len(palette_chunk[0]) + count_new_colours(palette_chunk, rgb_array)
+
+    if (current_num_colors > NUM_COLOURS_PER_PALETTE):
+        return False
+    return True
+
+def insert_colours(palette_chunk, rgb_array):
+    colours, colour_slots = palette_chunk
+    for colour in rgb_array:
+        if (colour not in colour_slots):
+            colour_slots[colour] = len(colours)
+            colours.append(colour)
+    return
+
+def pad_palette(palette_chunk):
+    colours = palette_chunk[0]
+    return colours + [PAD_COLOUR] * (NUM_COLOURS_PER_PALETTE - len(colours))
+
+def get_remap_table(palette_chunk, rgb_array):
+    """Slot of each of the 16 colours of a tile in its 256 colours palette."""
+    colour_slots = palette_chunk[1]
+    return [colour_slots[colour] for colour in rgb_array]
+
+
+def pack_first_fit(all_level_colours):
+    chunks = []
+    tile_palettes = []
+
+    palette_chunk = new_palette_chunk()
+    for rgb_array in all_level_colours:
+
+        # Verify if the tile palette fits in palette chunk, otherwise wrap palette
+        if not verify_slots(palette_chunk, rgb_array):
+            chunks.append(palette_chunk)
+            palette_chunk = new_palette_chunk()
+
+        insert_colours(palette_chunk, rgb_array)
+        tile_palettes.append(len(chunks))
+
+    chunks.append(palette_chunk)
+    return ( chunks, tile_palettes )
+
+def pack_grouped(all_level_colours):
+    # every distinct colour of the level is a bit, every tile a bitset of its colours
+    colour_bits = {}
+    tile_masks = []
+    for rgb_array in all_level_colours:
+        mask = 0
+        for colour in rgb_array:
+            mask |= 1 << colour_bits.setdefault(colour, len(colour_bits))
+        tile_masks.append(mask)
+
+    chunks = []
+    tile_palettes = [None] * len(all_level_colours)
+    remaining = list(range(len(all_level_colours)))
+
+    while remaining:
+        # open a palette with the first tile left, then keep adding the tile
+        # which brings the fewest new colours, until nothing else fits
+        palette_chunk = new_palette_chunk()
+        palette_mask = 0
+        num_colours = 0
+
+        next_tile = remaining[0]
+        while next_tile is not None:
+            remaining.remove(next_tile)
+            insert_colours(palette_chunk, all_level_colours[next_tile])
+            tile_palettes[next_tile] = len(chunks)
+            palette_mask |= tile_masks[next_tile]
+            num_colours = palette_mask.bit_count()
+
+            next_tile = None
+            best_new_colours = NUM_COLOURS_PER_PALETTE - num_colours + 1
+            for tile_idx in remaining:
+                new_colours = (tile_masks[tile_idx] & ~palette_mask).bit_count()
+                if new_colours < best_new_colours:
+                    next_tile, best_new_colours = tile_idx, new_colours
+                    if new_colours == 0:
+                        break
+
+        chunks.append(palette_chunk)
+
+    return ( chunks, tile_palettes )
+
+def create_8bits_palettes(all_level_colours, packing=DEFAULT_PACKING, duplicate_of=None):
+    """Create 256 colour palettes using 16 colour palettes of each tile from original PSX files,
+    and also optimize for repeated colours.
+
+    duplicate_of (see psx_tile_index.get_duplicate_map) gives the first tile identical to each tile:
+    only first tiles are packed, their copies get the same palette.
+
+    Returns the padded palettes, the palette index of every tile and, for every tile,
+    the table which maps its 16 colour indices to slots of its palette."""
+    if duplicate_of is None:
+        packed_tiles = list(range(len(all_level_colours)))
+    else:
+        packed_tiles = [ tile_idx for tile_idx, first_tile in enumerate(duplicate_of) if first_tile == tile_idx ]
+    packed_colours = [ all_level_colours[tile_idx] for tile_idx in packed_tiles ]
+
+    if packing == "first_fit":
+        chunks, packed_palettes = pack_first_fit(packed_colours)
+    elif packing == "grouped":
+        chunks, packed_palettes = pack_grouped(packed_colours)
+    else:
+        raise ValueError(f"Unknown packing mode: {packing} (valid: {', '.join(PACKING_MODES)})")
+
+    if duplicate_of is None:
+        tile_palettes = packed_palettes
+    else:
+        first_tile_palettes = dict(zip(packed_tiles, packed_palettes))
+        tile_palettes = [ first_tile_palettes[first_tile] for first_tile in duplicate_of ]
+
+    palettes = [pad_palette(palette_chunk) for palette_chunk in chunks]
+
+    remap_tables = np.array([ get_remap_table(chunks[palette_idx], rgb_array)
+                              for rgb_array, palette_idx in zip(all_level_colours, tile_palettes) ],
+                            dtype=np.uint8).reshape(-1, COLOURS_PER_TILE)
+
+    return ( palettes, tile_palettes, remap_tables )
+
+def print_all_palettes_used(level, tile_palettes):
+    first_tile = 0
+    for tile_idx in range(1, len(tile_palettes) + 1):
+        # print each run of consecutive tiles sharing the same palette
+        if tile_idx == len(tile_palettes) or tile_palettes[tile_idx] != tile_palettes[first_tile]:
+            print(f"{level}_{first_tile}.bmp to {level}_{tile_idx - 1}.bmp uses palette {tile_palettes[first_tile]}")
+            first_tile = tile_idx
+    print("")
+
+def get_packing_stats(all_level_colours, tile_palettes):
+    num_palettes = max(tile_palettes) + 1
+
+    used_colours = [set() for _ in range(num_palettes)]
+    for rgb_array, palette_idx in zip(all_level_colours, tile_palettes):
+        used_colours[palette_idx].update(rgb_array)
+
+    used_slots = sum(len(colours) for colours in used_colours)
+    tile_slots = COLOURS_PER_TILE * len(all_level_colours)
+
+    return dict(num_tiles = len(all_level_colours),
+                num_palettes = num_palettes,
+                used_slots = used_slots,
+                fill_ratio = used_slots / (num_palettes*NUM_COLOURS_PER_PALETTE),   # used slots / available slots
+                packing_ratio = tile_slots / used_slots)                            # tile colours / used slots
+
+def print_packing_stats(level, stats):
+    print(f"{level.upper()}: {stats['num_tiles']} tiles packed in {stats['num_palettes']} palettes, "
+          f"{stats['used_slots']} colour slots used ({100*stats['fill_ratio']:.1f}% full), "
+          f"packing ratio {stats['packing_ratio']:.2f}", end="\n\n")
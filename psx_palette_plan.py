@@ -0,0 +1,90 @@
+from pathlib import Path
+from psx_palettes import palettes_to_tuples
+from psx_tiles import get_page_paths
+from psx_build_cache import hash_bytes, hash_file
+import numpy as np
+import struct
+
+ROOT_DIR = Path(__file__).parent
+
+NUM_PAGES = 6
+COLOURS_PER_TILE = 16
+NUM_COLOURS_PER_PALETTE = 256
+
+# header: signature, version, number of tiles, number of palettes, number of source files, packing mode,
+# then the sha1 of every b_palettes file, the (r,g,b) palettes, the palette of every tile as 16 bits words
+# and the remap table of every tile
+PLAN_SIGNATURE = b"PTPL"
+PLAN_VERSION = 1
+PLAN_HEADER = struct.Struct('<4sHHHH16s')
+SOURCE_HASH_SIZE = 20
+
+
+def get_palette_plan_path(level, root_dir=ROOT_DIR, tile_source="bmp"):
+    """Plan of the .bmp tiles, atlas or raw tiles file (tile_source) of a level, each has its own next to it."""
+    if tile_source == "bmp":
+        return root_dir / level / "all_tiles" / f"{level}_palette_plan.bin"
+    return root_dir / level / f"{level}_{tile_source}_palette_plan.bin"
+
+def get_palette_source_hashes(level, root_dir=ROOT_DIR, psx_sty=None):
+    """Hash of the b_palettes file of every page of a level, or of the same data in its original
+    .STY file when psx_sty is given. Raises OSError if one is missing."""
+    if psx_sty is not None:
+        return [ hash_bytes(psx_sty.read_palette_data(page)) for page in range(NUM_PAGES) ]
+    return [ hash_file(get_page_paths(level, page, root_dir)[1]) for page in range(NUM_PAGES) ]
+
+def build_palette_plan(packing, palettes, tile_palettes, remap_tables, source_hashes):
+    header = PLAN_HEADER.pack(PLAN_SIGNATURE, PLAN_VERSION, len(tile_palettes), len(palettes), len(source_hashes),
+                              packing.encode('ascii'))
+    return ( header
+             + b"".join(bytes.fromhex(source_hash) for source_hash in source_hashes)
+             + np.asarray(palettes, dtype=np.uint8).tobytes()
+             + np.asarray(tile_palettes, dtype='<u2').tobytes()
+             + np.asarray(remap_tables, dtype=np.uint8).tobytes() )
+
+def write_palette_plan(level, packing, palettes, tile_palettes, remap_tables, source_hashes, root_dir=ROOT_DIR,
+                       tile_source="bmp"):
+    """Write the palettes a level was packed into, for the injector to use the same ones.
+    Written once the tiles of tile_source are, so a plan never describes tiles not written yet."""
+    plan_path = get_palette_plan_path(level, root_dir, tile_source)
+
+    # write then rename, the injector never reads half a plan
+    tmp_path = Path(str(plan_path) + ".tmp")
+    with open(tmp_path, 'wb') as file:
+        file.write(build_palette_plan(packing, palettes, tile_palettes, remap_tables, source_hashes))
+    tmp_path.replace(plan_path)
+    return plan_path
+
+def parse_palette_plan(data):
+    """(packing, palettes, tile_palettes, remap_tables, source hashes) of the contents of a palette plan file."""
+    if len(data) < PLAN_HEADER.size:
+        raise ValueError("file is too small")
+
+    signature, version, num_tiles, num_palettes, num_sources, packing = PLAN_HEADER.unpack_from(data)
+    if signature != PLAN_SIGNATURE:
+        raise ValueError("not a palette plan file")
+    if version != PLAN_VERSION:
+        raise ValueError(f"palette plan version {version}, {PLAN_VERSION} expected")
+
+    hashes_offset = PLAN_HEADER.size
+    palettes_offset = hashes_offset + num_sources*SOURCE_HASH_SIZE
+    tile_palettes_offset = palettes_offset + num_palettes*NUM_COLOURS_PER_PALETTE*3
+    remap_offset = tile_palettes_offset + 2*num_tiles
+
+    expected_size = remap_offset + num_tiles*COLOURS_PER_TILE
+    if len(data) != expected_size:
+        raise ValueError(f"{len(data)} bytes, {expected_size} expected")
+
+    source_hashes = [ data[offset : offset + SOURCE_HASH_SIZE].hex()
+                      for offset in range(hashes_offset, palettes_offset, SOURCE_HASH_SIZE) ]
+    palettes = palettes_to_tuples(np.frombuffer(data, dtype=np.uint8, count=num_palettes*NUM_COLOURS_PER_PALETTE*3,
+                                                offset=palettes_offset).reshape(num_palettes, NUM_COLOURS_PER_PALETTE, 3))
+    tile_palettes = np.frombuffer(data, dtype='<u2', count=num_tiles, offset=tile_palettes_offset).tolist()
+    remap_tables = np.frombuffer(data, dtype=np.uint8, offset=remap_offset).reshape(num_tiles, COLOURS_PER_TILE)
+
+    return ( packing.rstrip(b"\0").decode('ascii'), palettes, tile_palettes, remap_tables, source_hashes )
+
+def read_palette_plan(level, root_dir=ROOT_DIR, tile_source="bmp"):
+    """parse_palette_plan of a palette plan file of a level. Raises OSError or ValueError."""
+    with open(get_palette_plan_path(level, root_dir, tile_source), 'rb') as file:
+        return parse_palette_plan(file.read())
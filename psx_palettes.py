@@ -0,0 +1,55 @@
+import numpy as np
+from functools import lru_cache
+
+COLOURS_PER_TILE = 16
+NUM_15_BIT_COLOURS = 32768
+
+# 5 bits to 8 bits colour channel expansion
+#   legacy: v*255 // 32, what the converters always used (max value is 247)
+#   exact:  (v << 3) | (v >> 2), maps 0..31 to the whole 0..255 range
+EXPANSION_MODES = ("legacy", "exact")
+DEFAULT_EXPANSION = "legacy"
+
+
+def expand_5_bits(values, expansion=DEFAULT_EXPANSION):
+    if expansion == "legacy":
+        return values*255 // 32
+    if expansion == "exact":
+        return (values << 3) | (values >> 2)
+    raise ValueError(f"Unknown colour expansion mode: {expansion} (valid: {', '.join(EXPANSION_MODES)})")
+
+@lru_cache(maxsize=None)
+def get_colour_lut(expansion=DEFAULT_EXPANSION):
+    """(R,G,B) of every 15 bits BGR colour, as a 32768x3 array."""
+    words = np.arange(NUM_15_BIT_COLOURS, dtype=np.uint32)
+
+    lut = np.empty((NUM_15_BIT_COLOURS, 3), dtype=np.uint8)
+    lut[:, 0] = expand_5_bits(words & 0x1F, expansion)           # r
+    lut[:, 1] = expand_5_bits((words >> 5) & 0x1F, expansion)    # g
+    lut[:, 2] = expand_5_bits(words >> 10, expansion)            # b
+    lut.setflags(write=False)
+    return lut
+
+def get_palette_words(data):
+    """16 colour palettes of any buffer as a (tiles, 16) array of 16 bits words, without copying it."""
+    # ignore an incomplete palette at the end of the data
+    num_tiles = len(data) // (2*COLOURS_PER_TILE)
+    words = np.frombuffer(data, dtype='<u2', count=num_tiles*COLOURS_PER_TILE)
+    return words.reshape(num_tiles, COLOURS_PER_TILE)
+
+def read_palette_words(b_pal_path):
+    """Read a <level>_<n>_palettes.data file as a (tiles, 16) array of 16 bits words."""
+    with open(b_pal_path, 'rb') as file:
+        return get_palette_words(file.read())
+
+def convert_colours_from_15_bits(words, expansion=DEFAULT_EXPANSION):
+    # the leading bit (semi-transparency flag) is ignored
+    return get_colour_lut(expansion)[words & 0x7FFF]
+
+def load_rgb_palettes(b_pal_path, expansion=DEFAULT_EXPANSION):
+    """Load the 16 colour palettes of every tile of a page as a (tiles, 16, 3) RGB array."""
+    return convert_colours_from_15_bits(read_palette_words(b_pal_path), expansion)
+
+def palettes_to_tuples(rgb_palettes):
+    """Convert a (tiles, 16, 3) array to lists of (r,g,b) tuples."""
+    return [ [tuple(colour) for colour in tile_palette] for tile_palette in rgb_palettes.tolist() ]
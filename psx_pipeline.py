@@ -0,0 +1,72 @@
+from psx_palette_packer import (create_8bits_palettes, print_all_palettes_used, get_packing_stats,
+                                print_packing_stats, PACKING_MODES, DEFAULT_PACKING)
+from psx_create_tiles import (load_level_colours, create_level_tiles, write_tile_bmps, get_level_inputs, save_level_manifest,
+                              ROOT_DIR)
+from psx_build_cache import get_tile_fingerprints
+from psx_palette_plan import get_palette_source_hashes, write_palette_plan
+from psx_sty_reader import open_psx_sty
+from psx_sty_injector import get_target_sty_path, get_level, read_target_chunks, get_output_path, patch_sty_copy
+import argparse
+import sys
+import os
+
+PROGRAM_NAME = os.path.basename(sys.argv[0])
+
+
+def convert_and_inject(sty_path, level, packing=DEFAULT_PACKING, write_bmps=False, jobs=1, psx_dir=None, root_dir=ROOT_DIR):
+    """Create the tiles of a level from the PSX binaries, or its original .STY file in psx_dir,
+    and inject them into a copy of a .sty file, without going through the .bmp files."""
+    # the .STY file is opened once, for the colours, the tiles and the hashes
+    with open_psx_sty(level, psx_dir) as psx_sty:
+        all_level_colours = load_level_colours(level, root_dir, psx_sty)
+
+        print(f"Creating palette for level {level.upper()}")
+        palettes, tile_palettes, remap_tables = create_8bits_palettes(all_level_colours, packing)
+        print_all_palettes_used(level, tile_palettes)
+        print_packing_stats(level, get_packing_stats(all_level_colours, tile_palettes))
+
+        tiles = create_level_tiles(level, remap_tables, jobs, root_dir, psx_sty=psx_sty)
+
+        if write_bmps:
+            print(f"Writing .bmp tiles for level {level.upper()}", end="\n\n")
+            write_tile_bmps(level, tiles, palettes, tile_palettes, root_dir=root_dir)
+            # the manifest of psx_create_tiles.py, so its next build knows which tiles these are
+            inputs, packed_tiles = get_level_inputs(level, root_dir, psx_sty)
+            save_level_manifest(level, inputs, packing, tile_palettes,
+                                get_tile_fingerprints(packed_tiles, palettes, tile_palettes, remap_tables), root_dir)
+            write_palette_plan(level, packing, palettes, tile_palettes, remap_tables,
+                               get_palette_source_hashes(level, root_dir, psx_sty), root_dir)
+
+    chunk_infos = read_target_chunks(sty_path)
+    output_path = get_output_path(sty_path)
+
+    patch_sty_copy(sty_path, output_path, chunk_infos, palettes, tile_palettes, tiles)
+
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(PROGRAM_NAME)
+    parser.add_argument("sty_path")
+    parser.add_argument("level")
+    parser.add_argument("--packing", choices=PACKING_MODES, default=DEFAULT_PACKING,
+                        help="how tiles are grouped into 256 colour palettes")
+    parser.add_argument("--write-bmps", action="store_true",
+                        help="also write the .bmp tiles into <level>/all_tiles")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of processes decoding pages, 0 uses all cores")
+    parser.add_argument("--psx-dir",
+                        help="read the level from the original BIL.STY, STE.STY or WIL.STY in this folder "
+                             "instead of the .data files, once located with psx_tool.py locate")
+    args = parser.parse_args()
+
+    sty_path = get_target_sty_path(args.sty_path)
+    level = get_level(args.level)
+
+    convert_and_inject(sty_path, level, args.packing, args.write_bmps, args.jobs, args.psx_dir)
+
+    print("All PSX tiles injected successfully")
+
+
+if __name__ == "__main__":
+    main()
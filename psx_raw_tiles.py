@@ -0,0 +1,55 @@
+from pathlib import Path
+from sty_file import layout_tile_data, TILES_PER_PAGE_ROW
+import numpy as np
+import struct
+
+ROOT_DIR = Path(__file__).parent
+
+# header: signature, version, tile size, number of tiles, number of palettes,
+# then the palette of every tile as 16 bits words, then the tiles laid out as TILE chunk data
+RAW_SIGNATURE = b"PTRW"
+RAW_VERSION = 1
+RAW_HEADER = struct.Struct('<4sHHHH')
+
+
+def get_raw_tiles_path(level, root_dir=ROOT_DIR):
+    return root_dir / level / f"{level}_tiles.raw"
+
+def build_raw_tiles(tiles, tile_palettes):
+    num_palettes = max(tile_palettes) + 1
+    header = RAW_HEADER.pack(RAW_SIGNATURE, RAW_VERSION, tiles.shape[1], len(tiles), num_palettes)
+    return header + np.asarray(tile_palettes, dtype='<u2').tobytes() + layout_tile_data(tiles)
+
+def write_raw_tiles(level, tiles, tile_palettes, root_dir=ROOT_DIR):
+    """Write the 8 bits tiles of a level, ready to be copied into a TILE chunk."""
+    raw_path = get_raw_tiles_path(level, root_dir)
+    with open(raw_path, 'wb') as file:
+        file.write(build_raw_tiles(tiles, tile_palettes))
+    return raw_path
+
+def parse_raw_tiles(data):
+    """(tile size, palette of every tile, TILE chunk data) of the contents of a raw tiles file."""
+    if len(data) < RAW_HEADER.size:
+        raise ValueError("file is too small")
+
+    signature, version, tile_size, num_tiles, _ = RAW_HEADER.unpack_from(data)
+    if signature != RAW_SIGNATURE:
+        raise ValueError("not a raw tiles file")
+    if version != RAW_VERSION:
+        raise ValueError(f"raw tiles file version {version}, {RAW_VERSION} expected")
+
+    palettes_offset = RAW_HEADER.size
+    tiles_offset = palettes_offset + 2*num_tiles
+    tile_data = bytes(data[tiles_offset:])
+
+    expected_size = -(-num_tiles // TILES_PER_PAGE_ROW)*TILES_PER_PAGE_ROW*tile_size*tile_size
+    if len(tile_data) != expected_size:
+        raise ValueError(f"{len(tile_data)} bytes of tiles, {expected_size} expected")
+
+    tile_palettes = np.frombuffer(data, dtype='<u2', count=num_tiles, offset=palettes_offset).tolist()
+    return ( tile_size, tile_palettes, tile_data )
+
+def read_raw_tiles(level, root_dir=ROOT_DIR):
+    """parse_raw_tiles of the raw tiles file of a level. Raises OSError or ValueError."""
+    with open(get_raw_tiles_path(level, root_dir), 'rb') as file:
+        return parse_raw_tiles(file.read())
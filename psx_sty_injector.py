@@ -1,6 +1,19 @@
-from PIL import Image
+import numpy as np
 from pathlib import Path
+from psx_palette_packer import create_8bits_palettes, PACKING_MODES, DEFAULT_PACKING
+from psx_create_tiles import load_level_colours
+from psx_jobs import run_jobs
+from psx_atlas import read_atlas
+from psx_raw_tiles import read_raw_tiles
+from psx_palette_plan import get_palette_plan_path, get_palette_source_hashes, read_palette_plan
+from psx_sty_reader import open_psx_sty
+from psx_metrics import stage, add_metrics_arguments, run_with_metrics
+from sty_file import (map_sty_file, read_sty_header, read_chunk_table, get_chunk_infos, get_chunk_view,
+                      build_palx_data, build_ppal_data, parse_palb_data, build_palb_data, grow_tile_palettes, build_tile_data, build_raw_tile_data, get_tile_data_size,
+                      build_grown_chunk_data, write_sty_file, KNOWN_CHUNKS, PALETTES_PER_PAGE, PALETTE_PAGE_SIZE,
+                      TILE_PAGE_SIZE)
 import shutil
+import struct
 import argparse
 import sys
 import os
@@ -19,325 +32,233 @@ NUM_PAGES = 6
 
 COLOURS_PER_TILE = 16
 NUM_COLOURS_PER_PALETTE = 256
-PAD_COLOUR = (0, 0, 0)
 
 TOTAL_NUM_TILES = 384
 TILES_PER_PAGE = 64
 
-def two_nibble_from_byte(byte):
-    upper_nibble = byte // 16
-    lower_nibble = byte % 16
-    return (upper_nibble, lower_nibble)
-
-def ajust_palette(palette):
-    new_palette = []
-    for colour in palette:
-        new_palette.append(colour[0])   # r
-        new_palette.append(colour[1])   # g
-        new_palette.append(colour[2])   # b
-    return new_palette
-
-def colours_from_binary(b_pal_path):
-    with open(b_pal_path, 'rb') as file:
-        palette = []
-
-        # get palette length
-        file.read()
-        eof = file.tell()
-
-        file.seek(0)
-        offset = 0
-
-        tile_palette = []
-        while (offset < eof):
-            tile_palette.append( int.from_bytes(file.read(2), 'little')  )
-            offset += 2
-            # has tile palette ended? 
-            # store its palette and start read another tile palette
-            if (offset % 32 == 0):
-                palette.append(tile_palette)
-                tile_palette = []
-    return palette
-
-def pull_colours(word):
-    # remove leading 1 if it exists
-    if (word >= 32768):
-        word -= 32768
-
-    r = (word % 32)*255 // 32
-
-    word = word >> 5
-    g = (word % 32)*255 // 32
-
-    word = word >> 5
-    b = (word*255) // 32
-    
-    return (r, g, b)
-
-def convert_colours_from_15_bits(binary_colours):
-    colours = []
-    for tile_pal_idx in range(len(binary_colours)): # 0 to 63
-        tile_colours = []
-        for colour in range(len(binary_colours[tile_pal_idx])): # 0 to 15
-            tile_colours.append( pull_colours(binary_colours[tile_pal_idx][colour]) )
-        colours.append(tile_colours)
-    return colours
-
-def verify_slots(palette_chunk, rgb_array):
-    if (len(rgb_array) != 16):
-        print(f"Error: rgb array size is not {COLOURS_PER_TILE}")
-        sys.exit(-1)
-    
-    current_num_colors = len(palette_chunk)
-
-    for colour in rgb_array:
-        if (colour not in palette_chunk):
-            current_num_colors += 1
-    
-    if (current_num_colors > NUM_COLOURS_PER_PALETTE):
-        return False
-    return True
-
-def insert_colours(palette_chunk, rgb_array):
-    for colour in rgb_array:
-        if (colour not in palette_chunk):
-            palette_chunk.append(colour)
-    return
-
-def pad_palette(palette_chunk):
-    while (len(palette_chunk) < NUM_COLOURS_PER_PALETTE):
-        palette_chunk.append(PAD_COLOUR)
-
-def create_8bits_palettes(all_level_colours):
-    """Create 256 colour palettes using 16 colour palettes of each tile from original PSX files,
-    and also optimize for repeated colours."""
-    palettes = []
-    palette_chunk = []
-
-    tiles_per_palette_array = []
-    tiles_per_palette = 0
-
-    for tile_idx in range(TOTAL_NUM_TILES):
-
-        # Verify if the tile palette fits in palette chunk
-        if ( verify_slots(palette_chunk, all_level_colours[tile_idx]) ):
-            # it fits, thus insert tile palette
-            insert_colours(palette_chunk, all_level_colours[tile_idx])
-            tiles_per_palette += 1
-        else:
-            # wrap palette
-
-            pad_palette(palette_chunk)      # fill in the last slots with pad colours, if they are empty
-            palettes.append(palette_chunk)  # add palette chunk
-
-            # attach number of tiles for this palette
-            tiles_per_palette_array.append(tiles_per_palette)
+####  STY stuff
 
-            tiles_per_palette = 1      # reset num tiles per palette
-            palette_chunk = []         # reset array
-    
-    # finish last palette
-    pad_palette(palette_chunk)
-    palettes.append(palette_chunk)
 
-    return ( palettes, tiles_per_palette_array )
+def detect_headers_and_get_chunks(sty_path):
 
+    # an empty file can't be mapped (ValueError), a missing or unreadable one can't be opened (OSError)
+    try:
+        with map_sty_file(sty_path) as sty_data:
+            signature, version_code = read_sty_header(sty_data)
+            chunk_table = read_chunk_table(sty_data)
+            sty_size = len(sty_data)
+    except (OSError, ValueError) as e:
+        print("Error!\n")
+        print(f"{sty_path} is not a valid sty file: {e}")
+        sys.exit(-1)
 
-def get_tile_from_xy(x,y):
-    great_y = y // TILE_HEIGHT
-    great_x = x // TILE_WIDTH
-    return great_x + PAGE_TILES_HEIGHT*great_y
+    print(f"File Header: {signature}")
+    print(f"Version Code: {version_code}\n")
 
-def get_xy_from_tile(tile_idx):
-    y = (tile_idx // PAGE_TILES_HEIGHT) * TILE_WIDTH
-    x = (tile_idx % PAGE_TILES_HEIGHT) * TILE_HEIGHT
-    return ( x , y )
+    print("File Size: {:,} bytes".format(sty_size))
 
+    for chunk in chunk_table:
+        known = "" if chunk.name in KNOWN_CHUNKS else " (unknown type)"
+        print(f"Header {chunk.name} found! Offset: {hex(chunk.offset)}, Size: {hex(chunk.size)}{known}")
 
-def get_new_palette_idx_from_tile(tile_idx, tiles_per_palette_array):
-    sum = 0
-    for palette_idx in range(len(tiles_per_palette_array)):
-        sum += tiles_per_palette_array[palette_idx]
-        if (sum > tile_idx):
-            return palette_idx
-    # last palette
-    return len(tiles_per_palette_array) - 1
+    print("")
+    return get_chunk_infos(chunk_table)
 
-def print_all_palettes_used(level, tiles_per_palette_array):
-    sum = 0
-    for i in range(len(tiles_per_palette_array)):
-        print(f"{level}_{sum}.bmp to {level}_{sum + tiles_per_palette_array[i] - 1}.bmp uses palette {i}")
-        sum += tiles_per_palette_array[i]
-    print(f"{level}_{sum}.bmp to {level}_383.bmp uses palette {i+1}", end="\n\n")
 
+def write_chunk_data(sty_data, chunk_infos, chunk_name, build_function, *args):
+    """Build the new data of a chunk from its current data, then write it with a single call."""
+    offset, size = chunk_infos[chunk_name]
 
+    with get_chunk_view(sty_data, offset, size) as current_data:
+        try:
+            new_data = build_function(current_data, *args)
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            sys.exit(-1)
 
+    sty_data.seek(offset)
+    sty_data.write(new_data)
 
+def build_palx_chunk_data(current_data, tile_palettes):
+    new_data = build_palx_data(tile_palettes)
+    if len(new_data) > len(current_data):
+        raise ValueError(f"PALX chunk has room for {len(current_data) // 2} tiles, {len(tile_palettes)} needed")
+    return new_data
 
+def change_palettes_idx(sty_data, chunk_infos, tile_palettes):
 
-####  STY stuff
+    print("Changing virtual palettes indexes...")
 
+    with stage("palx"):
+        write_chunk_data(sty_data, chunk_infos, "PALX", build_palx_chunk_data, tile_palettes)
 
-def detect_headers_and_get_chunks(sty_path):
 
-    chunk_info = dict(PALX = [None, None], 
-                   PPAL = [None, None], 
-                   PALB = [None, None], 
-                   TILE = [None, None], 
-                   SPRG = [None, None], 
-                   SPRX = [None, None], 
-                   SPRB = [None, None],
-                   DELS = [None, None],
-                   DELX = [None, None],
-                   FONB = [None, None],
-                   CARI = [None, None],
-                   OBJI = [None, None],
-                   PSXT = [None, None],
-                   RECY = [None, None],
-                   SPEC = [None, None])
-    
+def change_physical_palettes(sty_data, chunk_infos, palettes_array):
 
-    with open(sty_path, 'rb') as file:
-        signature = file.read(4).decode('ascii')
+    print("Changing physical palettes...")
 
-        if (signature != "GBST"):
-            print("Error!\n")
-            print(f"{sty_path} is not a sty file!")
+    with stage("ppal"):
+        write_chunk_data(sty_data, chunk_infos, "PPAL", build_ppal_data, palettes_array)
+
+
+def get_level_palettes(level, packing=None, tile_source="bmp", root_dir=ROOT_DIR, psx_sty=None):
+    """(palettes, tile_palettes) the tiles of a level were created with, from the palette plan
+    written by psx_create_tiles.py next to its .bmp tiles, atlas or raw file (tile_source).
+    Without a plan, the palettes are packed again. With psx_sty, the palettes are read from
+    the original .STY file of the level instead of its b_palettes files."""
+    if not get_palette_plan_path(level, root_dir, tile_source).exists():
+        all_level_colours = load_level_colours(level, root_dir, psx_sty)
+
+        print(f"Creating palette for level {level.upper()}")
+        with stage("pack_palettes", level):
+            palettes, tile_palettes, _ = create_8bits_palettes(all_level_colours, packing or DEFAULT_PACKING)
+        return ( palettes, tile_palettes )
+
+    print(f"Reading palette plan of level {level.upper()}")
+    with stage("read_palette_plan", level):
+        try:
+            plan_packing, palettes, tile_palettes, _, source_hashes = read_palette_plan(level, root_dir, tile_source)
+            current_hashes = get_palette_source_hashes(level, root_dir, psx_sty)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: can't read the palette plan of level {level}: {e}")
             sys.exit(-1)
 
-        version_code = int.from_bytes(file.read(2),'little')
-
-        print(f"File Header: {signature}")
-        print(f"Version Code: {version_code}\n")
-
-        data_offset = file.tell()
-        size = file.seek(0, os.SEEK_END)
-        file.seek(data_offset)
-
-        print("File Size: {:,} bytes".format(size))
-
-        current_offset = data_offset
-
-        while (current_offset < size):
-            chunk_header = file.read(4).decode('ascii')
-            current_offset += 4
-            if (chunk_header == "PALX" 
-                or chunk_header == "PPAL"
-                or chunk_header == "PALB"
-                or chunk_header == "TILE"
-                or chunk_header == "SPRG"
-                or chunk_header == "SPRX"
-                or chunk_header == "SPRB"
-                or chunk_header == "DELS"
-                or chunk_header == "DELX"
-                or chunk_header == "FONB"
-                or chunk_header == "CARI"
-                or chunk_header == "OBJI"
-                or chunk_header == "PSXT"
-                or chunk_header == "RECY"
-                or chunk_header == "SPEC"
-                ):
-                header_data_offset = file.tell() + 4
-                chunk_info[chunk_header][0] = header_data_offset
-
-                header_size = int.from_bytes(file.read(4),'little')
-                chunk_info[chunk_header][1] = header_size
-
-                print(f"Header {chunk_header} found! Offset: {hex(header_data_offset)}, Size: {hex(header_size)}")
-
-                file.read(header_size)  # skip data
-                current_offset += header_size
-    print("")
-    return chunk_info
+    # the tiles were created from the palette files the plan was packed from
+    if source_hashes != current_hashes:
+        print(f"ERROR: the palette files of level {level} changed since its tiles were created. "
+              "Run psx_create_tiles.py again")
+        sys.exit(-1)
 
+    if packing is not None and packing != plan_packing:
+        print(f"ERROR: the tiles of level {level} were created with --packing {plan_packing}")
+        sys.exit(-1)
 
+    return ( palettes, tile_palettes )
 
+def read_page_tile_bmps(level, page, palettes, tile_palettes, root_dir=ROOT_DIR):
+    """Read the 64x64 tiles of a page created by psx_create_tiles.py, top row first.
+    The colours of every .bmp file must be the ones of its palette in palettes."""
+    tiles = np.empty((TILES_PER_PAGE, 2*TILE_HEIGHT, 2*TILE_WIDTH), dtype=np.uint8)
 
-def change_palettes_idx(sty_path, chunk_infos, tiles_per_palette_array):
+    for tile_idx in range(page*TILES_PER_PAGE, (page + 1)*TILES_PER_PAGE):
+        bmp_tile_path = root_dir / level / "all_tiles" / f"{level}_{tile_idx}.bmp"
 
-    print("Changing virtual palettes indexes...")
+        if not bmp_tile_path.exists():
+            print(f"ERROR: bmp file of tile {tile_idx} not found.")
+            print("Path: " + str(bmp_tile_path))
+            sys.exit(-1)
 
-    with open(sty_path, 'r+b') as file:
-        
-        palx_offset = chunk_infos["PALX"][0]
+        with open(bmp_tile_path, 'rb') as bmp_tile_file:
+            signature = bmp_tile_file.read(2).decode('ascii')
 
-        file.seek(palx_offset)
+            if (signature != "BM"):
+                print(f"ERROR: The file {bmp_tile_path} is not a bmp file!")
+                sys.exit(-1)
+            
+            bmp_tile_file.read(8)   # skip some data
+            pixel_data_offset = int.from_bytes(bmp_tile_file.read(4), 'little')
 
-        for tile_idx in range(TOTAL_NUM_TILES):
-            physical_pal_idx = get_new_palette_idx_from_tile(tile_idx, tiles_per_palette_array)
+            info_header_size = int.from_bytes(bmp_tile_file.read(4), 'little')
+            width, height, _, bits_per_pixel = struct.unpack('<iiHH', bmp_tile_file.read(12))
 
-            word = bytes([physical_pal_idx % 256, physical_pal_idx // 256])     # low endian stuff
+            if width != 2*TILE_WIDTH or abs(height) != 2*TILE_HEIGHT or bits_per_pixel != 8:
+                print(f"ERROR: {bmp_tile_path} must be a {2*TILE_WIDTH}x{2*TILE_HEIGHT} bmp file of 256 colours, "
+                      f"it is {width}x{abs(height)} with {bits_per_pixel} bits per pixel")
+                sys.exit(-1)
 
-            file.write(word)
+            bmp_tile_file.read(16)  # skip compression, image size and resolution
+            num_colours = int.from_bytes(bmp_tile_file.read(4), 'little') or 256
+
+            # the tiles hold indices into the palettes they were created with, an older or half
+            # finished run of psx_create_tiles.py leaves tiles with other colours
+            bmp_tile_file.seek(14 + info_header_size)
+            colour_table = np.frombuffer(bmp_tile_file.read(4*num_colours), dtype=np.uint8).reshape(-1, 4)
+            palette = np.asarray(palettes[tile_palettes[tile_idx]][:num_colours], dtype=np.uint8)
+            if not np.array_equal(colour_table[:, 2::-1], palette):     # BGRX to RGB
+                print(f"ERROR: the colours of {bmp_tile_path} aren't the ones of palette {tile_palettes[tile_idx]} "
+                      f"of level {level}. Run psx_create_tiles.py again")
+                sys.exit(-1)
 
+            row_size = (width + 3) // 4 * 4     # rows are padded to 4 bytes
+            data_size = row_size * abs(height)
 
-def change_physical_palettes(output_path, chunk_infos, palettes_array):
+            bmp_tile_file.seek(pixel_data_offset)   # go to pixel data
 
-    print("Changing physical palettes...")
-
-    with open(output_path, 'r+b') as tgt_sty_file:
-        
-        ppal_offset = chunk_infos["PPAL"][0]
+            bmp_data = bmp_tile_file.read(data_size)    # get pixel data
+            if len(bmp_data) != data_size:
+                print(f"ERROR: {bmp_tile_path} is truncated")
+                sys.exit(-1)
 
-        for pal_idx, palette in enumerate(palettes_array):
-            #print(f"Palette {pal_idx}: ")
-            for sty_palette_row in range(NUM_COLOURS_PER_PALETTE):
+            tile = np.frombuffer(bmp_data, dtype=np.uint8).reshape(abs(height), row_size)[:, :width]
 
-                tgt_sty_file.seek(ppal_offset + 256*sty_palette_row + 4*pal_idx)
+            # bmp rows are stored bottom-up, unless the height is negative
+            tiles[tile_idx % TILES_PER_PAGE] = tile[::-1] if height > 0 else tile
 
-                #print(f"({palette[sty_palette_row][0]}, {palette[sty_palette_row][1]}, {palette[sty_palette_row][2]})")
-                # (R,G,B) -> B G R A
-                dword = bytes([ palette[sty_palette_row][2], 
-                                palette[sty_palette_row][1], 
-                                palette[sty_palette_row][0], 
-                                0 ])
+    return tiles
 
-                tgt_sty_file.write(dword)
-            #print("")
+def read_tile_bmps(level, palettes, tile_palettes, jobs=1, root_dir=ROOT_DIR):
+    """Read the 64x64 tiles created by psx_create_tiles.py with palettes, top row first."""
+    work_units = [ (level, page, palettes, tile_palettes, root_dir) for page in range(NUM_PAGES) ]
+    with stage("read_tiles", level):
+        return np.concatenate(run_jobs(read_page_tile_bmps, work_units, jobs))
 
+def read_atlas_tiles(level, tile_palettes, root_dir=ROOT_DIR):
+    """Read the 64x64 tiles of the atlas created by psx_create_tiles.py --atlas."""
+    with stage("read_atlas", level):
+        try:
+            tiles, index = read_atlas(level, root_dir)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: can't read the atlas of level {level}: {e}")
+            sys.exit(-1)
 
-def inject_tiles(sty_path, chunk_infos, level):
-    
-    print("Changing tiles...")
+    if index["tile_size"] != 2*TILE_WIDTH or index["num_tiles"] != TOTAL_NUM_TILES:
+        print(f"ERROR: the atlas of level {level} must hold {TOTAL_NUM_TILES} tiles of {2*TILE_WIDTH}x{2*TILE_HEIGHT}")
+        sys.exit(-1)
 
-    with open(sty_path, 'r+b') as tgt_sty_file:
+    # the tiles hold indices into the palettes they were created with
+    if [tile["palette"] for tile in index["tiles"]] != list(tile_palettes):
+        print(f"ERROR: the atlas of level {level} was created with another --packing")
+        sys.exit(-1)
 
-        tile_data_offset = chunk_infos["TILE"][0]
+    return tiles
 
-        for tile_idx in range(TOTAL_NUM_TILES):       #  TODO:  TOTAL_NUM_TILES
-            bmp_tile_path = ROOT_DIR / level / "all_tiles" / f"{level}_{tile_idx}.bmp"
+def read_raw_tile_data(level, tile_palettes, root_dir=ROOT_DIR):
+    """Read the tiles of the raw file created by psx_create_tiles.py --raw, already laid out as TILE data."""
+    with stage("read_raw", level):
+        try:
+            tile_size, raw_tile_palettes, tile_data = read_raw_tiles(level, root_dir)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: can't read the raw tiles of level {level}: {e}")
+            sys.exit(-1)
 
-            if not bmp_tile_path.exists():
-                print(f"ERROR: bmp file of tile {tile_idx} not found.")
-                print("Path: " + str(bmp_tile_path))
-                sys.exit(-1)
+    if tile_size != 2*TILE_WIDTH or len(raw_tile_palettes) != TOTAL_NUM_TILES:
+        print(f"ERROR: the raw tiles of level {level} must be {TOTAL_NUM_TILES} tiles of {2*TILE_WIDTH}x{2*TILE_HEIGHT}")
+        sys.exit(-1)
 
-            with open(bmp_tile_path, 'rb') as bmp_tile_file:
-                signature = bmp_tile_file.read(2).decode('ascii')
+    if raw_tile_palettes != list(tile_palettes):
+        print(f"ERROR: the raw tiles of level {level} were created with another --packing")
+        sys.exit(-1)
 
-                if (signature != "BM"):
-                    print(f"ERROR: The file {bmp_tile_path} is not a bmp file!")
-                    sys.exit(-1)
-                
-                bmp_tile_file.read(8)   # skip some data
-                pixel_data_offset = int.from_bytes(bmp_tile_file.read(4), 'little')
+    return tile_data
 
-                bmp_tile_file.seek(pixel_data_offset)   # go to pixel data
+def read_level_tiles(level, palettes, tile_palettes, tile_source="bmp", jobs=1, root_dir=ROOT_DIR):
+    """Tiles of a level created by psx_create_tiles.py, from its .bmp tiles, atlas or raw file.
+    Raw tiles are returned as TILE data, ready to be written."""
+    if tile_source == "atlas":
+        return read_atlas_tiles(level, tile_palettes, root_dir)
+    if tile_source == "raw":
+        return read_raw_tile_data(level, tile_palettes, root_dir)
+    return read_tile_bmps(level, palettes, tile_palettes, jobs, root_dir)
 
-                # TODO: fix this
-                #data_size = bmp_tile_file.seek(pixel_data_offset, os.SEEK_END)  # get data size
-                data_size = 4096
+def inject_tile_data(sty_data, chunk_infos, tiles):
 
-                bmp_tile_file.seek(pixel_data_offset)
+    print("Changing tiles...")
 
-                bmp_data = bmp_tile_file.read(data_size)    # get pixel data
-                bmp_data_reversed = bmp_data[::-1]          # reverse it
+    # raw tiles are already laid out as TILE data, they are written as they are
+    build_function = build_tile_data if isinstance(tiles, np.ndarray) else build_raw_tile_data
 
-                # now inject it into .sty file
-                for row_idx in range(64):
-                    tgt_sty_file.seek(tile_data_offset + 64*tile_idx + 256*row_idx + 63*256*(tile_idx // 4) )   # get row offset in .sty binary
-                    tgt_sty_file.write(bmp_data_reversed[ (row_idx*64) : (row_idx*64 + 64) ][::-1]) # reverse this piece of the array
-                    
+    with stage("tile_inject"):
+        write_chunk_data(sty_data, chunk_infos, "TILE", build_function, tiles)
 
 
 # TODO:
@@ -345,55 +266,36 @@ def change_surface_types(output_path, chunk_infos, PSX_sty_file_path, game_ovl_f
     return
 
 
-def main():
-    parser = argparse.ArgumentParser(PROGRAM_NAME)
-    parser.add_argument("sty_path")
-    parser.add_argument("level")
-    args = parser.parse_args()
-
-    if not args.sty_path:
+def get_target_sty_path(sty_path_arg):
+    if not sty_path_arg:
         print("Usage: python [program path] [sty path] [level=bil,ste,wil]")
         sys.exit(-1)
 
     # get target .sty path
-    if ("\\" not in args.sty_path and "/" not in args.sty_path):
-        sty_path = ROOT_DIR / args.sty_path
+    if ("\\" not in sty_path_arg and "/" not in sty_path_arg):
+        sty_path = ROOT_DIR / sty_path_arg
     else:
-        sty_path = Path(args.sty_path)
+        sty_path = Path(sty_path_arg)
 
     if not sty_path.exists():
         print(f"File not found: {str(sty_path)}")
         sys.exit(-1)
 
-    if args.level.lower() not in LEVELS:
+    return sty_path
+
+def get_level(level_arg):
+    if level_arg.lower() not in LEVELS:
         print(f"Invalid level. Level can be: bil, ste or wil")
         sys.exit(-1)
 
-    level = args.level.lower()
-
-    all_level_colours = []
-    for page in range(6):   #  page + 1
-        binary_pal_path = ROOT_DIR / level / "b_palettes" / f"{level}_{page+1}_palettes.data"
-        if binary_pal_path.exists():
-                
-            print("Getting colours from file: " + str(binary_pal_path))
-            binary_colours = colours_from_binary(binary_pal_path)
-            rgb_colours = convert_colours_from_15_bits(binary_colours)
-            all_level_colours += rgb_colours
-        else:
-            print("Palette binary files not found")
-            sys.exit(-1)
-
-
-    print(f"Creating palette for level {level.upper()}")
-    palettes_array, tiles_per_palette_array = create_8bits_palettes(all_level_colours)
-
-    #print_all_palettes_used(level, tiles_per_palette_array) # print which palette the tiles uses
+    return level_arg.lower()
 
+def read_target_chunks(sty_path):
     # now read .sty file
     print("Reading target .sty file...\n")
 
-    chunk_infos = detect_headers_and_get_chunks(sty_path)
+    with stage("chunk_scan"):
+        chunk_infos = detect_headers_and_get_chunks(sty_path)
 
     if chunk_infos["PALX"][0] is None:
         print("ERROR: PALX Header is missing in .sty file.")
@@ -407,25 +309,135 @@ def main():
         print("ERROR: TILE Header is missing in .sty file.")
         sys.exit(-1)
 
-    # create a copy of sty file
+    return chunk_infos
+
+def get_output_path(sty_path):
+    # path of the edited copy of the sty file
     str_gmp_path = str(sty_path)
     i = str_gmp_path.rfind('\\') + 1
     j = str_gmp_path.rfind('.')
 
     filename = str_gmp_path[i:j]
-    output_path = ROOT_DIR / f"{filename}_edited.sty"
+    return ROOT_DIR / f"{filename}_edited.sty"
+
+
+def patch_sty_file(output_path, chunk_infos, palettes_array, tile_palettes, tiles):
+    """Write the palettes and tiles of a level into a .sty file, in place.
+    The file is mapped once, all chunks are changed in the mapping, then it is flushed."""
+    with map_sty_file(output_path, writable=True) as sty_data:
+        # change virtual palettes indexes, since the number of tiles with the same palette isn't always 32
+        change_palettes_idx(sty_data, chunk_infos, tile_palettes)
+
+        # change physical palettes
+        change_physical_palettes(sty_data, chunk_infos, palettes_array)
+
+        # change .sty tiles
+        inject_tile_data(sty_data, chunk_infos, tiles)
+
+        sty_data.flush()
+
+def patch_sty_copy(sty_path, output_path, chunk_infos, palettes_array, tile_palettes, tiles):
+    """patch_sty_file on a copy of sty_path, which then replaces output_path in one rename.
+    output_path is either left as it was or fully patched, even if the patching is interrupted."""
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+
+    with stage("copy"):
+        shutil.copyfile(sty_path, tmp_path)
+
+    try:
+        patch_sty_file(tmp_path, chunk_infos, palettes_array, tile_palettes, tiles)
+    except BaseException:   # errors are reported with sys.exit
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    tmp_path.replace(output_path)
+
+def build_palx_palb_chunks(sty_data, chunk_infos, tile_palettes):
+    """{chunk name: new data} of PALX, and of PALB when the tiles need more virtual palettes than it gives
+    them. PALX keeps its size, the virtual palettes of sprites and remaps are moved after the tiles."""
+    offset, size = chunk_infos["PALX"]
+    with get_chunk_view(sty_data, offset, size) as current_data:
+        palx_data = bytes(current_data)
+
+    new_chunks = {}
+    offset, size = chunk_infos["PALB"]
+    if offset is not None:     # without PALB, every virtual palette is a tile one
+        with get_chunk_view(sty_data, offset, size) as current_data:
+            palb_data = bytes(current_data)
+        palette_counts = parse_palb_data(palb_data)
+
+        palx_data, new_counts = grow_tile_palettes(palx_data, palette_counts, len(tile_palettes))
+        if new_counts != palette_counts:
+            new_palb_data = build_palb_data(new_counts)
+            new_chunks["PALB"] = new_palb_data + palb_data[len(new_palb_data):]
+            print(f"Tile virtual palettes grown from {palette_counts[0]} to {new_counts[0]}, "
+                  "the ones of sprites and remaps moved after them")
+
+    new_palx_data = build_palx_chunk_data(palx_data, tile_palettes)
+    new_chunks["PALX"] = new_palx_data + palx_data[len(new_palx_data):]
+    return new_chunks
+
+def rebuild_sty_file(sty_path, output_path, palettes_array, tile_palettes, tiles):
+    """Write a new .sty file in one pass, copying the chunks of sty_path but PALX, PPAL and TILE,
+    which are built from the palettes and tiles of a level. PPAL and TILE are grown if they need
+    more room, PALX keeps its size and PALB gives the tiles more virtual palettes if they need them.
+    The file is written to a temporary file, which then replaces output_path."""
+    tile_build_function = build_tile_data if isinstance(tiles, np.ndarray) else build_raw_tile_data
+
+    # chunk: (size needed, size of the pages it grows by, build function, its data)
+    chunk_builds = {"PPAL": (-(-len(palettes_array) // PALETTES_PER_PAGE)*PALETTE_PAGE_SIZE, PALETTE_PAGE_SIZE,
+                             build_ppal_data, palettes_array),
+                    "TILE": (get_tile_data_size(tiles), TILE_PAGE_SIZE, tile_build_function, tiles)}
+
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    try:
+        with map_sty_file(sty_path) as sty_data:
+            chunk_table = read_chunk_table(sty_data)
+            chunk_infos = get_chunk_infos(chunk_table)
+
+            with stage("build_chunks"):
+                new_chunks = build_palx_palb_chunks(sty_data, chunk_infos, tile_palettes)
+                for chunk_name, (size, page_size, build_function, data) in chunk_builds.items():
+                    offset, current_size = chunk_infos[chunk_name]
+                    with get_chunk_view(sty_data, offset, current_size) as current_data:
+                        new_chunks[chunk_name] = build_grown_chunk_data(current_data, size, page_size, build_function, data)
+
+                    if len(new_chunks[chunk_name]) > current_size:
+                        print(f"{chunk_name} chunk grown from {current_size:,} to {len(new_chunks[chunk_name]):,} bytes")
+
+            with stage("write_sty"), open(tmp_path, 'wb') as out_file:
+                write_sty_file(sty_data, chunk_table, new_chunks, out_file)
+    except (OSError, ValueError) as e:
+        tmp_path.unlink(missing_ok=True)
+        print(f"ERROR: {e}")
+        sys.exit(-1)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
-    print(f"Creating copy of {filename}.gmp")
-    shutil.copyfile(sty_path, output_path)
+    tmp_path.replace(output_path)
 
-    # change virtual palettes indexes, since the number of tiles with the same palette isn't always 32
-    change_palettes_idx(output_path, chunk_infos, tiles_per_palette_array)
+def inject_level(sty_path, level, packing=None, jobs=1, tile_source="bmp", in_place=False, rebuild=False, psx_dir=None):
+    with open_psx_sty(level, psx_dir) as psx_sty:
+        palettes_array, tile_palettes = get_level_palettes(level, packing, tile_source, psx_sty=psx_sty)
 
-    # change physical palettes
-    change_physical_palettes(output_path, chunk_infos, palettes_array)
+    #print_all_palettes_used(level, tile_palettes) # print which palette the tiles uses
 
-    # change .sty tiles
-    inject_tiles(output_path, chunk_infos, level)
+    chunk_infos = read_target_chunks(sty_path)
+    tiles = read_level_tiles(level, palettes_array, tile_palettes, tile_source, jobs)
+
+    if rebuild:
+        output_path = get_output_path(sty_path)
+        print(f"Rebuilding {sty_path.name}")
+        rebuild_sty_file(sty_path, output_path, palettes_array, tile_palettes, tiles)
+    elif in_place:
+        print(f"Changing {sty_path.name} in place")
+        output_path = sty_path
+        patch_sty_file(output_path, chunk_infos, palettes_array, tile_palettes, tiles)
+    else:
+        output_path = get_output_path(sty_path)
+        print(f"Creating copy of {sty_path.name}")
+        patch_sty_copy(sty_path, output_path, chunk_infos, palettes_array, tile_palettes, tiles)
 
     # change surface types
     # load directly from PSX file
@@ -439,6 +451,42 @@ def main():
 
     print("All PSX tiles injected successfully")
 
+def add_arguments(parser):
+    parser.add_argument("sty_path")
+    parser.add_argument("level")
+    parser.add_argument("--packing", choices=PACKING_MODES,
+                        help="packing used to create the tiles, read from the palette plan by default")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of processes reading tiles, 0 uses all cores")
+    tile_sources = parser.add_mutually_exclusive_group()
+    tile_sources.add_argument("--atlas", dest="tile_source", action="store_const", const="atlas", default="bmp",
+                              help="read the tiles from <level>/<level>_atlas.bmp instead of a .bmp per tile")
+    tile_sources.add_argument("--raw", dest="tile_source", action="store_const", const="raw",
+                              help="copy the tiles from <level>/<level>_tiles.raw instead of reading a .bmp per tile")
+    output_modes = parser.add_mutually_exclusive_group()
+    output_modes.add_argument("--in-place", action="store_true",
+                              help="change sty_path itself instead of writing <name>_edited.sty. Skips the copy, "
+                                   "but an interrupted run leaves the file half changed")
+    output_modes.add_argument("--rebuild", action="store_true",
+                              help="write <name>_edited.sty in one pass instead of copying then patching it, "
+                                   "growing PPAL and TILE when the tiles need more room than sty_path has")
+    parser.add_argument("--psx-dir",
+                        help="check the palette plan against (or pack the palettes from) the original BIL.STY, STE.STY "
+                             "or WIL.STY in this folder instead of the .data files, once located with psx_tool.py locate")
+    add_metrics_arguments(parser)
+
+def run(args):
+    sty_path = get_target_sty_path(args.sty_path)
+    level = get_level(args.level)
+
+    run_with_metrics(args, "psx_sty_injector", inject_level, sty_path, level, args.packing, args.jobs,
+                     args.tile_source, args.in_place, args.rebuild, args.psx_dir)
+
+def main():
+    parser = argparse.ArgumentParser(PROGRAM_NAME)
+    add_arguments(parser)
+    run(parser.parse_args())
+
         
 
     
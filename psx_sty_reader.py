@@ -0,0 +1,157 @@
+from pathlib import Path
+from sty_file import map_sty_file
+from psx_decoder import unpack_nibbles, PAGE_SIZE, PAGE_WIDTH, PAGE_HEIGHT, TILES_PER_PAGE, COLOURS_PER_TILE
+from psx_palettes import get_palette_words, convert_colours_from_15_bits, DEFAULT_EXPANSION
+from psx_tiles import get_page_paths
+import contextlib
+import json
+import sys
+
+ROOT_DIR = Path(__file__).parent
+
+LEVELS = ["bil", "ste", "wil"]
+NUM_PAGES = 6
+
+PALETTE_DATA_SIZE = 2*COLOURS_PER_TILE*TILES_PER_PAGE     # 64 palettes of 16 colours, 16 bits each
+
+# offsets of the tile pages and palettes of each level in its original .STY file,
+# found once by psx_tool.py locate from the .data files extracted from it
+LAYOUT_VERSION = 1
+LAYOUT_PATH = ROOT_DIR / "psx_sty_layout.json"
+
+
+def get_psx_sty_path(level, psx_dir):
+    return Path(psx_dir) / f"{level.upper()}.STY"
+
+def find_unique(data, contents):
+    """Offset of the only copy of contents in data, -1 if there's none. Raises ValueError if there are several."""
+    offset = data.find(contents)
+    if offset != -1 and data.find(contents, offset + 1) != -1:
+        raise ValueError("found at several offsets")
+    return offset
+
+def locate_level(level, psx_dir, root_dir=ROOT_DIR):
+    """Layout of the original .STY file of a level: where the contents of each of its
+    b_tiles and b_palettes files are. Raises OSError or ValueError."""
+    sty_path = get_psx_sty_path(level, psx_dir)
+
+    page_offsets = []
+    palette_offsets = []
+    with map_sty_file(sty_path) as data:
+        for page in range(NUM_PAGES):
+            for binary_path, offsets in zip(get_page_paths(level, page, root_dir), (page_offsets, palette_offsets)):
+                with open(binary_path, 'rb') as file:
+                    contents = file.read()
+
+                try:
+                    offset = find_unique(data, contents)
+                except ValueError as e:
+                    raise ValueError(f"{binary_path.name} {e} in {sty_path.name}")
+                if offset == -1:
+                    raise ValueError(f"{binary_path.name} not found in {sty_path.name}")
+                offsets.append(offset)
+
+        sty_size = len(data)
+
+    return dict(file = sty_path.name,
+                size = sty_size,
+                pages = page_offsets,
+                palettes = palette_offsets)
+
+def read_layouts(layout_path=LAYOUT_PATH):
+    """{level: layout} of the levels located so far."""
+    try:
+        with open(layout_path, 'r') as file:
+            layouts = json.load(file)
+    except FileNotFoundError:
+        return {}
+
+    if layouts.get("version") != LAYOUT_VERSION:
+        raise ValueError(f"{layout_path} was written by another version")
+    return layouts["levels"]
+
+def write_layouts(level_layouts, layout_path=LAYOUT_PATH):
+    with open(layout_path, 'w') as file:
+        json.dump(dict(version = LAYOUT_VERSION, levels = level_layouts), file, indent=1)
+
+
+class PsxStyFile:
+    """The original .STY file of a level, memory-mapped. Its tile pages and palettes are read
+    as zero-copy views, release them before closing the file (or use them in with blocks).
+
+    Open it once per level and pass it to the readers. It can be sent to a process pool,
+    each process maps the file again."""
+
+    def __init__(self, level, psx_dir, layout):
+        self.path = get_psx_sty_path(level, psx_dir)
+        self.layout = layout
+        self.data = map_sty_file(self.path)
+
+        sty_size = len(self.data)
+        if sty_size != layout["size"]:
+            self.data.close()
+            raise ValueError(f"{self.path.name} has {sty_size:,} bytes, the one located had {layout['size']:,}")
+
+    def __getstate__(self):
+        return ( self.path, self.layout )
+
+    def __setstate__(self, state):
+        self.path, self.layout = state
+        self.data = map_sty_file(self.path)
+
+    def get_page_data(self, page):
+        """4bpp data of a tile page, as psx_decoder reads it from a b_tiles file."""
+        offset = self.layout["pages"][page]
+        return memoryview(self.data)[offset : offset + PAGE_SIZE]
+
+    def get_palette_data(self, page):
+        """16 colour palettes of the tiles of a page, as stored in a b_palettes file."""
+        offset = self.layout["palettes"][page]
+        return memoryview(self.data)[offset : offset + PALETTE_DATA_SIZE]
+
+    def read_page_indices(self, page):
+        """256x256 colour indices of a page."""
+        with self.get_page_data(page) as page_data:
+            return unpack_nibbles(page_data).reshape(PAGE_HEIGHT, PAGE_WIDTH)
+
+    def read_palette_data(self, page):
+        """Copy of the palette data of a page."""
+        with self.get_palette_data(page) as palette_data:
+            return bytes(palette_data)
+
+    def load_rgb_palettes(self, page, expansion=DEFAULT_EXPANSION):
+        """(tiles, 16, 3) RGB palettes of a page."""
+        with self.get_palette_data(page) as palette_data:
+            return convert_colours_from_15_bits(get_palette_words(palette_data), expansion)
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def open_psx_sty(level, psx_dir, layout_path=LAYOUT_PATH):
+    """PsxStyFile of the original .STY file of a level in psx_dir, to use in a with block.
+    Without psx_dir, the with block gets None: the level is read from its .data files."""
+    if psx_dir is None:
+        return contextlib.nullcontext()
+
+    try:
+        level_layouts = read_layouts(layout_path)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: can't read {layout_path}: {e}")
+        sys.exit(-1)
+
+    if level not in level_layouts:
+        print(f"ERROR: {get_psx_sty_path(level, psx_dir).name} hasn't been located yet. "
+              f"Run psx_tool.py locate {level} --psx-dir [folder] once, with its .data files")
+        sys.exit(-1)
+
+    try:
+        return PsxStyFile(level, psx_dir, level_layouts[level])
+    except (OSError, ValueError) as e:
+        print(f"ERROR: can't read the original .STY file of level {level}: {e}")
+        sys.exit(-1)
@@ -0,0 +1,99 @@
+from pathlib import Path
+from psx_decoder import read_page_data, get_packed_tiles, unpack_nibbles
+from psx_palettes import read_palette_words, get_palette_words
+from psx_tiles import get_page_paths
+from psx_build_cache import hash_bytes
+import sys
+
+ROOT_DIR = Path(__file__).parent
+
+LEVELS = ["bil", "ste", "wil"]
+NUM_PAGES = 6
+
+
+def get_tile_key(packed_tile, palette_words):
+    """Same key for tiles with the same 4bpp pixels and the same 16 colours."""
+    # the leading bit (semi-transparency flag) doesn't change the colour
+    return hash_bytes(packed_tile + (palette_words & 0x7FFF).astype('<u2').tobytes())
+
+def is_blank_tile(packed_tile, palette_words):
+    """True if every pixel of the tile has the same colour."""
+    colours = (palette_words & 0x7FFF)[unpack_nibbles(packed_tile)]
+    return bool((colours == colours[0]).all())
+
+def get_level_tile_keys(level, root_dir=ROOT_DIR, psx_sty=None):
+    """(key of every tile of a level, indices of its blank tiles).
+    With psx_sty, the level is read from its original .STY file opened by open_psx_sty."""
+    keys = []
+    blank_tiles = []
+    for page in range(NUM_PAGES):
+        if psx_sty is not None:
+            with psx_sty.get_page_data(page) as page_data:
+                packed_tiles = get_packed_tiles(page_data)
+            palette_words = get_palette_words(psx_sty.read_palette_data(page))
+        else:
+            b_tile_path, b_pal_path = get_page_paths(level, page, root_dir)
+            for binary_path in (b_tile_path, b_pal_path):
+                if not binary_path.exists():
+                    print("Binary file not found.")
+                    print("File: " + str(binary_path))
+                    sys.exit(-1)
+
+            packed_tiles = get_packed_tiles(read_page_data(b_tile_path))
+            palette_words = read_palette_words(b_pal_path)
+
+        for packed_tile, tile_words in zip(packed_tiles, palette_words):
+            if is_blank_tile(packed_tile, tile_words):
+                blank_tiles.append(len(keys))
+            keys.append(get_tile_key(packed_tile, tile_words))
+    return ( keys, blank_tiles )
+
+def get_duplicate_map(keys):
+    """Index of the first tile with the same key, for every tile. Unique tiles map to themselves.
+    Can be given to create_8bits_palettes, to pack each distinct tile once."""
+    first_tiles = {}
+    return [ first_tiles.setdefault(key, tile_idx) for tile_idx, key in enumerate(keys) ]
+
+def get_duplicate_report(levels=LEVELS, root_dir=ROOT_DIR):
+    report = dict(levels = {}, cross_level = [])
+
+    tile_index = {}     # tile key -> [(level, tile index), ...]
+    for level in levels:
+        keys, blank_tiles = get_level_tile_keys(level, root_dir)
+        duplicate_of = get_duplicate_map(keys)
+
+        duplicates = {}
+        for tile_idx, first_tile in enumerate(duplicate_of):
+            if first_tile != tile_idx:
+                duplicates.setdefault(first_tile, []).append(tile_idx)
+
+        report["levels"][level] = dict(num_tiles = len(keys),
+                                       unique_tiles = len(keys) - sum(len(copies) for copies in duplicates.values()),
+                                       blank_tiles = blank_tiles,
+                                       duplicates = duplicates,         # first tile -> its copies
+                                       duplicate_of = duplicate_of)
+
+        for tile_idx, key in enumerate(keys):
+            tile_index.setdefault(key, []).append( (level, tile_idx) )
+
+    # tiles found in more than one level
+    for tiles in tile_index.values():
+        if len({level for level, _ in tiles}) > 1:
+            report["cross_level"].append(tiles)
+
+    report["num_tiles"] = sum(level_report["num_tiles"] for level_report in report["levels"].values())
+    report["unique_tiles"] = len(tile_index)
+    return report
+
+def print_duplicate_report(report):
+    for level, level_report in report["levels"].items():
+        print(f"{level.upper()}: {level_report['unique_tiles']} unique tiles of {level_report['num_tiles']}, "
+              f"{len(level_report['blank_tiles'])} blank")
+        for first_tile, copies in level_report["duplicates"].items():
+            print(f"  {level}_{first_tile}.bmp repeated as {', '.join(f'{level}_{tile_idx}.bmp' for tile_idx in copies)}")
+
+    print(f"\n{len(report['cross_level'])} tiles found in more than one level")
+    for tiles in report["cross_level"]:
+        print("  " + ", ".join(f"{level}_{tile_idx}.bmp" for level, tile_idx in tiles))
+
+    print(f"\nAll levels: {report['unique_tiles']} unique tiles of {report['num_tiles']}")
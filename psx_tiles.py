@@ -0,0 +1,48 @@
+from pathlib import Path
+from collections import namedtuple
+import numpy as np
+from psx_decoder import read_page_indices, get_tile_indices, TILES_PER_PAGE
+from psx_palettes import load_rgb_palettes, DEFAULT_EXPANSION
+
+ROOT_DIR = Path(__file__).parent
+
+LEVELS = ["bil", "ste", "wil"]
+NUM_PAGES = 6
+
+# indices is a 32x32 view of 4 bits indices, palette a (16,3) view of (r,g,b) colours,
+# both into the arrays of the page, which stay alive as long as the record is kept
+TileRecord = namedtuple("TileRecord", ["level", "index", "page", "indices", "palette"])
+
+
+def get_page_paths(level, page, root_dir=ROOT_DIR):
+    """(b_tiles path, b_palettes path) of a page, counting pages from 0."""
+    return ( root_dir / level / "b_tiles" / f"{level}_{page+1}.data",
+             root_dir / level / "b_palettes" / f"{level}_{page+1}_palettes.data" )
+
+def iter_tiles(level, root_dir=ROOT_DIR, pages=None, expansion=DEFAULT_EXPANSION):
+    """Yield a TileRecord for every tile of a level, in tile order.
+
+    Pages are read one at a time when the first of their tiles is needed, so memory use
+    doesn't grow with the number of tiles. Raises FileNotFoundError if a page is missing."""
+    for page in (range(NUM_PAGES) if pages is None else pages):
+        b_tile_path, b_pal_path = get_page_paths(level, page, root_dir)
+        for binary_path in (b_tile_path, b_pal_path):
+            if not binary_path.exists():
+                raise FileNotFoundError(f"binary file not found: {binary_path}")
+
+        page_indices = read_page_indices(b_tile_path)
+        rgb_colours = load_rgb_palettes(b_pal_path, expansion)
+
+        for tile_idx in range(TILES_PER_PAGE):
+            yield TileRecord(level, page*TILES_PER_PAGE + tile_idx, page,
+                             get_tile_indices(page_indices, tile_idx), rgb_colours[tile_idx])
+
+def apply_tile_palette(tile_indices, tile_colours):
+    """Convert the colour indices of a single tile to RGB, e.g. the indices and palette of a TileRecord."""
+    colours = np.asarray(tile_colours, dtype=np.uint8)     # (16, 3)
+    return colours[tile_indices]
+
+def iter_all_tiles(levels=LEVELS, root_dir=ROOT_DIR, expansion=DEFAULT_EXPANSION):
+    """iter_tiles over several levels, one after another."""
+    for level in levels:
+        yield from iter_tiles(level, root_dir, expansion=expansion)
@@ -0,0 +1,169 @@
+from pathlib import Path
+import importlib
+import argparse
+import sys
+import os
+
+PROGRAM_NAME = os.path.basename(sys.argv[0])
+ROOT_DIR = Path(__file__).parent
+
+LEVELS = ["bil", "ste", "wil"]
+
+# command: (module, function adding its arguments, function running it, help)
+# modules are imported only when their command runs, so short commands don't pay for PIL or numpy
+COMMANDS = {
+    "extract":  ("psx_page_tile_extractor", "add_arguments", "run", "convert the tile pages of all levels to .bmp files"),
+    "create":   ("psx_create_tiles", "add_arguments", "run", "create the 64x64 .bmp tiles of all levels"),
+    "inject":   ("psx_sty_injector", "add_arguments", "run", "inject the tiles of a level into a .sty file"),
+    "batch":    ("psx_batch_injector", "add_arguments", "run", "inject levels into many .sty files listed in a .json manifest"),
+    "watch":    ("psx_watch", "add_arguments", "run", "create the tiles again every time the binary files of levels change"),
+    "chunks":   (__name__, "add_chunks_arguments", "run_chunks", "list the chunks of a .sty file"),
+    "palettes": (__name__, "add_palettes_arguments", "run_palettes", "print the 256 colour palettes of levels"),
+    "duplicates": (__name__, "add_duplicates_arguments", "run_duplicates", "find identical tiles in and across levels"),
+    "locate":   (__name__, "add_locate_arguments", "run_locate", "find the tile pages and palettes of levels in their original PSX .STY files"),
+}
+
+
+def get_levels(level_args):
+    levels = [level.lower() for level in level_args] or LEVELS
+    for level in levels:
+        if level not in LEVELS:
+            print(f"Invalid level {level}. Level can be: bil, ste or wil")
+            sys.exit(-1)
+    return levels
+
+
+#### chunks
+
+def add_chunks_arguments(parser):
+    parser.add_argument("sty_path")
+
+def run_chunks(args):
+    from sty_file import map_sty_file, read_sty_header, read_chunk_table, KNOWN_CHUNKS
+
+    try:
+        with map_sty_file(args.sty_path) as sty_data:
+            signature, version_code = read_sty_header(sty_data)
+            chunk_table = read_chunk_table(sty_data)
+            file_size = len(sty_data)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(-1)
+
+    print(f"{signature} version {version_code}, {file_size:,} bytes")
+    for chunk in chunk_table:
+        known = "" if chunk.name in KNOWN_CHUNKS else " (unknown type)"
+        print(f"{chunk.name}  offset {hex(chunk.offset):>10}  size {chunk.size:>10,}{known}")
+
+
+#### palettes
+
+def add_palettes_arguments(parser):
+    from psx_palette_packer import PACKING_MODES, DEFAULT_PACKING
+
+    parser.add_argument("levels", nargs="*", metavar="level", help="bil, ste or wil, all of them by default")
+    parser.add_argument("--packing", choices=PACKING_MODES, default=DEFAULT_PACKING,
+                        help="how tiles are grouped into 256 colour palettes")
+
+def run_palettes(args):
+    from psx_palette_packer import create_8bits_palettes, print_all_palettes_used, get_packing_stats, print_packing_stats
+    from psx_create_tiles import load_level_colours
+
+    for level in get_levels(args.levels):
+        all_level_colours = load_level_colours(level)
+        _, tile_palettes, _ = create_8bits_palettes(all_level_colours, args.packing)
+
+        print_all_palettes_used(level, tile_palettes)
+        print_packing_stats(level, get_packing_stats(all_level_colours, tile_palettes))
+
+
+#### duplicates
+
+def add_duplicates_arguments(parser):
+    from psx_palette_packer import PACKING_MODES, DEFAULT_PACKING
+
+    parser.add_argument("levels", nargs="*", metavar="level", help="bil, ste or wil, all of them by default")
+    parser.add_argument("--packing", choices=PACKING_MODES, default=DEFAULT_PACKING,
+                        help="packing used to count the palettes needed once duplicates are merged")
+    parser.add_argument("--output", help="also write the report to this .json file")
+
+def run_duplicates(args):
+    from psx_tile_index import get_duplicate_report, print_duplicate_report
+    from psx_palette_packer import create_8bits_palettes
+    from psx_create_tiles import load_level_colours
+    import contextlib
+    import json
+
+    report = get_duplicate_report(get_levels(args.levels))
+    print_duplicate_report(report)
+
+    # how many palettes the packer needs when it packs each distinct tile once
+    print("")
+    for level, level_report in report["levels"].items():
+        with contextlib.redirect_stdout(None):
+            all_level_colours = load_level_colours(level)
+        palettes, _, _ = create_8bits_palettes(all_level_colours, args.packing)
+        merged_palettes, _, _ = create_8bits_palettes(all_level_colours, args.packing, level_report["duplicate_of"])
+        level_report["num_palettes"] = len(palettes)
+        level_report["num_palettes_merged"] = len(merged_palettes)
+        print(f"{level.upper()}: {len(palettes)} palettes, {len(merged_palettes)} with duplicates packed once")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=1)
+
+
+#### locate
+
+def add_locate_arguments(parser):
+    parser.add_argument("levels", nargs="*", metavar="level", help="bil, ste or wil, all of them by default")
+    parser.add_argument("--psx-dir", required=True, help="folder holding the original BIL.STY, STE.STY and WIL.STY")
+
+def run_locate(args):
+    from psx_sty_reader import locate_level, read_layouts, write_layouts, LAYOUT_PATH
+
+    try:
+        level_layouts = read_layouts()
+    except (OSError, ValueError) as e:
+        print(f"ERROR: can't read {LAYOUT_PATH}: {e}")
+        sys.exit(-1)
+
+    for level in get_levels(args.levels):
+        try:
+            level_layouts[level] = layout = locate_level(level, args.psx_dir)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: {e}")
+            sys.exit(-1)
+
+        print(f"{layout['file']}: pages at {', '.join(hex(offset) for offset in layout['pages'])}")
+        print(f"{' ' * len(layout['file'])}  palettes at {', '.join(hex(offset) for offset in layout['palettes'])}")
+
+    write_layouts(level_layouts)
+    print(f"Layouts saved to {LAYOUT_PATH}")
+
+
+def get_command(command):
+    """(function adding the arguments, function running the command) of a command."""
+    module_name, add_arguments_name, run_name, _ = COMMANDS[command]
+    module = importlib.import_module(module_name)
+    return ( getattr(module, add_arguments_name), getattr(module, run_name) )
+
+def main():
+    commands_help = "\n".join(f"  {command:10} {description}" for command, (*_, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(PROGRAM_NAME, formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog="commands:\n" + commands_help)
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument("arguments", nargs=argparse.REMAINDER,
+                        help=f"arguments of the command, see {PROGRAM_NAME} [command] --help")
+    args = parser.parse_args()
+
+    # only the module of the chosen command is imported
+    add_arguments, run = get_command(args.command)
+
+    command_parser = argparse.ArgumentParser(f"{PROGRAM_NAME} {args.command}", description=COMMANDS[args.command][3])
+    add_arguments(command_parser)
+    run(command_parser.parse_args(args.arguments))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+import numpy as np
+from pathlib import Path
+from psx_decoder import (unpack_nibbles, get_packed_tiles, parse_scale, PAGE_SIZE, PAGE_WIDTH, PAGE_HEIGHT, TILES_PER_PAGE,
+                         COLOURS_PER_TILE)
+from psx_palettes import convert_colours_from_15_bits, palettes_to_tuples
+from psx_tiles import get_page_paths
+from psx_palette_packer import create_8bits_palettes, PACKING_MODES, DEFAULT_PACKING
+from psx_create_tiles import (remap_page_tiles, write_tile_bmps, get_tiles_dir, get_tile_bmp_path, get_build_parameters,
+                              save_level_manifest, TILE_SCALE)
+from psx_build_cache import hash_bytes, get_tile_fingerprints, load_manifest, get_changed_tiles, MANIFEST_NAME
+from psx_palette_plan import write_palette_plan
+from psx_sty_injector import get_target_sty_path, get_level, read_target_chunks, get_output_path, patch_sty_copy
+import argparse
+import time
+import sys
+import os
+
+PROGRAM_NAME = os.path.basename(sys.argv[0])
+ROOT_DIR = Path(__file__).parent
+
+LEVELS = ["bil", "ste", "wil"]
+NUM_PAGES = 6
+TOTAL_NUM_TILES = 384
+
+PALETTE_FILE_SIZE = TILES_PER_PAGE * COLOURS_PER_TILE * 2
+
+
+def get_file_stamp(path):
+    """(modification time, size) of a file, or None if it is missing."""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return ( stat.st_mtime_ns, stat.st_size )
+
+def read_binary_file(path, expected_size):
+    with open(path, 'rb') as file:
+        data = file.read()
+
+    # a file still being saved by an editor is usually shorter
+    if len(data) != expected_size:
+        raise ValueError(f"{len(data)} bytes, expected {expected_size}")
+    return data
+
+
+class WarmLevel:
+    """The binary files of a level kept decoded in memory, with its palettes and tiles,
+    so a change of one file only decodes that file and writes the tiles it changes."""
+
+    def __init__(self, level, packing=DEFAULT_PACKING, scale=TILE_SCALE, root_dir=ROOT_DIR):
+        self.level = level
+        self.packing = packing
+        self.scale = scale
+        self.root_dir = root_dir
+
+        self.stamps = {}                            # path -> file stamp when it was last read
+        self.inputs = {}                            # file name -> hash, as in the manifest
+        self.packed_tiles = [None] * NUM_PAGES      # 4bpp bytes of the 64 tiles of each page
+        self.page_indices = [None] * NUM_PAGES      # 256x256 indices of each page
+        self.page_colours = [None] * NUM_PAGES      # (r,g,b) tuples of the 16 colours of each tile of each page
+        self.page_tiles = [None] * NUM_PAGES        # output tiles of each page, as 8 bits indices
+
+        self.palettes = None
+        self.tile_palettes = None
+        self.remap_tables = None
+        self.fingerprints = None
+
+        tiles_dir = get_tiles_dir(level, root_dir, scale)
+        tiles_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = tiles_dir / MANIFEST_NAME
+        self.out_paths = [get_tile_bmp_path(level, tile_idx, root_dir, scale) for tile_idx in range(TOTAL_NUM_TILES)]
+
+    def read_tile_page(self, page, path):
+        data = read_binary_file(path, PAGE_SIZE)
+        self.inputs[path.name] = hash_bytes(data)
+        self.packed_tiles[page] = get_packed_tiles(data)
+        self.page_indices[page] = unpack_nibbles(data).reshape(PAGE_HEIGHT, PAGE_WIDTH)
+
+    def read_palette_page(self, page, path):
+        data = read_binary_file(path, PALETTE_FILE_SIZE)
+        self.inputs[path.name] = hash_bytes(data)
+        words = np.frombuffer(data, dtype='<u2').reshape(TILES_PER_PAGE, COLOURS_PER_TILE)
+        self.page_colours[page] = palettes_to_tuples(convert_colours_from_15_bits(words))
+
+    def get_changed_files(self):
+        """[(page, path, read function)] of the files changed since they were last read."""
+        changed_files = []
+        for page in range(NUM_PAGES):
+            b_tile_path, b_pal_path = get_page_paths(self.level, page, self.root_dir)
+            for path, read_function in ((b_tile_path, self.read_tile_page), (b_pal_path, self.read_palette_page)):
+                if get_file_stamp(path) != self.stamps.get(path):
+                    changed_files.append( (page, path, read_function) )
+        return changed_files
+
+    def load(self):
+        """Read every binary file of the level, then write the tiles changed since the last build."""
+        for page, path, read_function in self.get_changed_files():
+            self.stamps[path] = get_file_stamp(path)
+            try:
+                read_function(page, path)
+            except (OSError, ValueError) as e:
+                print(f"ERROR: can't read {path}: {e}")
+                sys.exit(-1)
+
+        manifest = load_manifest(self.manifest_path)
+        return self.build(lambda fingerprints: get_changed_tiles(manifest, get_build_parameters(self.packing, self.scale),
+                                                                 fingerprints, self.out_paths))
+
+    def update(self):
+        """Read again the files changed since the last call and write the tiles they change.
+        Returns the number of tiles written, or None if no file content changed."""
+        changed_inputs = False
+        for page, path, read_function in self.get_changed_files():
+            # a file which can't be read is read again only once it changes, until then its last version is kept
+            self.stamps[path] = get_file_stamp(path)
+            old_hash = self.inputs.get(path.name)
+            try:
+                read_function(page, path)
+            except (OSError, ValueError) as e:
+                print(f"{self.level.upper()}: can't read {path.name} ({e}), keeping its last version")
+                continue
+            changed_inputs |= self.inputs[path.name] != old_hash
+
+        if not changed_inputs:
+            return None
+
+        old_fingerprints = self.fingerprints
+        return self.build(lambda fingerprints: [ tile_idx for tile_idx, fingerprint in enumerate(fingerprints)
+                                                 if fingerprint != old_fingerprints[tile_idx] ])
+
+    def build(self, get_tiles_to_write):
+        # packing all the tiles of a level takes a few milliseconds, the palettes are packed again whatever changed
+        all_level_colours = [ colours for page_colours in self.page_colours for colours in page_colours ]
+        self.palettes, self.tile_palettes, self.remap_tables = create_8bits_palettes(all_level_colours, self.packing)
+
+        all_packed_tiles = [ packed_tile for page_tiles in self.packed_tiles for packed_tile in page_tiles ]
+        fingerprints = get_tile_fingerprints(all_packed_tiles, self.palettes, self.tile_palettes, self.remap_tables)
+        tiles_to_write = set(get_tiles_to_write(fingerprints))
+        self.fingerprints = fingerprints
+
+        for page in range(NUM_PAGES):
+            page_tiles = { tile_idx for tile_idx in tiles_to_write if tile_idx // TILES_PER_PAGE == page }
+            if page_tiles or self.page_tiles[page] is None:
+                self.page_tiles[page] = remap_page_tiles(self.page_indices[page], page, self.remap_tables, self.scale)
+            if page_tiles:
+                write_tile_bmps(self.level, self.page_tiles[page], self.palettes, self.tile_palettes,
+                                page*TILES_PER_PAGE, page_tiles, self.root_dir, self.scale)
+
+        save_level_manifest(self.level, dict(self.inputs), self.packing, self.tile_palettes, fingerprints,
+                            self.root_dir, self.scale)
+        if self.scale == TILE_SCALE:
+            source_hashes = [ self.inputs[get_page_paths(self.level, page, self.root_dir)[1].name] for page in range(NUM_PAGES) ]
+            write_palette_plan(self.level, self.packing, self.palettes, self.tile_palettes, self.remap_tables,
+                               source_hashes, self.root_dir)
+        return len(tiles_to_write)
+
+    def get_tiles(self):
+        return np.concatenate(self.page_tiles)
+
+
+def patch_targets(warm_level, targets):
+    for sty_path, output_path, chunk_infos in targets:
+        patch_sty_copy(sty_path, output_path, chunk_infos, warm_level.palettes, warm_level.tile_palettes,
+                       warm_level.get_tiles())
+        print(f"{warm_level.level.upper()}: {output_path} patched")
+
+def watch_levels(levels, packing=DEFAULT_PACKING, scale=TILE_SCALE, sty_targets=(), interval=0.2):
+    """Build the tiles of levels, then build them again every time their binary files change,
+    patching .sty files with them if any are given as (sty path, level)."""
+    level_targets = { level: [] for level in levels }
+    for sty_path, level in sty_targets:
+        level_targets.setdefault(level, []).append( (sty_path, get_output_path(sty_path), read_target_chunks(sty_path)) )
+
+    warm_levels = []
+    for level in level_targets:
+        warm_level = WarmLevel(level, packing, scale)
+        num_tiles = warm_level.load()
+        print(f"{level.upper()}: {num_tiles} of {TOTAL_NUM_TILES} tiles written")
+        patch_targets(warm_level, level_targets[level])
+        warm_levels.append(warm_level)
+
+    print(f"\nWatching the binary files of levels {', '.join(level_targets).upper()}, press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(interval)
+            for warm_level in warm_levels:
+                start_time = time.perf_counter()
+                num_tiles = warm_level.update()
+                if num_tiles is None:
+                    continue
+
+                patch_targets(warm_level, level_targets[warm_level.level])
+                print(f"{warm_level.level.upper()}: {num_tiles} tiles written in {time.perf_counter() - start_time:.2f}s")
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+
+
+def add_arguments(parser):
+    parser.add_argument("levels", nargs="*", metavar="level", help="bil, ste or wil, all of them by default")
+    parser.add_argument("--packing", choices=PACKING_MODES, default=DEFAULT_PACKING,
+                        help="how tiles are grouped into 256 colour palettes")
+    parser.add_argument("--scale", type=parse_scale, default=TILE_SCALE,
+                        help="tiles are 32x32 times this, only 2 (64x64) can be injected")
+    parser.add_argument("--inject", nargs=2, action="append", default=[], metavar=("STY_PATH", "LEVEL"),
+                        help="also patch <name>_edited.sty from this .sty file on every change of the level. "
+                             "Can be given several times")
+    parser.add_argument("--interval", type=float, default=0.2,
+                        help="seconds between two checks of the binary files")
+
+def run(args):
+    levels = [get_level(level) for level in args.levels] or LEVELS
+    sty_targets = [ (get_target_sty_path(sty_path), get_level(level)) for sty_path, level in args.inject ]
+
+    if sty_targets and args.scale != TILE_SCALE:
+        print(f"ERROR: only tiles of scale {TILE_SCALE} can be injected")
+        sys.exit(-1)
+
+    watch_levels(levels, args.packing, args.scale, sty_targets, args.interval)
+
+def main():
+    parser = argparse.ArgumentParser(PROGRAM_NAME)
+    add_arguments(parser)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,3 @@
 @echo off
-python psx_tile_extractor.py
+python psx_tool.py extract
 pause
@@ -1,3 +1,3 @@
 @echo off
-python psx_create_tiles.py
+python psx_tool.py create
 pause
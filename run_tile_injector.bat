@@ -1,3 +1,3 @@
 @echo off
-python psx_sty_injector.py psx_ste.sty ste
+python psx_tool.py inject psx_ste.sty ste
 pause
@@ -0,0 +1,234 @@
+from collections import namedtuple
+import mmap
+import struct
+
+STY_SIGNATURE = b"GBST"
+STY_HEADER_SIZE = 6         # signature + version code
+CHUNK_HEADER_SIZE = 8       # type + size
+
+KNOWN_CHUNKS = ("PALX", "PPAL", "PALB", "TILE", "SPRG", "SPRX", "SPRB", "DELS",
+                "DELX", "FONB", "CARI", "OBJI", "PSXT", "RECY", "SPEC")
+
+# offset is where the chunk data starts, after its header
+StyChunk = namedtuple("StyChunk", ["name", "offset", "size"])
+
+
+def map_sty_file(sty_path, writable=False):
+    """Memory-map a whole .sty file. Close the returned mmap when done (or use it in a with block)."""
+    with open(sty_path, 'r+b' if writable else 'rb') as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+
+def read_sty_header(data):
+    """(signature, version code) of a .sty file."""
+    if len(data) < STY_HEADER_SIZE or data[:4] != STY_SIGNATURE:
+        raise ValueError("not a sty file, GBST signature is missing")
+
+    version_code, = struct.unpack_from('<H', data, 4)
+    return ( STY_SIGNATURE.decode('ascii'), version_code )
+
+def read_chunk_table(data):
+    """List every chunk of a .sty file, known or not, in file order.
+    Only the chunk headers are read."""
+    read_sty_header(data)
+
+    chunks = []
+    size = len(data)
+    current_offset = STY_HEADER_SIZE
+
+    while (current_offset < size):
+        if current_offset + CHUNK_HEADER_SIZE > size:
+            raise ValueError(f"truncated chunk header at offset {hex(current_offset)}")
+
+        chunk_type, chunk_size = struct.unpack_from('<4sI', data, current_offset)
+        data_offset = current_offset + CHUNK_HEADER_SIZE
+
+        if data_offset + chunk_size > size:
+            raise ValueError(f"chunk {chunk_type.decode('latin-1')} at offset {hex(current_offset)} "
+                             f"goes past the end of the file")
+
+        chunks.append(StyChunk(chunk_type.decode('latin-1'), data_offset, chunk_size))
+        current_offset = data_offset + chunk_size
+
+    return chunks
+
+def get_chunk_infos(chunk_table):
+    """{chunk name: [data offset, size]} of the first chunk of each type.
+    Known chunk types which are missing are set to [None, None]."""
+    chunk_infos = {name: [None, None] for name in KNOWN_CHUNKS}
+
+    for chunk in chunk_table:
+        if chunk_infos.get(chunk.name, [None])[0] is None:
+            chunk_infos[chunk.name] = [chunk.offset, chunk.size]
+
+    return chunk_infos
+
+def get_chunk_view(data, offset, size):
+    """Zero-copy view of the data of a chunk. Release it before closing the mmap."""
+    return memoryview(data)[offset : offset + size]
+
+
+#### chunk layouts
+
+# numpy is imported by the builders only, so reading the chunk table starts fast
+
+PALETTE_SIZE = 256                          # colours
+PALETTES_PER_PAGE = 64
+PALETTE_PAGE_SIZE = 4*PALETTE_SIZE*PALETTES_PER_PAGE     # 64 KB, BGRA colours
+
+TILE_SIZE = 64                              # 64x64 pixels, 8 bits
+TILES_PER_PAGE_ROW = 4
+TILE_GROUP_SIZE = TILE_SIZE*TILE_SIZE*TILES_PER_PAGE_ROW  # 4 tiles side by side
+TILE_PAGE_SIZE = 4*TILE_GROUP_SIZE                        # 64 KB, 4 rows of 4 tiles
+
+# PALB counts the virtual palettes of each type, in this order. In PALX, the virtual palettes of a type
+# follow the ones of the previous type: tile n uses virtual palette n, sprites start after the tiles...
+PALETTE_BASE_TYPES = ("tile", "sprite", "car_remap", "ped_remap", "code_obj_remap", "map_obj_remap",
+                      "user_remap", "font_remap")
+
+def build_palx_data(tile_palettes):
+    """PALX data: the physical palette of every tile, as 16 bits words."""
+    import numpy as np
+    return np.asarray(tile_palettes, dtype='<u2').tobytes()
+
+def parse_palb_data(data):
+    """Number of virtual palettes of each of PALETTE_BASE_TYPES."""
+    return list(struct.unpack_from(f'<{len(PALETTE_BASE_TYPES)}H', data))
+
+def build_palb_data(palette_counts):
+    return struct.pack(f'<{len(PALETTE_BASE_TYPES)}H', *palette_counts)
+
+def grow_tile_palettes(palx_data, palette_counts, num_tiles):
+    """(PALX data, PALB counts) with virtual palettes for num_tiles tiles. When the tiles need more
+    than they have, the virtual palettes of the other types are moved after them: PALX keeps its size."""
+    import numpy as np
+    num_tile_palettes = palette_counts[0]
+    if num_tiles <= num_tile_palettes:
+        return ( bytes(palx_data), list(palette_counts) )
+
+    words = np.frombuffer(palx_data, dtype='<u2').copy()
+    shift = num_tiles - num_tile_palettes
+    num_used = sum(palette_counts)
+    if num_used + shift > len(words):
+        raise ValueError(f"PALX chunk has room for {len(words)} virtual palettes, "
+                         f"{num_used + shift} needed for {num_tiles} tiles")
+
+    words[num_tiles : num_used + shift] = words[num_tile_palettes : num_used].copy()
+    words[num_tile_palettes : num_tiles] = 0
+    return ( words.tobytes(), [num_tiles] + list(palette_counts[1:]) )
+
+def build_ppal_data(current_data, palettes):
+    """PPAL data holding the given (r,g,b) palettes, starting from the first one.
+
+    Palettes are stored in 64 KB pages of 64 palettes, row by row: row n of a page holds
+    colour n of each of its 64 palettes. Only the pages which hold the new palettes are
+    returned, the rest of current_data is kept in them."""
+    import numpy as np
+    num_pages = -(-len(palettes) // PALETTES_PER_PAGE)
+    size = num_pages*PALETTE_PAGE_SIZE
+    if len(current_data) < size:
+        raise ValueError(f"PPAL chunk has room for {len(current_data) // (4*PALETTE_SIZE)} palettes, "
+                         f"{len(palettes)} needed")
+
+    # [page, colour, palette, BGRA]
+    data = np.frombuffer(current_data, dtype=np.uint8, count=size).reshape(
+                num_pages, PALETTE_SIZE, PALETTES_PER_PAGE, 4).copy()
+
+    for pal_idx, palette in enumerate(palettes):
+        rgb = np.asarray(palette, dtype=np.uint8)
+        page_colours = data[pal_idx // PALETTES_PER_PAGE, :, pal_idx % PALETTES_PER_PAGE]
+        page_colours[:, 0:3] = rgb[:, ::-1]     # (R,G,B) -> B G R A
+        page_colours[:, 3] = 0
+
+    return data.tobytes()
+
+def layout_tile_data(tiles):
+    """The given tiles laid out as TILE data, 4 tiles side by side. An incomplete last group
+    is padded with zeros."""
+    import numpy as np
+
+    num_tiles, tile_size, _ = tiles.shape
+    num_groups = -(-num_tiles // TILES_PER_PAGE_ROW)
+
+    grid = np.zeros((num_groups*TILES_PER_PAGE_ROW, tile_size, tile_size), dtype=np.uint8)
+    grid[:num_tiles] = tiles
+    # [group, tile in group, tile row, tile column] -> [group, tile row, tile in group, tile column]
+    return grid.reshape(num_groups, TILES_PER_PAGE_ROW, tile_size, tile_size).swapaxes(1, 2).tobytes()
+
+def build_raw_tile_data(current_data, tile_data):
+    """TILE data from tiles already laid out by layout_tile_data, written as they are."""
+    if len(tile_data) > len(current_data):
+        raise ValueError(f"TILE chunk has room for {len(current_data) // (TILE_SIZE*TILE_SIZE)} tiles, "
+                         f"{len(tile_data) // (TILE_SIZE*TILE_SIZE)} needed")
+    return tile_data
+
+def build_tile_data(current_data, tiles):
+    """TILE data holding the given 64x64 tiles, starting from the first one.
+
+    Tiles are stored in pages 4 tiles wide, so each 256 bytes row holds a row of 4 tiles.
+    Only the tile rows which hold the new tiles are returned."""
+    import numpy as np
+    num_groups = -(-len(tiles) // TILES_PER_PAGE_ROW)
+    size = num_groups*TILE_GROUP_SIZE
+    if len(current_data) < size:
+        raise ValueError(f"TILE chunk has room for {len(current_data) // (TILE_SIZE*TILE_SIZE)} tiles, "
+                         f"{len(tiles)} needed")
+
+    # [group, tile row, tile in group, tile column]
+    data = np.frombuffer(current_data, dtype=np.uint8, count=size).reshape(
+                num_groups, TILE_SIZE, TILES_PER_PAGE_ROW, TILE_SIZE).copy()
+
+    for tile_idx, tile in enumerate(tiles):
+        data[tile_idx // TILES_PER_PAGE_ROW, :, tile_idx % TILES_PER_PAGE_ROW] = tile
+
+    return data.tobytes()
+
+def get_tile_data_size(tiles):
+    """Size of the TILE data needed by tiles, or by tiles already laid out by layout_tile_data."""
+    if isinstance(tiles, (bytes, bytearray, memoryview)):
+        return len(tiles)
+    return -(-len(tiles) // TILES_PER_PAGE_ROW)*TILE_GROUP_SIZE
+
+def build_grown_chunk_data(current_data, size, page_size, build_function, *args):
+    """Whole new data of a chunk: current_data grown with zeros, in whole pages, until it holds
+    size bytes, then its start rebuilt by build_function."""
+    if len(current_data) < size:
+        current_data = bytes(current_data) + bytes(-(-size // page_size)*page_size - len(current_data))
+
+    new_data = build_function(current_data, *args)
+    return new_data + bytes(current_data[len(new_data):])
+
+
+#### writing
+
+COPY_BLOCK_SIZE = 1 << 20       # 1 MB
+
+
+def copy_sty_range(data, start, end, out_file):
+    with memoryview(data) as view:
+        for block_start in range(start, end, COPY_BLOCK_SIZE):
+            out_file.write(view[block_start : min(block_start + COPY_BLOCK_SIZE, end)])
+
+def write_sty_file(data, chunk_table, new_chunks, out_file):
+    """Write a whole .sty file in one sequential pass: the header and chunks of data, in order, except
+    the first chunk of each type in new_chunks ({chunk name: new data}), written with its new size.
+
+    Runs of unchanged chunks are copied as they are, in large blocks."""
+    missing_chunks = new_chunks.keys() - {chunk.name for chunk in chunk_table}
+    if missing_chunks:
+        raise ValueError(f"chunks {', '.join(sorted(missing_chunks))} not found")
+
+    copy_start = 0      # start of the data still to copy, the header is copied with the first chunks
+    replaced_chunks = set()
+    for chunk in chunk_table:
+        if chunk.name not in new_chunks or chunk.name in replaced_chunks:
+            continue
+        replaced_chunks.add(chunk.name)
+
+        copy_sty_range(data, copy_start, chunk.offset - CHUNK_HEADER_SIZE, out_file)
+
+        chunk_data = new_chunks[chunk.name]
+        out_file.write(struct.pack('<4sI', chunk.name.encode('latin-1'), len(chunk_data)))
+        out_file.write(chunk_data)
+        copy_start = chunk.offset + chunk.size
+
+    copy_sty_range(data, copy_start, len(data), out_file)
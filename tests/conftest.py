@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the modules of the tools are at the root of the repository
+sys.path.insert(0, str(Path(__file__).parent.parent))
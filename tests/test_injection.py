@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from psx_benchmark import write_synthetic_level, write_synthetic_sty
+from psx_palette_packer import create_8bits_palettes
+from psx_create_tiles import load_level_colours, create_level_tiles, write_tile_bmps
+from psx_atlas import build_atlas, split_atlas, write_atlas
+from psx_raw_tiles import write_raw_tiles
+from psx_sty_injector import (read_target_chunks, read_tile_bmps, read_atlas_tiles, read_raw_tile_data,
+                              patch_sty_copy, rebuild_sty_file)
+from sty_file import map_sty_file, read_chunk_table, get_chunk_infos
+
+LEVEL = "bench"
+
+
+@pytest.fixture(scope="module")
+def level(tmp_path_factory):
+    """(root dir, palettes, tile_palettes, tiles) of a synthetic level, with its .bmp tiles, atlas and raw file."""
+    root_dir = tmp_path_factory.mktemp("level")
+    write_synthetic_level(root_dir, LEVEL)
+
+    palettes, tile_palettes, remap_tables = create_8bits_palettes(load_level_colours(LEVEL, root_dir), "first_fit")
+    tiles = create_level_tiles(LEVEL, remap_tables, root_dir=root_dir)
+
+    write_tile_bmps(LEVEL, tiles, palettes, tile_palettes, root_dir=root_dir)
+    write_atlas(LEVEL, tiles, palettes, tile_palettes, root_dir=root_dir)
+    write_raw_tiles(LEVEL, tiles, tile_palettes, root_dir=root_dir)
+    return ( root_dir, palettes, tile_palettes, tiles )
+
+def read_file(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+def test_atlas_round_trip():
+    tiles = np.random.default_rng(0).integers(0, 256, (37, 8, 8), dtype=np.uint8)
+    atlas = build_atlas(tiles, tiles_per_row=5)
+
+    assert atlas.shape == (8*8, 5*8)
+    assert np.array_equal(atlas[8:16, 16:24], tiles[7])
+    assert np.array_equal(split_atlas(atlas, len(tiles), 8, tiles_per_row=5), tiles)
+    with pytest.raises(ValueError):
+        split_atlas(atlas, 41, 8, tiles_per_row=5)
+
+def test_injection_paths_match(level, tmp_path):
+    root_dir, palettes, tile_palettes, tiles = level
+    sty_path = tmp_path / "synthetic.sty"
+    write_synthetic_sty(sty_path)
+    chunk_infos = read_target_chunks(sty_path)
+
+    tile_sources = {"bmp": read_tile_bmps(LEVEL, palettes, tile_palettes, root_dir=root_dir),
+                    "atlas": read_atlas_tiles(LEVEL, tile_palettes, root_dir),
+                    "raw": read_raw_tile_data(LEVEL, tile_palettes, root_dir)}
+    assert (tile_sources["bmp"] == tiles).all()
+    assert (tile_sources["atlas"] == tiles).all()
+
+    outputs = {}
+    for name, source_tiles in tile_sources.items():
+        outputs[f"patch_{name}"] = tmp_path / f"patch_{name}.sty"
+        patch_sty_copy(sty_path, outputs[f"patch_{name}"], chunk_infos, palettes, tile_palettes, source_tiles)
+        outputs[f"rebuild_{name}"] = tmp_path / f"rebuild_{name}.sty"
+        rebuild_sty_file(sty_path, outputs[f"rebuild_{name}"], palettes, tile_palettes, source_tiles)
+
+    expected = read_file(outputs["patch_bmp"])
+    assert expected != read_file(sty_path)
+    for name, output_path in outputs.items():
+        assert read_file(output_path) == expected, name
+
+def test_rebuild_grows_tile(level, tmp_path):
+    root_dir, palettes, tile_palettes, tiles = level
+    full_path = tmp_path / "full.sty"
+    small_path = tmp_path / "small.sty"
+    write_synthetic_sty(full_path)
+    write_synthetic_sty(small_path, num_tiles=100)
+
+    patch_sty_copy(full_path, tmp_path / "patched.sty", read_target_chunks(full_path), palettes, tile_palettes, tiles)
+    rebuild_sty_file(small_path, tmp_path / "rebuilt.sty", palettes, tile_palettes, tiles)
+
+    chunks = []
+    for path in (tmp_path / "patched.sty", tmp_path / "rebuilt.sty"):
+        with map_sty_file(path) as sty_data:
+            chunk_infos = get_chunk_infos(read_chunk_table(sty_data))
+            chunks.append({ name: bytes(sty_data[offset : offset + size])
+                            for name, (offset, size) in chunk_infos.items() if offset is not None })
+
+    assert chunks[0]["TILE"] == chunks[1]["TILE"]
+    assert chunks[0]["PPAL"] == chunks[1]["PPAL"]
+    assert chunks[1]["PALX"][:2*len(tile_palettes)] == chunks[0]["PALX"][:2*len(tile_palettes)]
+
+@pytest.mark.parametrize("contents", [None, b"", b"GBST"])
+def test_unreadable_target(tmp_path, capsys, contents):
+    sty_path = tmp_path / "target.sty"
+    if contents is not None:
+        sty_path.write_bytes(contents)
+
+    # missing, empty and truncated files are reported the same way
+    with pytest.raises(SystemExit):
+        read_target_chunks(sty_path)
+    assert "is not a valid sty file" in capsys.readouterr().out
+
+def test_tiles_of_another_packing(level):
+    root_dir, palettes, tile_palettes, tiles = level
+    other_tile_palettes = [palette_idx + 1 for palette_idx in tile_palettes]
+    with pytest.raises(SystemExit):
+        read_atlas_tiles(LEVEL, other_tile_palettes, root_dir)
+    with pytest.raises(SystemExit):
+        read_raw_tile_data(LEVEL, other_tile_palettes, root_dir)
+    with pytest.raises(SystemExit):
+        read_tile_bmps(LEVEL, palettes, other_tile_palettes, root_dir=root_dir)
+
+def test_failed_patch_keeps_the_output(level, tmp_path):
+    root_dir, palettes, tile_palettes, tiles = level
+    sty_path = tmp_path / "small.sty"
+    write_synthetic_sty(sty_path, num_tiles=100)     # no room for the tiles of the level
+    output_path = tmp_path / "small_edited.sty"
+    output_path.write_bytes(b"previous output")
+
+    with pytest.raises(SystemExit):
+        patch_sty_copy(sty_path, output_path, read_target_chunks(sty_path), palettes, tile_palettes, tiles)
+
+    assert read_file(output_path) == b"previous output"
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["small.sty", "small_edited.sty"]
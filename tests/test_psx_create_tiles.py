@@ -0,0 +1,136 @@
+import shutil
+import numpy as np
+import pytest
+from psx_create_tiles import (load_level_colours, plan_level_build, write_page_tiles, copy_identical_tiles, get_tile_bmp_path,
+                              save_level_manifest, NUM_PAGES)
+from psx_decoder import PAGE_SIZE
+from psx_palette_packer import create_8bits_palettes
+from psx_tile_index import get_level_tile_keys, get_duplicate_map
+from psx_tiles import get_page_paths
+from psx_pipeline import convert_and_inject
+from psx_benchmark import write_synthetic_sty
+
+LEVEL = "lvl"
+
+
+@pytest.fixture
+def root_dir(tmp_path):
+    rng = np.random.default_rng(0)
+    for sub_dir in ("b_tiles", "b_palettes", "all_tiles"):
+        (tmp_path / LEVEL / sub_dir).mkdir(parents=True)
+    for page in range(NUM_PAGES):
+        (tmp_path / LEVEL / "b_tiles" / f"{LEVEL}_{page+1}.data").write_bytes(
+            rng.integers(0, 256, PAGE_SIZE, dtype=np.uint8).tobytes())
+        (tmp_path / LEVEL / "b_palettes" / f"{LEVEL}_{page+1}_palettes.data").write_bytes(
+            rng.integers(0, 512, 64*16, dtype='<u2').tobytes())
+
+    return tmp_path
+
+def build_level(root_dir, packing="first_fit", force=False):
+    """Build the tiles of the level as main() does, and return the indices of the tiles written."""
+    palettes, tile_palettes, remap_tables = create_8bits_palettes(load_level_colours(LEVEL, root_dir), packing)
+    work_units, copies, new_manifest = plan_level_build(LEVEL, palettes, tile_palettes, remap_tables, packing, force,
+                                                        root_dir)
+    for work_unit in work_units:
+        write_page_tiles(*work_unit)
+    copy_identical_tiles(copies)
+    save_level_manifest(*new_manifest)
+
+    written_tiles = [ tile_idx for work_unit in work_units for tile_idx in work_unit[5] ]
+    copied_tiles = [ int(out_path.stem.split("_")[-1]) for _, out_path in copies ]
+    return sorted(written_tiles + copied_tiles)
+
+def read_tile_bmps(root_dir):
+    return [get_tile_bmp_path(LEVEL, tile_idx, root_dir).read_bytes() for tile_idx in range(64*NUM_PAGES)]
+
+
+def test_unchanged_tiles_are_skipped(root_dir):
+    assert build_level(root_dir) == list(range(64*NUM_PAGES))
+    assert build_level(root_dir) == []
+
+def test_force_and_parameters_write_every_tile(root_dir):
+    build_level(root_dir)
+    assert build_level(root_dir, force=True) == list(range(64*NUM_PAGES))
+    assert build_level(root_dir, packing="grouped") == list(range(64*NUM_PAGES))
+
+def test_changed_and_missing_tiles_are_written(root_dir):
+    build_level(root_dir)
+
+    get_tile_bmp_path(LEVEL, 5, root_dir).unlink()
+    b_tile_path = root_dir / LEVEL / "b_tiles" / f"{LEVEL}_3.data"
+    data = bytearray(b_tile_path.read_bytes())
+    data[0] ^= 0xFF     # first pixels of tile 0 of the page
+    b_tile_path.write_bytes(data)
+
+    assert build_level(root_dir) == [5, 128]
+
+    # same tiles as a full build
+    tile_bmps = read_tile_bmps(root_dir)
+    build_level(root_dir, force=True)
+    assert read_tile_bmps(root_dir) == tile_bmps
+
+def test_pipeline_bmps_are_known_to_the_next_build(root_dir):
+    sty_path = root_dir / "target.sty"
+    write_synthetic_sty(sty_path)
+    build_level(root_dir)
+
+    # the pipeline writes tiles for other palettes, then the palettes are put back as they were
+    b_pal_path = root_dir / LEVEL / "b_palettes" / f"{LEVEL}_3_palettes.data"
+    palette_data = b_pal_path.read_bytes()
+    b_pal_path.write_bytes(bytes(len(palette_data)))
+    convert_and_inject(sty_path, LEVEL, "first_fit", write_bmps=True, root_dir=root_dir)
+    assert build_level(root_dir) == []
+
+    b_pal_path.write_bytes(palette_data)
+    assert build_level(root_dir) != []
+
+    # same tiles as a full build
+    tile_bmps = read_tile_bmps(root_dir)
+    build_level(root_dir, force=True)
+    assert read_tile_bmps(root_dir) == tile_bmps
+
+def test_duplicate_tiles_are_packed_and_written_once(root_dir):
+    # page 2 repeats page 1
+    for path_1, path_2 in zip(get_page_paths(LEVEL, 0, root_dir), get_page_paths(LEVEL, 1, root_dir)):
+        path_2.write_bytes(path_1.read_bytes())
+    all_level_colours = load_level_colours(LEVEL, root_dir)
+
+    # packed as they are, the repeated tiles get other palettes and are written again
+    palettes, tile_palettes, remap_tables = create_8bits_palettes(all_level_colours, "first_fit")
+    assert plan_level_build(LEVEL, palettes, tile_palettes, remap_tables, "first_fit", root_dir=root_dir)[1] == []
+
+    duplicate_of = get_duplicate_map(get_level_tile_keys(LEVEL, root_dir)[0])
+    palettes, tile_palettes, remap_tables = create_8bits_palettes(all_level_colours, "first_fit", duplicate_of)
+    assert tile_palettes[64:128] == tile_palettes[:64]
+    assert np.array_equal(remap_tables[64:128], remap_tables[:64])
+
+    work_units, copies, _ = plan_level_build(LEVEL, palettes, tile_palettes, remap_tables, "first_fit", root_dir=root_dir)
+    assert [work_unit[1] for work_unit in work_units] == [0, 2, 3, 4, 5]
+    assert copies == [ (get_tile_bmp_path(LEVEL, tile_idx, root_dir), get_tile_bmp_path(LEVEL, 64 + tile_idx, root_dir))
+                       for tile_idx in range(64) ]
+
+    for work_unit in work_units:
+        write_page_tiles(*work_unit)
+    copy_identical_tiles(copies)
+    tile_bmps = read_tile_bmps(root_dir)
+    assert tile_bmps[64:128] == tile_bmps[:64]
+
+def test_identical_levels_are_written_once(root_dir):
+    for sub_dir in ("b_tiles", "b_palettes", "all_tiles"):
+        (root_dir / "copy" / sub_dir).mkdir(parents=True)
+    for path in (root_dir / LEVEL).glob("b_*/*.data"):
+        shutil.copyfile(path, root_dir / "copy" / path.parent.name / path.name.replace(LEVEL, "copy"))
+
+    tile_sources = {}
+    for level in (LEVEL, "copy"):
+        palettes, tile_palettes, remap_tables = create_8bits_palettes(load_level_colours(level, root_dir))
+        work_units, copies, _ = plan_level_build(level, palettes, tile_palettes, remap_tables, "first_fit",
+                                                 root_dir=root_dir, tile_sources=tile_sources)
+        for work_unit in work_units:
+            write_page_tiles(*work_unit)
+        copy_identical_tiles(copies)
+
+    # every tile of the copy comes from the same tile of the first level
+    assert work_units == []
+    assert copies == [ (get_tile_bmp_path(LEVEL, tile_idx, root_dir), get_tile_bmp_path("copy", tile_idx, root_dir))
+                       for tile_idx in range(64*NUM_PAGES) ]
@@ -0,0 +1,86 @@
+import io
+import argparse
+import numpy as np
+import pytest
+from PIL import Image
+from psx_decoder import (unpack_nibbles, apply_page_palettes, upscale, parse_scale,
+                         PAGE_SIZE, PAGE_WIDTH, PAGE_HEIGHT, TILE_WIDTH, TILE_HEIGHT, PAGE_TILES_HEIGHT,
+                         TILES_PER_PAGE, COLOURS_PER_TILE)
+
+
+def random_page(seed=0):
+    rng = np.random.default_rng(seed)
+    data = rng.integers(0, 256, PAGE_SIZE, dtype=np.uint8).tobytes()
+    rgb_colours = [[tuple(int(c) for c in rng.integers(0, 256, 3)) for _ in range(COLOURS_PER_TILE)]
+                   for _ in range(TILES_PER_PAGE)]
+    return data, rgb_colours
+
+def bmp_bytes(image):
+    out = io.BytesIO()
+    image.save(out, format='BMP')
+    return out.getvalue()
+
+def per_pixel_page(data, rgb_colours):
+    """The byte at a time decoding the page extractor used before psx_decoder."""
+    page_bmp = Image.new('RGB', (PAGE_WIDTH, PAGE_HEIGHT))
+    pixels = page_bmp.load()
+    offset = 0
+    for y in range(PAGE_HEIGHT):
+        for x in range(0, PAGE_WIDTH, 2):
+            idx1, idx2 = data[offset] // 16, data[offset] % 16
+            offset += 1
+            tile_idx = x // TILE_WIDTH + PAGE_TILES_HEIGHT*(y // TILE_HEIGHT)
+            pixels[x, y] = rgb_colours[tile_idx][idx2]
+            pixels[x+1, y] = rgb_colours[tile_idx][idx1]
+    return page_bmp
+
+def per_pixel_large_tile(data, rgb_colours, tile_idx):
+    """The byte at a time decoding of a 2x tile the tile creator used before psx_decoder."""
+    tile_bmp = Image.new('RGB', (2*TILE_WIDTH, 2*TILE_HEIGHT))
+    pixels = tile_bmp.load()
+    offset_x = (tile_idx % PAGE_TILES_HEIGHT) * TILE_WIDTH
+    offset_y = (tile_idx // PAGE_TILES_HEIGHT) * TILE_HEIGHT
+    for y in range(offset_y, offset_y + TILE_HEIGHT):
+        for x in range(offset_x, offset_x + TILE_WIDTH, 2):
+            byte = data[(y*PAGE_WIDTH + x) // 2]
+            idx1, idx2 = byte // 16, byte % 16
+            tile_x, tile_y = 2*(x - offset_x), 2*(y - offset_y)
+            for dx, dy in ((0, 0), (1, 0), (0, 1), (1, 1)):
+                pixels[tile_x + dx, tile_y + dy] = rgb_colours[tile_idx][idx2]
+                pixels[tile_x + 2 + dx, tile_y + dy] = rgb_colours[tile_idx][idx1]
+    return tile_bmp
+
+
+def test_unpack_nibbles_low_nibble_first():
+    assert unpack_nibbles(bytes([0x21, 0xF0])).tolist() == [1, 2, 0, 15]
+
+def test_page_matches_per_pixel_decoding():
+    data, rgb_colours = random_page()
+    page_indices = unpack_nibbles(data).reshape(PAGE_HEIGHT, PAGE_WIDTH)
+
+    page_bmp = Image.fromarray(apply_page_palettes(page_indices, rgb_colours), 'RGB')
+    assert bmp_bytes(page_bmp) == bmp_bytes(per_pixel_page(data, rgb_colours))
+
+def test_large_page_matches_per_pixel_tiles():
+    data, rgb_colours = random_page(1)
+    page_indices = unpack_nibbles(data).reshape(PAGE_HEIGHT, PAGE_WIDTH)
+
+    large_page_rgb = apply_page_palettes(page_indices, rgb_colours, scale=2)
+    for tile_idx in (0, 7, 8, 37, 63):
+        y = 2*(tile_idx // PAGE_TILES_HEIGHT)*TILE_HEIGHT
+        x = 2*(tile_idx % PAGE_TILES_HEIGHT)*TILE_WIDTH
+        tile_rgb = large_page_rgb[y : y + 2*TILE_HEIGHT, x : x + 2*TILE_WIDTH]
+        tile_bmp = Image.fromarray(tile_rgb, 'RGB')
+        assert bmp_bytes(tile_bmp) == bmp_bytes(per_pixel_large_tile(data, rgb_colours, tile_idx))
+
+@pytest.mark.parametrize("scale", [1, 2, 3, 8])
+def test_upscale(scale):
+    indices = np.arange(12, dtype=np.uint8).reshape(3, 4)
+    assert np.array_equal(upscale(indices, scale), indices.repeat(scale, axis=0).repeat(scale, axis=1))
+
+def test_parse_scale():
+    assert parse_scale("1") == 1
+    assert parse_scale("5") == 5
+    for value in ("0", "-2", "2.5", "x"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_scale(value)
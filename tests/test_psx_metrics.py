@@ -0,0 +1,87 @@
+import argparse
+import json
+import tracemalloc
+import pytest
+import psx_metrics
+from psx_metrics import stage, take_records, run_with_metrics, run_in_stage, overlapped_stages, summarize
+from psx_jobs import run_overlapped
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    monkeypatch.setattr(psx_metrics, "_records", [])
+    yield
+    monkeypatch.setattr(psx_metrics, "_enabled", False)
+    tracemalloc.stop()
+
+def write_files(tmp_path):
+    with stage("write", "lvl"):
+        (tmp_path / "a.bin").write_bytes(bytes(4096))
+    with stage("write", "lvl"):
+        (tmp_path / "b.bin").write_bytes(bytes(4096))
+    with stage("pack", None):
+        sum(range(1000))
+    return "done"
+
+
+def test_stages_are_not_recorded_by_default(tmp_path, monkeypatch):
+    monkeypatch.setattr(psx_metrics, "_records", [])
+    write_files(tmp_path)
+    assert take_records() == []
+
+def test_report(tmp_path, metrics):
+    args = argparse.Namespace(metrics_out=str(tmp_path / "metrics.json"), profile=str(tmp_path / "run.prof"))
+    assert run_with_metrics(args, "test_tool", write_files, tmp_path) == "done"
+
+    with open(tmp_path / "metrics.json") as file:
+        report = json.load(file)
+    assert set(report) == {"version", "tool", "wall_time", "peak_memory", "stages", "by_stage", "by_level"}
+    assert report["tool"] == "test_tool"
+
+    assert [record["stage"] for record in report["stages"]] == ["write", "write", "pack"]
+    for record in report["stages"]:
+        assert {"stage", "level", "pid", "wall_time", "peak_memory"} <= set(record)
+
+    # stages are summed by name and by level, stages without a level are only in by_stage
+    assert set(report["by_stage"]) == {"write", "pack"}
+    assert set(report["by_level"]) == {"lvl"}
+    write_records = report["stages"][:2]
+    assert report["by_stage"]["write"]["wall_time"] == pytest.approx(sum(record["wall_time"] for record in write_records))
+    if "bytes_written" in write_records[0]:
+        assert report["by_level"]["lvl"]["bytes_written"] >= 2*4096
+
+    assert (tmp_path / "run.prof").exists()
+    assert take_records() == []
+
+def write_page(tmp_path, page):
+    return [ (run_in_stage, ("write", "lvl", (tmp_path / f"{page}.bin").write_bytes, bytes(4096))) ]
+
+def test_overlapped_stages_are_recorded_once(tmp_path, metrics):
+    psx_metrics.enable()
+    units = [ (("read", "lvl", lambda page: page, page), (tmp_path, )) for page in range(4) ]
+    with overlapped_stages("overlapped"):
+        run_overlapped(run_in_stage, lambda page, tmp_path: write_page(tmp_path, page), units, writers=2)
+    records = take_records()
+
+    # the stages inside the overlapped run only record their wall time
+    assert [record["stage"] for record in records].count("write") == 4
+    for record in records[:-1]:
+        assert record["concurrent"]
+        assert set(record) == {"stage", "level", "pid", "wall_time", "concurrent"}
+    overlapped = records[-1]
+    assert overlapped["stage"] == "overlapped" and "concurrent" not in overlapped
+    if "bytes_written" in overlapped:
+        assert overlapped["bytes_written"] >= 4*4096
+
+    # and are summed apart from the wall time
+    by_stage = summarize(records, "stage")
+    assert by_stage["write"]["wall_time"] == 0.0
+    assert by_stage["write"]["concurrent_wall_time"] == pytest.approx(
+        sum(record["wall_time"] for record in records if record["stage"] == "write"))
+    assert summarize(records, "level")["lvl"]["wall_time"] == 0.0
+    assert by_stage["overlapped"]["wall_time"] == overlapped["wall_time"]
+
+    # stages after the overlapped run are recorded in full again
+    with stage("pack"):
+        pass
+    assert "concurrent" not in take_records()[0]
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from psx_palette_packer import create_8bits_palettes, get_packing_stats, NUM_COLOURS_PER_PALETTE, COLOURS_PER_TILE, PAD_COLOUR
+
+
+def random_level_colours(num_tiles=384, num_colours=600, seed=0):
+    # tiles drawing from a shared set of colours, as in a level
+    rng = np.random.default_rng(seed)
+    colours = [tuple(int(c) for c in rng.integers(0, 256, 3)) for _ in range(num_colours)]
+    return [[colours[i] for i in rng.integers(0, num_colours, COLOURS_PER_TILE)] for _ in range(num_tiles)]
+
+def check_packing(all_level_colours, palettes, tile_palettes, remap_tables):
+    assert len(tile_palettes) == len(all_level_colours)
+    assert all(len(palette) == NUM_COLOURS_PER_PALETTE for palette in palettes)
+    assert set(tile_palettes) == set(range(len(palettes)))
+    for rgb_array, palette_idx, remap_table in zip(all_level_colours, tile_palettes, remap_tables):
+        assert [palettes[palette_idx][slot] for slot in remap_table] == rgb_array
+
+
+@pytest.mark.parametrize("packing", ["first_fit", "grouped"])
+def test_every_tile_keeps_its_colours(packing):
+    all_level_colours = random_level_colours()
+    check_packing(all_level_colours, *create_8bits_palettes(all_level_colours, packing))
+
+def original_first_fit(all_level_colours):
+    """Palettes and palette of each tile, as the list based packer of psx_create_tiles.py made them."""
+    palettes = [[]]
+    tile_palettes = []
+    for rgb_array in all_level_colours:
+        # every colour not in the palette counts, repeated ones too
+        num_colours = len(palettes[-1]) + sum(1 for colour in rgb_array if colour not in palettes[-1])
+        if num_colours > NUM_COLOURS_PER_PALETTE:
+            palettes.append([])
+        for colour in rgb_array:
+            if colour not in palettes[-1]:
+                palettes[-1].append(colour)
+        tile_palettes.append(len(palettes) - 1)
+    return ( [palette + [PAD_COLOUR] * (NUM_COLOURS_PER_PALETTE - len(palette)) for palette in palettes], tile_palettes )
+
+def test_first_fit_palettes_are_contiguous_ranges():
+    _, tile_palettes, _ = create_8bits_palettes(random_level_colours(), "first_fit")
+    assert tile_palettes == sorted(tile_palettes)
+
+def test_first_fit_matches_original_packer():
+    # tiles repeating their colours, so a palette can be full for the original count but not for distinct colours
+    rng = np.random.default_rng(2)
+    tile_colours = [ [tuple(int(c) for c in rng.integers(0, 256, 3)) for _ in range(8)] for _ in range(384) ]
+    all_level_colours = [ [colours[i] for i in rng.integers(0, 8, COLOURS_PER_TILE)] for colours in tile_colours ]
+
+    palettes, tile_palettes, _ = create_8bits_palettes(all_level_colours, "first_fit")
+    assert ( palettes, tile_palettes ) == original_first_fit(all_level_colours)
+
+    # the distinct colours of the tiles would fit more tiles in the first palette
+    first_palette_tiles = tile_palettes.count(0)
+    first_colours = {colour for rgb_array in all_level_colours[:first_palette_tiles + 1] for colour in rgb_array}
+    assert len(first_colours) <= NUM_COLOURS_PER_PALETTE
+
+def test_grouped_needs_no_more_palettes():
+    all_level_colours = random_level_colours(seed=1)
+    first_fit = get_packing_stats(all_level_colours, create_8bits_palettes(all_level_colours, "first_fit")[1])
+    grouped = get_packing_stats(all_level_colours, create_8bits_palettes(all_level_colours, "grouped")[1])
+    assert grouped["num_palettes"] <= first_fit["num_palettes"]
+    assert grouped["used_slots"] <= first_fit["used_slots"]
+
+def test_unknown_packing():
+    with pytest.raises(ValueError):
+        create_8bits_palettes(random_level_colours(num_tiles=4), "other")
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+from psx_palette_plan import build_palette_plan, parse_palette_plan, write_palette_plan, read_palette_plan
+
+
+def make_plan(num_tiles=12, num_palettes=3, seed=0):
+    rng = np.random.default_rng(seed)
+    palettes = [ [tuple(colour) for colour in palette]
+                 for palette in rng.integers(0, 256, (num_palettes, 256, 3)).tolist() ]
+    tile_palettes = rng.integers(0, num_palettes, num_tiles).tolist()
+    remap_tables = rng.integers(0, 256, (num_tiles, 16), dtype=np.uint8)
+    source_hashes = [ f"{page:040x}" for page in range(6) ]
+    return ( "grouped", palettes, tile_palettes, remap_tables, source_hashes )
+
+def test_round_trip():
+    packing, palettes, tile_palettes, remap_tables, source_hashes = make_plan()
+    plan = parse_palette_plan(build_palette_plan(packing, palettes, tile_palettes, remap_tables, source_hashes))
+
+    assert plan[0] == packing
+    assert plan[1] == palettes
+    assert plan[2] == tile_palettes
+    assert np.array_equal(plan[3], remap_tables)
+    assert plan[4] == source_hashes
+
+def test_rejects_bad_files():
+    data = build_palette_plan(*make_plan())
+    with pytest.raises(ValueError):
+        parse_palette_plan(data[:-1])
+    with pytest.raises(ValueError):
+        parse_palette_plan(b"XXXX" + data[4:])
+    with pytest.raises(ValueError):
+        parse_palette_plan(data[:10])
+
+def test_one_plan_per_tile_source(tmp_path):
+    (tmp_path / "bil" / "all_tiles").mkdir(parents=True)
+    bmp_plan = make_plan(seed=1)
+    atlas_plan = make_plan(seed=2)
+    write_palette_plan("bil", *bmp_plan, root_dir=tmp_path)
+    write_palette_plan("bil", *atlas_plan, root_dir=tmp_path, tile_source="atlas")
+
+    assert read_palette_plan("bil", tmp_path)[2] == bmp_plan[2]
+    assert read_palette_plan("bil", tmp_path, "atlas")[2] == atlas_plan[2]
+    with pytest.raises(OSError):
+        read_palette_plan("bil", tmp_path, "raw")
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from psx_palettes import get_colour_lut, load_rgb_palettes, palettes_to_tuples, COLOURS_PER_TILE
+
+
+def pull_colours(word):
+    """The per-colour conversion the tools used before the lookup table."""
+    if (word >= 32768):
+        word -= 32768
+    r = (word % 32)*255 // 32
+    word = word >> 5
+    g = (word % 32)*255 // 32
+    word = word >> 5
+    b = (word*255) // 32
+    return (r, g, b)
+
+
+def test_legacy_lut_matches_per_colour_conversion():
+    lut = get_colour_lut("legacy")
+    assert [tuple(colour) for colour in lut.tolist()] == [pull_colours(word) for word in range(32768)]
+
+def test_exact_lut_covers_the_whole_range():
+    lut = get_colour_lut("exact")
+    assert lut[0].tolist() == [0, 0, 0]
+    assert lut[0x7FFF].tolist() == [255, 255, 255]
+    assert lut[0x001F].tolist() == [255, 0, 0]
+    assert lut[0x7C00].tolist() == [0, 0, 255]
+
+def test_unknown_expansion():
+    with pytest.raises(ValueError):
+        get_colour_lut("other")
+
+def test_load_rgb_palettes(tmp_path):
+    words = np.random.default_rng(0).integers(0, 65536, (64, COLOURS_PER_TILE), dtype=np.uint16)
+    b_pal_path = tmp_path / "lvl_1_palettes.data"
+    b_pal_path.write_bytes(words.astype('<u2').tobytes() + b"\x01")   # an incomplete palette is ignored
+
+    rgb_palettes = load_rgb_palettes(b_pal_path)
+    assert rgb_palettes.shape == (64, COLOURS_PER_TILE, 3)
+    assert palettes_to_tuples(rgb_palettes) == [[pull_colours(int(word)) for word in tile_words] for tile_words in words]
@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+from psx_raw_tiles import build_raw_tiles, parse_raw_tiles
+from sty_file import layout_tile_data
+
+
+def test_round_trip():
+    tiles = np.random.default_rng(0).integers(0, 256, (10, 64, 64), dtype=np.uint8)
+    tile_palettes = list(range(10))
+
+    tile_size, read_tile_palettes, tile_data = parse_raw_tiles(build_raw_tiles(tiles, tile_palettes))
+    assert tile_size == 64
+    assert read_tile_palettes == tile_palettes
+    assert tile_data == layout_tile_data(tiles)
+
+def test_rejects_bad_files():
+    data = build_raw_tiles(np.zeros((4, 64, 64), dtype=np.uint8), [0, 1, 1, 0])
+    with pytest.raises(ValueError):
+        parse_raw_tiles(data[:-1])
+    with pytest.raises(ValueError):
+        parse_raw_tiles(b"XXXX" + data[4:])
+    with pytest.raises(ValueError):
+        parse_raw_tiles(data[:5])
@@ -0,0 +1,97 @@
+import pickle
+import random
+import numpy as np
+import pytest
+from psx_benchmark import write_synthetic_level
+from psx_decoder import read_page_indices
+from psx_palettes import load_rgb_palettes
+from psx_tiles import get_page_paths
+from psx_create_tiles import (load_level_colours, create_level_tiles, get_level_inputs, plan_level_build, write_page_tiles,
+                              copy_identical_tiles, save_level_manifest)
+from psx_palette_packer import create_8bits_palettes
+from psx_palette_plan import get_palette_source_hashes, write_palette_plan
+from psx_sty_injector import get_level_palettes
+from psx_sty_reader import locate_level, write_layouts, get_psx_sty_path, open_psx_sty, NUM_PAGES
+
+LEVEL = "bench"
+
+
+@pytest.fixture
+def psx_level(tmp_path):
+    """(root dir, psx dir, layout path) of a synthetic level, its .data files packed with other data
+    into an original .STY file, which is located."""
+    write_synthetic_level(tmp_path, LEVEL)
+
+    rng = random.Random(1)
+    sty_data = bytearray(rng.randbytes(1000))
+    for page in range(NUM_PAGES):
+        for binary_path in get_page_paths(LEVEL, page, tmp_path):
+            sty_data += binary_path.read_bytes() + rng.randbytes(rng.randrange(1, 300))
+
+    psx_dir = tmp_path / "psx"
+    psx_dir.mkdir()
+    get_psx_sty_path(LEVEL, psx_dir).write_bytes(sty_data)
+
+    layout_path = tmp_path / "layout.json"
+    write_layouts({LEVEL: locate_level(LEVEL, psx_dir, tmp_path)}, layout_path)
+    return ( tmp_path, psx_dir, layout_path )
+
+
+def test_pages_match_data_files(psx_level):
+    root_dir, psx_dir, layout_path = psx_level
+    with open_psx_sty(LEVEL, psx_dir, layout_path) as psx_sty:
+        for page in range(NUM_PAGES):
+            b_tile_path, b_pal_path = get_page_paths(LEVEL, page, root_dir)
+            assert np.array_equal(psx_sty.read_page_indices(page), read_page_indices(b_tile_path))
+            assert np.array_equal(psx_sty.load_rgb_palettes(page), load_rgb_palettes(b_pal_path))
+            assert psx_sty.read_palette_data(page) == b_pal_path.read_bytes()
+
+        # each process of a pool maps the file again
+        with pickle.loads(pickle.dumps(psx_sty)) as psx_sty_copy:
+            assert np.array_equal(psx_sty_copy.read_page_indices(5), psx_sty.read_page_indices(5))
+
+def test_level_tiles_match_data_files(psx_level):
+    root_dir, psx_dir, layout_path = psx_level
+    all_level_colours = load_level_colours(LEVEL, root_dir)
+    _, _, remap_tables = create_8bits_palettes(all_level_colours)
+
+    with open_psx_sty(LEVEL, psx_dir, layout_path) as psx_sty:
+        assert load_level_colours(LEVEL, root_dir, psx_sty) == all_level_colours
+        assert np.array_equal(create_level_tiles(LEVEL, remap_tables, root_dir=root_dir, psx_sty=psx_sty),
+                              create_level_tiles(LEVEL, remap_tables, root_dir=root_dir))
+        # same hashes as the .data files, so either source skips the tiles the other wrote
+        assert get_level_inputs(LEVEL, root_dir, psx_sty) == get_level_inputs(LEVEL, root_dir)
+
+def test_create_and_inject_from_sty_file(psx_level):
+    root_dir, psx_dir, layout_path = psx_level
+    palettes, tile_palettes, remap_tables = create_8bits_palettes(load_level_colours(LEVEL, root_dir))
+
+    with open_psx_sty(LEVEL, psx_dir, layout_path) as psx_sty:
+        work_units, copies, new_manifest = plan_level_build(LEVEL, palettes, tile_palettes, remap_tables, "first_fit",
+                                                            root_dir=root_dir, psx_sty=psx_sty)
+        for work_unit in work_units:
+            write_page_tiles(*work_unit)
+        copy_identical_tiles(copies)
+        save_level_manifest(*new_manifest)
+        write_palette_plan(LEVEL, "first_fit", palettes, tile_palettes, remap_tables,
+                           get_palette_source_hashes(LEVEL, root_dir, psx_sty), root_dir)
+
+        assert get_level_palettes(LEVEL, root_dir=root_dir, psx_sty=psx_sty) == ( palettes, tile_palettes )
+
+    # a build from the .data files finds the same tiles, and the injector the same palette files
+    assert plan_level_build(LEVEL, palettes, tile_palettes, remap_tables, "first_fit", root_dir=root_dir)[0] == []
+    assert get_level_palettes(LEVEL, root_dir=root_dir) == ( palettes, tile_palettes )
+
+def test_missing_data(psx_level):
+    root_dir, psx_dir, layout_path = psx_level
+    b_tile_path = get_page_paths(LEVEL, 3, root_dir)[0]
+    b_tile_path.write_bytes(bytes(len(b_tile_path.read_bytes())))
+    with pytest.raises(ValueError):
+        locate_level(LEVEL, psx_dir, root_dir)
+
+def test_other_sty_file(psx_level):
+    root_dir, psx_dir, layout_path = psx_level
+    sty_path = get_psx_sty_path(LEVEL, psx_dir)
+    sty_path.write_bytes(sty_path.read_bytes() + b"\0")
+    with pytest.raises(SystemExit):
+        open_psx_sty(LEVEL, psx_dir, layout_path)
@@ -0,0 +1,55 @@
+import numpy as np
+from psx_benchmark import write_synthetic_level
+from psx_tile_index import get_level_tile_keys, get_duplicate_map, get_duplicate_report
+from psx_create_tiles import load_level_colours
+from psx_palette_packer import create_8bits_palettes
+from psx_tiles import get_page_paths
+
+LEVEL = "bench"
+
+
+def write_level_with_duplicates(root_dir):
+    """Synthetic level whose page 2 repeats page 1, with tile 200 made of a single colour."""
+    write_synthetic_level(root_dir, LEVEL)
+    for path_1, path_2 in zip(get_page_paths(LEVEL, 0, root_dir), get_page_paths(LEVEL, 1, root_dir)):
+        path_2.write_bytes(path_1.read_bytes())
+
+    b_pal_path = get_page_paths(LEVEL, 3, root_dir)[1]
+    words = np.frombuffer(b_pal_path.read_bytes(), dtype='<u2').copy()
+    words[8*16 : 9*16] = 0x8000 | words[8*16]      # the semi-transparency bit doesn't change the colour
+    b_pal_path.write_bytes(words.tobytes())
+
+
+def test_duplicate_map(tmp_path):
+    write_level_with_duplicates(tmp_path)
+    keys, blank_tiles = get_level_tile_keys(LEVEL, tmp_path)
+    duplicate_of = get_duplicate_map(keys)
+
+    assert blank_tiles == [200]
+    assert duplicate_of[64:128] == list(range(64))
+    assert duplicate_of[:64] == list(range(64))
+    assert duplicate_of[128:] == list(range(128, 384))
+
+def test_duplicates_share_palette_slots(tmp_path):
+    write_level_with_duplicates(tmp_path)
+    duplicate_of = get_duplicate_map(get_level_tile_keys(LEVEL, tmp_path)[0])
+    all_level_colours = load_level_colours(LEVEL, tmp_path)
+
+    for packing in ("first_fit", "grouped"):
+        palettes, tile_palettes, remap_tables = create_8bits_palettes(all_level_colours, packing, duplicate_of)
+        for tile_idx, first_tile in enumerate(duplicate_of):
+            assert tile_palettes[tile_idx] == tile_palettes[first_tile]
+            assert np.array_equal(remap_tables[tile_idx], remap_tables[first_tile])
+            assert [palettes[tile_palettes[tile_idx]][slot] for slot in remap_tables[tile_idx]] == all_level_colours[tile_idx]
+
+def test_cross_level_report(tmp_path):
+    write_level_with_duplicates(tmp_path)
+    write_synthetic_level(tmp_path, "other", seed=1)
+    for path_1, path_2 in zip(get_page_paths(LEVEL, 5, tmp_path), get_page_paths("other", 5, tmp_path)):
+        path_2.write_bytes(path_1.read_bytes())
+
+    report = get_duplicate_report([LEVEL, "other"], tmp_path)
+    assert report["levels"][LEVEL]["unique_tiles"] == 384 - 64
+    assert report["levels"][LEVEL]["duplicates"][0] == [64]
+    assert sorted(tiles[1] for tiles in report["cross_level"]) == [("other", tile_idx) for tile_idx in range(320, 384)]
+    assert report["unique_tiles"] == 2*384 - 64 - 64
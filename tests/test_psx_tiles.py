@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from psx_benchmark import write_synthetic_level
+from psx_decoder import read_page_indices, apply_page_palettes, TILE_WIDTH, TILE_HEIGHT, PAGE_TILES_HEIGHT
+from psx_palettes import load_rgb_palettes
+from psx_tiles import iter_tiles, apply_tile_palette, get_page_paths, NUM_PAGES
+
+LEVEL = "bench"
+
+
+def test_tiles_match_their_pages(tmp_path):
+    write_synthetic_level(tmp_path, LEVEL)
+
+    tiles = list(iter_tiles(LEVEL, tmp_path, pages=[0, 4]))
+    assert [tile.index for tile in tiles] == list(range(64)) + list(range(256, 320))
+
+    page_rgbs = {}
+    for tile in tiles:
+        if tile.page not in page_rgbs:
+            b_tile_path, b_pal_path = get_page_paths(LEVEL, tile.page, tmp_path)
+            page_rgbs[tile.page] = apply_page_palettes(read_page_indices(b_tile_path), load_rgb_palettes(b_pal_path))
+
+        y = (tile.index % 64 // PAGE_TILES_HEIGHT)*TILE_HEIGHT
+        x = (tile.index % PAGE_TILES_HEIGHT)*TILE_WIDTH
+        tile_rgb = apply_tile_palette(tile.indices, tile.palette)
+        assert tile_rgb.shape == (TILE_HEIGHT, TILE_WIDTH, 3)
+        assert np.array_equal(tile_rgb, page_rgbs[tile.page][y : y + TILE_HEIGHT, x : x + TILE_WIDTH])
+
+def test_missing_page(tmp_path):
+    write_synthetic_level(tmp_path, LEVEL)
+    get_page_paths(LEVEL, NUM_PAGES - 1, tmp_path)[1].unlink()
+
+    tiles = iter_tiles(LEVEL, tmp_path)
+    assert sum(1 for _, _ in zip(range(64*(NUM_PAGES - 1)), tiles)) == 64*(NUM_PAGES - 1)
+    with pytest.raises(FileNotFoundError):
+        next(tiles)
@@ -0,0 +1,43 @@
+import os
+from psx_benchmark import write_synthetic_level
+from psx_palette_packer import create_8bits_palettes
+from psx_create_tiles import load_level_colours, create_level_tiles, get_tile_bmp_path
+from psx_tiles import get_page_paths
+from psx_watch import WarmLevel
+
+LEVEL = "bench"
+
+
+def touch(path, data):
+    stat = path.stat()
+    path.write_bytes(data)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))     # the same size, a later time
+
+def test_incremental_update(tmp_path):
+    write_synthetic_level(tmp_path, LEVEL)
+    warm_level = WarmLevel(LEVEL, root_dir=tmp_path)
+    assert warm_level.load() == 384
+    assert WarmLevel(LEVEL, root_dir=tmp_path).load() == 0      # the manifest of the first build is used
+    assert warm_level.update() is None
+
+    b_tile_path = get_page_paths(LEVEL, 2, tmp_path)[0]
+    data = bytearray(b_tile_path.read_bytes())
+    data[0] ^= 0xFF     # first pixels of tile 0 of the page
+    touch(b_tile_path, data)
+    bmp_before = get_tile_bmp_path(LEVEL, 129, tmp_path).read_bytes()
+
+    assert warm_level.update() == 1
+    assert get_tile_bmp_path(LEVEL, 129, tmp_path).read_bytes() == bmp_before
+
+    # same tiles as a build from scratch
+    _, _, remap_tables = create_8bits_palettes(load_level_colours(LEVEL, tmp_path))
+    assert (warm_level.get_tiles() == create_level_tiles(LEVEL, remap_tables, root_dir=tmp_path)).all()
+
+def test_unchanged_content_is_not_built(tmp_path):
+    write_synthetic_level(tmp_path, LEVEL)
+    warm_level = WarmLevel(LEVEL, root_dir=tmp_path)
+    warm_level.load()
+
+    b_pal_path = get_page_paths(LEVEL, 0, tmp_path)[1]
+    touch(b_pal_path, b_pal_path.read_bytes())
+    assert warm_level.update() is None
@@ -0,0 +1,118 @@
+import io
+import struct
+import numpy as np
+import pytest
+from sty_file import (read_chunk_table, get_chunk_infos, write_sty_file, build_palx_data, build_ppal_data,
+                      build_tile_data, layout_tile_data, build_grown_chunk_data, parse_palb_data, build_palb_data,
+                      grow_tile_palettes,
+                      PALETTE_SIZE, PALETTES_PER_PAGE, PALETTE_PAGE_SIZE, TILE_SIZE, TILE_GROUP_SIZE)
+
+
+def build_sty(chunks):
+    return b"GBST" + struct.pack('<H', 700) + b"".join(name.encode('ascii') + struct.pack('<I', len(data)) + data
+                                                      for name, data in chunks)
+
+def random_tiles(num_tiles, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (num_tiles, TILE_SIZE, TILE_SIZE), dtype=np.uint8)
+
+
+def test_read_chunk_table():
+    data = build_sty([("PALX", bytes(8)), ("ABCD", b"xyz"), ("TILE", bytes(16))])
+    chunk_table = read_chunk_table(data)
+
+    assert [(chunk.name, chunk.size) for chunk in chunk_table] == [("PALX", 8), ("ABCD", 3), ("TILE", 16)]
+    for chunk in chunk_table:
+        assert data[chunk.offset - 8 : chunk.offset - 4].decode('ascii') == chunk.name
+    assert get_chunk_infos(chunk_table)["PPAL"] == [None, None]
+
+def test_read_chunk_table_truncated():
+    with pytest.raises(ValueError):
+        read_chunk_table(build_sty([("TILE", bytes(16))])[:-1])
+    with pytest.raises(ValueError):
+        read_chunk_table(b"GBSX" + bytes(2))
+
+def test_write_sty_file_round_trip():
+    data = build_sty([("PALX", bytes(8)), ("SPRG", b"sprites"), ("TILE", bytes(16))])
+    out_file = io.BytesIO()
+    write_sty_file(data, read_chunk_table(data), {"TILE": b"new tiles, longer"}, out_file)
+
+    new_data = out_file.getvalue()
+    assert new_data == build_sty([("PALX", bytes(8)), ("SPRG", b"sprites"), ("TILE", b"new tiles, longer")])
+    assert [chunk.name for chunk in read_chunk_table(new_data)] == ["PALX", "SPRG", "TILE"]
+
+def test_build_palx_data():
+    assert build_palx_data([0, 1, 258]) == bytes([0, 0, 1, 0, 2, 1])
+
+def test_build_ppal_data():
+    rng = np.random.default_rng(1)
+    palettes = rng.integers(0, 256, (PALETTES_PER_PAGE + 3, PALETTE_SIZE, 3), dtype=np.uint8)
+    current_data = rng.integers(0, 256, 3*PALETTE_PAGE_SIZE, dtype=np.uint8).tobytes()
+
+    new_data = build_ppal_data(current_data, palettes.tolist())
+    assert len(new_data) == 2*PALETTE_PAGE_SIZE
+
+    # [page, colour, palette, BGRA] back to [palette, colour, RGB]
+    pages = np.frombuffer(new_data, dtype=np.uint8).reshape(2, PALETTE_SIZE, PALETTES_PER_PAGE, 4)
+    read_palettes = pages.transpose(0, 2, 1, 3).reshape(-1, PALETTE_SIZE, 4)
+    assert np.array_equal(read_palettes[:len(palettes), :, 2::-1], palettes)
+    assert not read_palettes[:len(palettes), :, 3].any()
+
+    # the palettes after the new ones are kept
+    current_pages = np.frombuffer(current_data, dtype=np.uint8).reshape(3, PALETTE_SIZE, PALETTES_PER_PAGE, 4)
+    assert np.array_equal(pages[1, :, 3:], current_pages[1, :, 3:])
+
+def test_build_ppal_data_too_small():
+    with pytest.raises(ValueError):
+        build_ppal_data(bytes(PALETTE_PAGE_SIZE), [[(0, 0, 0)]*PALETTE_SIZE]*(PALETTES_PER_PAGE + 1))
+
+def test_build_tile_data():
+    tiles = random_tiles(10)
+    new_data = build_tile_data(bytes(4*TILE_GROUP_SIZE), tiles)
+    assert len(new_data) == 3*TILE_GROUP_SIZE
+
+    # tile n is at column n % 4 of group n // 4, each row 256 bytes
+    groups = np.frombuffer(new_data, dtype=np.uint8).reshape(-1, TILE_SIZE, 4, TILE_SIZE)
+    for tile_idx, tile in enumerate(tiles):
+        assert np.array_equal(groups[tile_idx // 4, :, tile_idx % 4], tile)
+
+def test_layout_tile_data_matches_build_tile_data():
+    tiles = random_tiles(10)
+    assert layout_tile_data(tiles) == build_tile_data(bytes(3*TILE_GROUP_SIZE), tiles)
+
+def test_build_tile_data_keeps_other_tiles():
+    current_data = random_tiles(8, seed=2).tobytes()
+    new_data = build_tile_data(current_data, random_tiles(6))
+
+    current_groups = np.frombuffer(current_data, dtype=np.uint8).reshape(-1, TILE_SIZE, 4, TILE_SIZE)
+    groups = np.frombuffer(new_data, dtype=np.uint8).reshape(-1, TILE_SIZE, 4, TILE_SIZE)
+    assert np.array_equal(groups[1, :, 2:], current_groups[1, :, 2:])
+
+def test_build_tile_data_too_small():
+    with pytest.raises(ValueError):
+        build_tile_data(bytes(TILE_GROUP_SIZE), random_tiles(5))
+
+def test_build_grown_chunk_data():
+    tiles = random_tiles(20)
+    new_data = build_grown_chunk_data(bytes(TILE_GROUP_SIZE), 5*TILE_GROUP_SIZE, 4*TILE_GROUP_SIZE, build_tile_data, tiles)
+
+    assert len(new_data) == 8*TILE_GROUP_SIZE     # grown by whole pages
+    assert new_data[:5*TILE_GROUP_SIZE] == layout_tile_data(tiles)
+    assert not any(new_data[5*TILE_GROUP_SIZE:])
+
+def test_grow_tile_palettes():
+    palx_words = np.arange(64, dtype='<u2')
+    palette_counts = [10, 5, 3, 0, 0, 0, 2, 0]
+    palb_data = build_palb_data(palette_counts)
+    assert parse_palb_data(palb_data) == palette_counts
+
+    palx_data, new_counts = grow_tile_palettes(palx_words.tobytes(), palette_counts, 16)
+    new_words = np.frombuffer(palx_data, dtype='<u2')
+
+    assert len(palx_data) == len(palx_words)*2
+    assert new_counts == [16, 5, 3, 0, 0, 0, 2, 0]
+    assert np.array_equal(new_words[16:26], palx_words[10:20])     # sprites and remaps moved after the tiles
+    assert np.array_equal(new_words[26:], palx_words[26:])
+
+    assert grow_tile_palettes(palx_words.tobytes(), palette_counts, 10)[1] == palette_counts
+    with pytest.raises(ValueError):
+        grow_tile_palettes(palx_words.tobytes(), palette_counts, 60)